@@ -0,0 +1,260 @@
+import time
+from threading import Lock
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional
+
+from .looper import TimedLooper
+from .scheduler import Scheduler
+from .sensor import _FPS, _WIDTH, _HEIGHT, _ENCODER_WORKERS
+
+_ADMISSION_RATE = 1.0  # 1 Hz
+_HEADROOM = 0.2  # fraction of each capacity kept spare, so a busy moment doesn't push existing sessions under their targets
+_MAX_DROP_RATE = 0.05  # if existing sessions are already dropping more frames than this, nobody else gets in
+_SMOOTHING = 0.3  # weight of each new measurement against the running estimate
+_UPLINK_BYTES_PER_SECOND = 12500000.0  # ~100 Mbit/s
+_RPCS_PER_SECOND = 2000.0  # what one Carla connection comfortably sustains
+
+
+class Quality(NamedTuple):
+    fps: int
+    width: int
+    height: int
+
+    @property
+    def pixels_per_second(self) -> int:
+        return self.fps * self.width * self.height
+
+
+class HostCapacity(NamedTuple):
+    encode_seconds_per_second: float = float(_ENCODER_WORKERS)  # one per encoder worker (a core each)
+    bytes_per_second: float = _UPLINK_BYTES_PER_SECOND
+    rpcs_per_second: float = _RPCS_PER_SECOND
+
+
+class SessionCost(NamedTuple):
+    encode_seconds_per_second: float
+    bytes_per_second: float
+    rpcs_per_second: float
+    drop_rate: float  # fraction of frames that weren't sent
+
+
+class SessionSample(NamedTuple):  # running totals for one session, as of now
+    encode_seconds: float
+    frames: int
+    frame_bytes: int
+    frames_dropped: int
+
+
+class AdmissionDecision(NamedTuple):
+    admit: bool
+    quality: Optional[Quality]  # what to create the new session's sensor with, if admitted
+    reason: str
+
+
+class AdmissionStats(NamedTuple):
+    sessions: int
+    load: SessionCost  # all sessions together
+    capacity: HostCapacity
+    admitted: int
+    downgraded: int  # admitted, but below the first quality
+    rejected: int
+
+
+_QUALITY = Quality(fps=_FPS, width=_WIDTH, height=_HEIGHT)
+
+# assumed for full quality until a session has been measured; 640x360 WebP is ~10 ms and ~20 KB a frame
+_DEFAULT_COST = SessionCost(
+    encode_seconds_per_second=0.01 * _FPS,
+    bytes_per_second=20000.0 * _FPS,
+    rpcs_per_second=10.0,
+    drop_rate=0.0,
+)
+
+
+def get_qualities(quality: Quality) -> List[Quality]:
+    # full, then half the frame rate, then half the frame rate at half the resolution
+    return [
+        quality,
+        Quality(fps=max(1, quality.fps // 2), width=quality.width, height=quality.height),
+        Quality(fps=max(1, quality.fps // 2), width=max(1, quality.width // 2), height=max(1, quality.height // 2)),
+    ]
+
+
+class _Session(object):
+    def __init__(self, quality: Quality):
+        self.quality: Quality = quality
+        self.cost: Optional[SessionCost] = None  # until there's been a second sample to compare against
+        self.sample: Optional[SessionSample] = None
+        self.sampled: float = 0.0
+
+
+class AdmissionController(TimedLooper):
+    def __init__(self,
+            get_samples: Callable[[], Dict[Hashable, SessionSample]],
+            get_rpcs: Optional[Callable[[], int]] = None,
+            capacity: Optional[HostCapacity] = None,
+            qualities: Optional[List[Quality]] = None,
+            headroom: float = _HEADROOM,
+            max_drop_rate: float = _MAX_DROP_RATE,
+            default_cost: SessionCost = _DEFAULT_COST,
+            smoothing: float = _SMOOTHING,
+            rate: float = _ADMISSION_RATE,
+            clock: Callable[[], float] = time.monotonic,
+            scheduler: Optional[Scheduler] = None):
+        super().__init__(
+            period=rate,
+            scheduler=scheduler
+        )
+
+        self._get_samples: Callable[[], Dict[Hashable, SessionSample]] = get_samples
+        self._get_rpcs: Optional[Callable[[], int]] = get_rpcs  # running total over the shared Carla connection
+        self._capacity: HostCapacity = capacity if capacity is not None else HostCapacity()
+        self._qualities: List[Quality] = qualities if qualities is not None else get_qualities(_QUALITY)  # best first
+        self._headroom: float = headroom
+        self._max_drop_rate: float = max_drop_rate
+        self._default_cost: SessionCost = default_cost  # at the first quality
+        self._smoothing: float = smoothing
+        self._clock: Callable[[], float] = clock
+
+        self._lock: Lock = Lock()
+        self._sessions: Dict[Hashable, _Session] = {}
+        self._rpcs: Optional[int] = None
+        self._rpcs_sampled: float = 0.0
+        self._admitted: int = 0
+        self._downgraded: int = 0
+        self._rejected: int = 0
+
+    def remove(self, key: Hashable):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def update(self, samples: Dict[Hashable, SessionSample], rpcs: Optional[int] = None):
+        now = self._clock()
+
+        with self._lock:
+            # every session shares one Carla connection, so each is charged an equal share of its calls
+            rpcs_per_session = 0.0
+            if rpcs is not None:
+                if self._rpcs is not None and now > self._rpcs_sampled and len(self._sessions) > 0:
+                    rpcs_per_session = (rpcs - self._rpcs) / (now - self._rpcs_sampled) / len(self._sessions)
+
+                self._rpcs, self._rpcs_sampled = rpcs, now
+
+            for key, sample in samples.items():
+                session = self._sessions.get(key)
+                if session is None:
+                    continue
+
+                previous, elapsed = session.sample, now - session.sampled
+                session.sample, session.sampled = sample, now
+                if previous is None or elapsed <= 0:
+                    continue
+
+                frames = (sample.frames - previous.frames) + (sample.frames_dropped - previous.frames_dropped)
+                cost = SessionCost(
+                    encode_seconds_per_second=(sample.encode_seconds - previous.encode_seconds) / elapsed,
+                    bytes_per_second=(sample.frame_bytes - previous.frame_bytes) / elapsed,
+                    rpcs_per_second=rpcs_per_session,
+                    drop_rate=(sample.frames_dropped - previous.frames_dropped) / frames if frames > 0 else 0.0,
+                )
+
+                if session.cost is None:
+                    session.cost = cost
+                else:
+                    session.cost = SessionCost(*[
+                        x + (self._smoothing * (y - x)) for x, y in zip(session.cost, cost)
+                    ])
+
+    @staticmethod
+    def _is_measured(session: _Session) -> bool:
+        # a paused (or not yet streaming) session says nothing about what one costs, and will cost that again when it resumes
+        return session.cost is not None and session.cost.bytes_per_second > 0 and session.quality.pixels_per_second > 0
+
+    def _estimate(self, quality: Quality) -> SessionCost:
+        # encoding and bytes go with pixels per second; Carla RPCs (controls, telemetry) don't depend on the picture
+        measured = [x for x in self._sessions.values() if self._is_measured(x)]
+        if len(measured) == 0:
+            reference, scale = self._default_cost, quality.pixels_per_second / self._qualities[0].pixels_per_second
+        else:
+            reference = SessionCost(
+                encode_seconds_per_second=sum(
+                    x.cost.encode_seconds_per_second / x.quality.pixels_per_second for x in measured
+                ) / len(measured),
+                bytes_per_second=sum(x.cost.bytes_per_second / x.quality.pixels_per_second for x in measured) / len(measured),
+                rpcs_per_second=sum(x.cost.rpcs_per_second for x in measured) / len(measured),
+                drop_rate=0.0,
+            )
+            scale = quality.pixels_per_second
+
+        return SessionCost(
+            encode_seconds_per_second=reference.encode_seconds_per_second * scale,
+            bytes_per_second=reference.bytes_per_second * scale,
+            rpcs_per_second=reference.rpcs_per_second,
+            drop_rate=0.0,
+        )
+
+    def _get_load(self) -> SessionCost:
+        costs = [x.cost if self._is_measured(x) else self._estimate(x.quality) for x in self._sessions.values()]
+
+        return SessionCost(
+            encode_seconds_per_second=sum(x.encode_seconds_per_second for x in costs),
+            bytes_per_second=sum(x.bytes_per_second for x in costs),
+            rpcs_per_second=sum(x.rpcs_per_second for x in costs),
+            drop_rate=max((x.drop_rate for x in costs), default=0.0),
+        )
+
+    def admit(self, key: Hashable) -> AdmissionDecision:  # and, if admitted, count it from now on
+        with self._lock:
+            load = self._get_load()
+
+            if load.drop_rate > self._max_drop_rate:
+                self._rejected += 1
+                return AdmissionDecision(False, None, 'existing sessions are dropping {:.0%} of frames'.format(load.drop_rate))
+
+            available = SessionCost(
+                encode_seconds_per_second=(self._capacity.encode_seconds_per_second * (1.0 - self._headroom)) -
+                                          load.encode_seconds_per_second,
+                bytes_per_second=(self._capacity.bytes_per_second * (1.0 - self._headroom)) - load.bytes_per_second,
+                rpcs_per_second=(self._capacity.rpcs_per_second * (1.0 - self._headroom)) - load.rpcs_per_second,
+                drop_rate=0.0,
+            )
+
+            short = []
+            for quality in self._qualities:
+                cost = self._estimate(quality)
+
+                short = [
+                    name for name in ['encode_seconds_per_second', 'bytes_per_second', 'rpcs_per_second']
+                    if getattr(cost, name) > getattr(available, name)
+                ]
+                if len(short) > 0:
+                    continue
+
+                self._sessions[key] = _Session(quality)
+                self._admitted += 1
+                if quality != self._qualities[0]:
+                    self._downgraded += 1
+                    return AdmissionDecision(True, quality, 'downgraded to {}x{} at {} fps'.format(
+                        quality.width,
+                        quality.height,
+                        quality.fps
+                    ))
+
+                return AdmissionDecision(True, quality, 'admitted')
+
+            self._rejected += 1
+
+            return AdmissionDecision(False, None, 'not enough {} left'.format(', '.join(short)))
+
+    def get_stats(self) -> AdmissionStats:
+        with self._lock:
+            return AdmissionStats(
+                sessions=len(self._sessions),
+                load=self._get_load(),
+                capacity=self._capacity,
+                admitted=self._admitted,
+                downgraded=self._downgraded,
+                rejected=self._rejected,
+            )
+
+    def _work(self):
+        self.update(self._get_samples(), self._get_rpcs() if self._get_rpcs is not None else None)
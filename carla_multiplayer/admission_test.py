@@ -0,0 +1,93 @@
+import unittest
+
+from .admission import AdmissionController, HostCapacity, Quality, SessionCost, SessionSample, get_qualities
+
+_QUALITIES = get_qualities(Quality(fps=30, width=640, height=360))
+
+
+class AdmissionControllerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+
+        self.subject = AdmissionController(
+            get_samples=lambda: {},
+            capacity=HostCapacity(encode_seconds_per_second=1.1, bytes_per_second=2000000.0, rpcs_per_second=100.0),
+            qualities=_QUALITIES,
+            headroom=0.0,
+            default_cost=SessionCost(
+                encode_seconds_per_second=0.3,
+                bytes_per_second=300000.0,
+                rpcs_per_second=10.0,
+                drop_rate=0.0,
+            ),
+            smoothing=1.0,
+            clock=lambda: self.now
+        )
+
+    def test_get_qualities(self):
+        self.assertEqual(
+            [Quality(30, 640, 360), Quality(15, 640, 360), Quality(15, 320, 180)],
+            _QUALITIES
+        )
+
+    def test_admit_downgrade_and_reject_on_estimates(self):
+        decisions = [self.subject.admit(x) for x in range(0, 6)]
+
+        self.assertEqual([True] * 5 + [False], [x.admit for x in decisions])
+        self.assertEqual([_QUALITIES[0]] * 3 + [_QUALITIES[1], _QUALITIES[2], None], [x.quality for x in decisions])
+        self.assertEqual('downgraded to 640x360 at 15 fps', decisions[3].reason)
+        self.assertIn('encode_seconds_per_second', decisions[-1].reason)
+
+        self.subject.remove(0)  # room again
+
+        self.assertEqual(_QUALITIES[0], self.subject.admit(6).quality)
+
+        stats = self.subject.get_stats()
+        self.assertEqual((5, 6, 2, 1), (stats.sessions, stats.admitted, stats.downgraded, stats.rejected))
+
+    def test_measured_costs(self):
+        self.assertEqual(_QUALITIES[0], self.subject.admit('a').quality)
+
+        self.subject.update({'a': SessionSample(encode_seconds=0.0, frames=0, frame_bytes=0, frames_dropped=0)}, rpcs=0)
+
+        # twice as expensive as assumed
+        self.now = 1.0
+        self.subject.update({'a': SessionSample(encode_seconds=0.6, frames=30, frame_bytes=1200000, frames_dropped=0)}, rpcs=20)
+
+        load = self.subject.get_stats().load
+        self.assertAlmostEqual(0.6, load.encode_seconds_per_second)
+        self.assertAlmostEqual(1200000.0, load.bytes_per_second)
+        self.assertAlmostEqual(20.0, load.rpcs_per_second)
+
+        # full quality doesn't fit next to that, half the frame rate does
+        self.assertEqual(_QUALITIES[1], self.subject.admit('b').quality)
+        self.assertEqual(_QUALITIES[2], self.subject.admit('c').quality)
+
+        decision = self.subject.admit('d')
+
+        self.assertFalse(decision.admit)
+        self.assertEqual('not enough bytes_per_second left', decision.reason)
+
+    def test_reject_while_existing_sessions_drop_frames(self):
+        self.subject.admit('a')
+
+        self.subject.update({'a': SessionSample(encode_seconds=0.0, frames=0, frame_bytes=0, frames_dropped=0)})
+
+        self.now = 1.0
+        self.subject.update({'a': SessionSample(encode_seconds=0.1, frames=20, frame_bytes=1000, frames_dropped=10)})
+
+        decision = self.subject.admit('b')
+
+        self.assertFalse(decision.admit)
+        self.assertIn('dropping 33%', decision.reason)
+
+    def test_paused_sessions_keep_their_share(self):
+        self.subject.admit('a')
+
+        self.subject.update({'a': SessionSample(encode_seconds=0.0, frames=0, frame_bytes=0, frames_dropped=0)})
+
+        self.now = 1.0
+        self.subject.update({'a': SessionSample(encode_seconds=0.0, frames=0, frame_bytes=0, frames_dropped=0)})
+
+        self.assertAlmostEqual(0.3, self.subject.get_stats().load.encode_seconds_per_second)
+
@@ -0,0 +1,796 @@
+import fnmatch
+import inspect
+import json
+import os
+import platform
+import socket
+import subprocess
+import time
+import timeit
+from io import BytesIO
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy
+from PIL import Image
+
+from .controller import ControllerState, serialize_controller_state, deserialize_controller_state, serialize_controller_states, \
+    deserialize_controller_states, _REDUNDANCY
+
+_ITERATIONS = 100000
+_SERVER_ITERATIONS = 10
+_RPC_ITERATIONS = 1000
+_RPC_BATCH = 100
+_LOOPBACK_PLAYERS = [1, 4]
+_LOOPBACK_RESOLUTIONS = ['320x180', '640x360']
+_LOOPBACK_CODECS = ['webp', 'jpeg']
+_LOOPBACK_FPS = 30
+_LOOPBACK_WARMUP = 2.0  # s before measuring, so spawning and the first frames don't count
+_LOOPBACK_DURATION = 10.0  # s measured per run
+_LOOPBACK_TIMEOUT = 30.0  # s on top of warmup and duration before a run is given up on
+_SIMULATED_FRAMES = 10  # distinct pre-rendered frames cycled through, so consecutive frames differ
+_SIMULATED_SPAWN_POINTS = 64
+_STAMP_BITS = 32  # capture time (ms, monotonic) drawn into each frame as black / white blocks, so it survives lossy codecs
+_STAMP_COLUMNS = 16
+_STAMP_MODULO = 1 << _STAMP_BITS
+
+_CONTROLLER_STATE = ControllerState(
+    throttle=0.75,
+    brake=0.0,
+    steer=-0.33,
+    hand_brake=False,
+    reverse=False,
+    reset=False,
+)
+
+
+def _time_per_call(function: Callable, iterations: int) -> float:
+    return timeit.timeit(function, number=iterations) / iterations
+
+
+def benchmark_controller_state(iterations: int = _ITERATIONS) -> Dict[str, Dict[str, float]]:
+    results = {}
+
+    for name, use_json in [('json', True), ('binary', False)]:
+        data = serialize_controller_state(_CONTROLLER_STATE, use_json=use_json)
+
+        results[name] = {
+            'bytes': len(data),
+            'serialize_us': _time_per_call(lambda: serialize_controller_state(_CONTROLLER_STATE, use_json=use_json), iterations) * 1e6,
+            'deserialize_us': _time_per_call(lambda: deserialize_controller_state(data), iterations) * 1e6,
+        }
+
+    controller_states = [_CONTROLLER_STATE] * _REDUNDANCY
+    data = serialize_controller_states(controller_states, 1)
+
+    results['binary_bundle'] = {
+        'bytes': len(data),
+        'serialize_us': _time_per_call(lambda: serialize_controller_states(controller_states, 1), iterations) * 1e6,
+        'deserialize_us': _time_per_call(lambda: deserialize_controller_states(data), iterations) * 1e6,
+    }
+
+    return results
+
+
+def _summarize(durations: List[float]) -> Dict[str, float]:
+    return {
+        'mean_ms': sum(durations) / len(durations) * 1e3,
+        'max_ms': max(durations) * 1e3,
+    }
+
+
+def benchmark_server_start_stop(iterations: int = _SERVER_ITERATIONS, carla_host: str = 'localhost') -> Dict[str, Dict[str, float]]:
+    from .server import Server  # only needed here, and pulls in pygame and PIL
+    from . import wrapped_carla as carla
+
+    start_durations, stop_durations = [], []
+    for _ in range(0, iterations):
+        server = Server(
+            vehicle_port=0,
+            sensor_port=0,
+            vehicle_blueprint_name='vehicle.tesla.model3',
+            client_host='127.0.0.1',
+            carla_host=carla_host,
+            vehicle_transforms=[carla.Transform()],
+        )
+
+        started = time.perf_counter()
+        server.start()
+        start_durations += [time.perf_counter() - started]
+
+        started = time.perf_counter()
+        server.stop()
+        stop_durations += [time.perf_counter() - started]
+
+    return {
+        'start': _summarize(start_durations),
+        'stop': _summarize(stop_durations),
+    }
+
+
+class _IdleProcess(object):  # stands in for a launched server process
+    def poll(self):
+        return None
+
+    def terminate(self):
+        pass
+
+
+def benchmark_coordinator_rpc(iterations: int = _RPC_ITERATIONS, batch: int = _RPC_BATCH) -> Dict[str, Dict[str, float]]:
+    from threading import Thread
+
+    import Pyro4
+
+    from .coordinator import Server, get_available_serializers
+
+    server = Server(sessions_per_server=iterations * 4, launcher=lambda spec: _IdleProcess())
+    host_id = str(server.register_host('127.0.0.1', capacity=iterations * 4))
+
+    daemon = Pyro4.Daemon(host='127.0.0.1', port=0)
+    uri = daemon.register(server)
+    thread = Thread(target=daemon.requestLoop)
+    thread.start()
+
+    def time_per_call(function: Callable, count: int) -> float:
+        started = time.perf_counter()
+        for _ in range(0, count):
+            function()
+
+        return (time.perf_counter() - started) / count
+
+    results = {}
+    try:
+        with Pyro4.Proxy(uri) as proxy:
+            proxy._pyroSerializer = 'pickle'
+
+            # the original path; a Client object per round trip
+            clients = []
+            results['pickle_client_objects'] = {
+                'register_us': time_per_call(lambda: clients.append(proxy.register_client()), iterations) * 1e6,
+                'unregister_us': time_per_call(lambda: proxy.unregister_client(clients.pop().get_uuid()), iterations) * 1e6,
+            }
+
+        for serializer in get_available_serializers():
+            with Pyro4.Proxy(uri) as proxy:
+                proxy._pyroSerializer = serializer
+
+                uuids = []
+                register_us = time_per_call(lambda: uuids.extend(x[0] for x in proxy.register_clients(1)), iterations) * 1e6
+                register_batched_us = time_per_call(
+                    lambda: uuids.extend(x[0] for x in proxy.register_clients(batch)), max(1, iterations // batch)
+                ) * 1e6 / batch
+                get_status_us = time_per_call(proxy.get_status, iterations) * 1e6
+                report_load_oneway_us = time_per_call(lambda: proxy.report_load(host_id, 30.0, 0.5), iterations) * 1e6
+
+                proxy.unregister_clients(uuids)
+                while proxy.get_status()['clients'] > 0:  # let the oneways drain so as not to skew the next serializer
+                    time.sleep(0.01)
+
+                results[serializer] = {
+                    'register_us': register_us,
+                    'register_batched_us': register_batched_us,  # per client
+                    'get_status_us': get_status_us,
+                    'report_load_oneway_us': report_load_oneway_us,
+                }
+    finally:
+        daemon.shutdown()
+        thread.join()
+        daemon.close()
+
+    return results
+
+
+def _get_stamp_block_size(width: int, height: int) -> int:
+    return max(1, min(width // _STAMP_COLUMNS, height // ((_STAMP_BITS // _STAMP_COLUMNS) * 4)))
+
+
+def _draw_stamp(bgra: numpy.ndarray, value: int):
+    block = _get_stamp_block_size(bgra.shape[1], bgra.shape[0])
+
+    for bit in range(0, _STAMP_BITS):
+        row, column = divmod(bit, _STAMP_COLUMNS)
+        bgra[row * block:(row + 1) * block, column * block:(column + 1) * block, :3] = 255 if (value >> bit) & 1 else 0
+
+
+def _read_stamp(rgb: numpy.ndarray) -> int:
+    block = _get_stamp_block_size(rgb.shape[1], rgb.shape[0])
+    inset = block // 4  # codecs smear the edges of each block into its neighbours
+
+    value = 0
+    for bit in range(0, _STAMP_BITS):
+        row, column = divmod(bit, _STAMP_COLUMNS)
+        region = rgb[row * block + inset:(row + 1) * block - inset, column * block + inset:(column + 1) * block - inset]
+        if region.mean() > 127:
+            value |= 1 << bit
+
+    return value
+
+
+def _get_stamp_now() -> int:
+    return int(time.monotonic() * 1000) % _STAMP_MODULO  # the same clock in every process on the host
+
+
+def _get_percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    values = sorted(values)
+
+    def percentile(p: float) -> Optional[float]:
+        if len(values) == 0:
+            return None
+
+        return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+    return {'p50': percentile(50), 'p90': percentile(90), 'p99': percentile(99), 'max': values[-1] if len(values) > 0 else None}
+
+
+# just enough of the Carla API for a Server to spawn its actors against and get frames from, without a simulator or GPU
+
+
+class _SimulatedLocation(object):
+    def __init__(self, x: float = 0.0, y: float = 0.0, z: float = 0.0):
+        self.x: float = x
+        self.y: float = y
+        self.z: float = z
+
+
+class _SimulatedRotation(object):
+    def __init__(self):
+        self.pitch: float = 0.0
+        self.yaw: float = 0.0
+        self.roll: float = 0.0
+
+
+class _SimulatedTransform(object):
+    def __init__(self, location: Optional[_SimulatedLocation] = None):
+        self.location: _SimulatedLocation = location if location is not None else _SimulatedLocation()
+        self.rotation: _SimulatedRotation = _SimulatedRotation()
+
+
+class _SimulatedControl(object):
+    def __init__(self):
+        self.throttle: float = 0.0
+        self.brake: float = 0.0
+        self.steer: float = 0.0
+        self.gear: int = 1
+        self.hand_brake: bool = False
+        self.reverse: bool = False
+
+
+class _SimulatedImage(object):
+    def __init__(self, frame: int, width: int, height: int, raw_data: bytes):
+        self.frame: int = frame
+        self.width: int = width
+        self.height: int = height
+        self.raw_data: bytes = raw_data
+
+
+class _SimulatedBlueprint(object):
+    def __init__(self, blueprint_id: str):
+        self.id: str = blueprint_id
+        self.attributes: Dict[str, str] = {}
+
+    def has_attribute(self, name: str) -> bool:
+        return name in self.attributes
+
+    def get_attribute(self, name: str) -> str:
+        return self.attributes[name]
+
+    def set_attribute(self, name: str, value: str):
+        self.attributes[name] = value
+
+
+class _SimulatedBlueprintLibrary(object):
+    def find(self, blueprint_id: str) -> _SimulatedBlueprint:
+        return _SimulatedBlueprint(blueprint_id)
+
+    def filter(self, pattern: str) -> List[_SimulatedBlueprint]:
+        return []
+
+
+class _SimulatedActorList(list):
+    def filter(self, pattern: str) -> List['_SimulatedActor']:
+        return [x for x in self if fnmatch.fnmatch(x.type_id, pattern)]
+
+
+class _SimulatedMap(object):
+    def __init__(self, spawn_points: List[_SimulatedTransform]):
+        self._spawn_points: List[_SimulatedTransform] = spawn_points
+
+    def get_spawn_points(self) -> List[_SimulatedTransform]:
+        return self._spawn_points
+
+
+class _SimulatedActor(object):
+    def __init__(self, world: '_SimulatedWorld', actor_id: int, blueprint: _SimulatedBlueprint, transform: Any):
+        self.id: int = actor_id
+        self.type_id: str = blueprint.id
+
+        self._world: _SimulatedWorld = world
+        self._attributes: Dict[str, str] = dict(blueprint.attributes)
+        self._transform: Any = transform
+        self._control: _SimulatedControl = _SimulatedControl()
+        self._velocity: _SimulatedLocation = _SimulatedLocation()
+
+        self._stop_event: Event = Event()
+        self._thread: Optional[Thread] = None
+
+    def get_location(self) -> _SimulatedLocation:
+        return self._transform.location
+
+    def get_transform(self) -> Any:
+        return self._transform
+
+    def set_transform(self, transform: Any):
+        self._transform = transform
+
+    def get_velocity(self) -> _SimulatedLocation:
+        return self._velocity
+
+    def get_control(self) -> _SimulatedControl:
+        return self._control
+
+    def apply_control(self, control: Any):
+        pass
+
+    def listen(self, callback: Callable):
+        if not self.type_id.startswith('sensor.camera.'):  # collisions and lane invasions never happen here
+            return
+
+        self._stop_event.clear()
+        self._thread = Thread(target=self._capture, args=(callback,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def destroy(self) -> bool:
+        self.stop()
+        self._world.remove_actor(self.id)
+
+        return True
+
+    def _capture(self, callback: Callable):
+        period = float(self._attributes.get('sensor_tick', 1.0 / _LOOPBACK_FPS))
+        width = int(self._attributes.get('image_size_x', 640))
+        height = int(self._attributes.get('image_size_y', 360))
+        frames = self._world.get_frames(width, height)
+
+        frame = 0
+        deadline = time.monotonic()
+        while not self._stop_event.is_set():
+            started = time.thread_time()
+
+            bgra = frames[frame % len(frames)].copy()
+            _draw_stamp(bgra, _get_stamp_now())
+            callback(_SimulatedImage(frame, width, height, bgra.tobytes()))
+
+            self._world.add_cpu_seconds(time.thread_time() - started)
+
+            frame += 1
+            deadline += period
+            self._stop_event.wait(max(0.0, deadline - time.monotonic()))
+
+
+class _SimulatedWorld(object):
+    def __init__(self):
+        self._lock: Lock = Lock()
+        self._actors_by_id: Dict[int, _SimulatedActor] = {}
+        self._next_actor_id: int = 1
+        self._frame: int = 0
+        self._frames_by_size: Dict[Tuple[int, int], List[numpy.ndarray]] = {}
+        self._cpu_seconds: float = 0.0
+
+        # far enough apart that none of them are ever too close to another player to use
+        self._map: _SimulatedMap = _SimulatedMap([
+            _SimulatedTransform(_SimulatedLocation(x=i * 20.0)) for i in range(0, _SIMULATED_SPAWN_POINTS)
+        ])
+        self._blueprint_library: _SimulatedBlueprintLibrary = _SimulatedBlueprintLibrary()
+
+    def get_frames(self, width: int, height: int) -> List[numpy.ndarray]:
+        with self._lock:
+            frames = self._frames_by_size.get((width, height))
+            if frames is None:
+                # gradients and stripes rather than noise, so the codecs have about as much to do as with a real scene
+                x, y = numpy.meshgrid(numpy.arange(width), numpy.arange(height))
+                frames = []
+                for i in range(0, _SIMULATED_FRAMES):
+                    offset = i * max(1, width // _SIMULATED_FRAMES)
+                    bgra = numpy.empty((height, width, 4), dtype=numpy.uint8)
+                    bgra[:, :, 0] = ((x + offset) * 255 // width) % 256
+                    bgra[:, :, 1] = y * 255 // height
+                    bgra[:, :, 2] = ((x + y + offset) // 8 % 2) * 128 + 64
+                    bgra[:, :, 3] = 255
+                    frames += [bgra]
+
+                self._frames_by_size[(width, height)] = frames
+
+        return frames
+
+    def add_cpu_seconds(self, seconds: float):
+        with self._lock:
+            self._cpu_seconds += seconds
+
+    def get_cpu_seconds(self) -> float:
+        with self._lock:
+            return self._cpu_seconds
+
+    def remove_actor(self, actor_id: int):
+        with self._lock:
+            self._actors_by_id.pop(actor_id, None)
+
+    def wait_for_tick(self, *args, **kwargs) -> Any:
+        with self._lock:
+            self._frame += 1
+
+            return _SimulatedImage(self._frame, 0, 0, b'')  # only the frame is ever looked at
+
+    def get_map(self) -> _SimulatedMap:
+        return self._map
+
+    def get_blueprint_library(self) -> _SimulatedBlueprintLibrary:
+        return self._blueprint_library
+
+    def get_actor(self, actor_id: int) -> Optional[_SimulatedActor]:
+        with self._lock:
+            return self._actors_by_id.get(actor_id)
+
+    def get_actors(self) -> _SimulatedActorList:
+        with self._lock:
+            return _SimulatedActorList(self._actors_by_id.values())
+
+    def spawn_actor(self, blueprint: _SimulatedBlueprint, transform: Any, attach_to: Any = None, **kwargs) -> _SimulatedActor:
+        with self._lock:
+            actor = _SimulatedActor(self, self._next_actor_id, blueprint, transform)
+            self._actors_by_id[actor.id] = actor
+            self._next_actor_id += 1
+
+        return actor
+
+    def try_spawn_actor(self, blueprint: _SimulatedBlueprint, transform: Any, **kwargs) -> Optional[_SimulatedActor]:
+        return self.spawn_actor(blueprint, transform, **kwargs)
+
+
+class _SimulatedClient(object):
+    def __init__(self):
+        self._world: _SimulatedWorld = _SimulatedWorld()
+
+    def set_timeout(self, timeout: float):
+        pass
+
+    def get_world(self) -> _SimulatedWorld:
+        return self._world
+
+
+class _HeadlessClient(object):  # a Client without the screen or gamepad; decodes every frame and reads its stamp
+    def __init__(self, host: str, server_port: int, port: int):
+        from .bot import BotController, ScriptedPolicy, ScriptStep
+        from .udp import Receiver, Sender
+        from .viewer import ViewerKeepaliveSender
+
+        self._receiver: Receiver = Receiver(port=port, queue_size=2, callback=self._handle_datagram)
+        self._sender: Sender = Sender(port=port, queue_size=2, use_socket_from=self._receiver)
+
+        # weaving, so there's a steady stream of new controller states rather than just keepalives
+        self._controller: BotController = BotController(
+            sender=self._sender,
+            host=host,
+            port=server_port,
+            policy=ScriptedPolicy([
+                ScriptStep(duration=0.1, controller_state=_CONTROLLER_STATE._replace(steer=steer)) for steer in [-0.5, 0.0, 0.5, 0.0]
+            ], loop=True)
+        )
+        self._keepalive_sender: ViewerKeepaliveSender = ViewerKeepaliveSender(self._sender, host, server_port)
+
+        self._lock: Lock = Lock()
+        self._measuring: bool = False
+        self._frames: int = 0
+        self._frame_bytes: int = 0
+        self._telemetry_bytes: int = 0
+        self._latencies: List[float] = []
+
+    def _handle_datagram(self, datagram: Any):
+        from .telemetry import is_telemetry
+
+        if is_telemetry(datagram.data):
+            with self._lock:
+                if self._measuring:
+                    self._telemetry_bytes += len(datagram.data)
+
+            return
+
+        rgb = numpy.asarray(Image.open(BytesIO(datagram.data)).convert('RGB'))
+        latency = ((_get_stamp_now() - _read_stamp(rgb)) % _STAMP_MODULO) / 1000.0  # from capture to decoded, ready to show
+
+        with self._lock:
+            if self._measuring:
+                self._frames += 1
+                self._frame_bytes += len(datagram.data)
+                self._latencies += [latency]
+
+    def start_measuring(self):
+        with self._lock:
+            self._measuring = True
+
+    def stop_measuring(self) -> Dict[str, Any]:
+        with self._lock:
+            self._measuring = False
+
+            return {
+                'frames': self._frames,
+                'frame_bytes': self._frame_bytes,
+                'telemetry_bytes': self._telemetry_bytes,
+                'latencies': list(self._latencies),
+            }
+
+    def start(self):
+        self._receiver.start()  # first, as it owns the socket
+        self._sender.start()
+        self._controller.start()
+        self._keepalive_sender.start()
+
+    def stop(self):
+        self._keepalive_sender.stop()
+        self._controller.stop()
+        self._sender.stop()
+        self._receiver.stop()
+
+
+def _measure(ready: Any, go: Any, warmup: float, duration: float, start_measuring: Callable, stop_measuring: Callable) -> Dict:
+    ready.set()
+    go.wait()
+    time.sleep(warmup)
+
+    start_measuring()
+    started, cpu_started = time.monotonic(), time.process_time()
+    time.sleep(duration)
+    elapsed, cpu_seconds = time.monotonic() - started, time.process_time() - cpu_started
+
+    results = stop_measuring()
+    results['elapsed'] = elapsed
+    results['cpu_seconds'] = cpu_seconds
+
+    return results
+
+
+def _run_loopback_clients(ports: List[Tuple[int, int]], warmup: float, duration: float, ready: Any, go: Any, results: Any):
+    clients = [_HeadlessClient('127.0.0.1', server_port, client_port) for server_port, client_port in ports]
+    for client in clients:
+        client.start()
+
+    def stop_measuring():
+        by_client = [x.stop_measuring() for x in clients]
+
+        return {
+            'frames_by_client': [x['frames'] for x in by_client],
+            'frame_bytes': sum(x['frame_bytes'] for x in by_client),
+            'telemetry_bytes': sum(x['telemetry_bytes'] for x in by_client),
+            'latencies': [y for x in by_client for y in x['latencies']],
+        }
+
+    try:
+        results.put(('clients', _measure(ready, go, warmup, duration, lambda: [x.start_measuring() for x in clients], stop_measuring)))
+    finally:
+        for client in clients:
+            client.stop()
+
+
+def _run_loopback_servers(
+        ports: List[Tuple[int, int]],
+        width: int,
+        height: int,
+        fps: int,
+        codec: str,
+        warmup: float,
+        duration: float,
+        ready: Any,
+        go: Any,
+        results: Any):
+    from .metrics import get_default_registry
+    from .sensor import set_image_format
+    from .server import Server
+
+    set_image_format(codec)
+
+    carla_client = _SimulatedClient()
+    world = carla_client.get_world()
+
+    servers = [
+        Server(
+            vehicle_port=server_port,
+            sensor_port=client_port,
+            vehicle_blueprint_name='vehicle.tesla.model3',
+            client_host='127.0.0.1',
+            carla_host='simulated',
+            fps=fps,
+            width=width,
+            height=height,
+            carla_client=carla_client
+        ) for server_port, client_port in ports
+    ]
+    for server in servers:
+        server.start()
+
+    registry = get_default_registry()
+    counters = {
+        'rpcs': lambda: sum(x.get_rpc_stats()[y].calls for x in servers for y in x.get_rpc_stats()),
+        'simulator_cpu_seconds': world.get_cpu_seconds,
+        'images_superseded': lambda: registry.get('sensor_images_superseded_total') or 0,
+        'send_queue_full': lambda: sum(registry.get('udp_send_queue_full_total', x) or 0 for _, x in ports),
+        'send_errors': lambda: sum(registry.get('udp_send_errors_total', x) or 0 for _, x in ports),
+    }
+    before = {}
+
+    def start_measuring():
+        before.update({k: v() for k, v in counters.items()})
+
+    def stop_measuring():
+        return {k: v() - before[k] for k, v in counters.items()}
+
+    try:
+        results.put(('servers', _measure(ready, go, warmup, duration, start_measuring, stop_measuring)))
+    finally:
+        for server in servers:
+            server.stop()
+
+
+def _get_free_ports(count: int) -> List[int]:
+    sockets = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(0, count)]
+    try:
+        for s in sockets:
+            s.bind(('127.0.0.1', 0))
+
+        return [s.getsockname()[1] for s in sockets]
+    finally:
+        for s in sockets:
+            s.close()
+
+
+def _get_commit() -> Optional[str]:
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):  # not a checkout, or no git
+        return None
+
+    return commit + ('-dirty' if len(dirty.strip()) > 0 else '')
+
+
+def _run_loopback(players: int, width: int, height: int, codec: str, fps: int, warmup: float, duration: float) -> Dict[str, Any]:
+    import multiprocessing
+
+    context = multiprocessing.get_context('spawn')  # nothing shared with us or each other but the host
+    ports = _get_free_ports(players * 2)
+    ports = list(zip(ports[0::2], ports[1::2]))  # server, client
+    results, go = context.Queue(), context.Event()
+    clients_ready, servers_ready = context.Event(), context.Event()
+    timeout = warmup + duration + _LOOPBACK_TIMEOUT
+
+    clients = context.Process(target=_run_loopback_clients, args=(ports, warmup, duration, clients_ready, go, results))
+    servers = context.Process(
+        target=_run_loopback_servers,
+        args=(ports, width, height, fps, codec, warmup, duration, servers_ready, go, results)
+    )
+
+    clients.start()  # first, so there's someone listening for the first frame
+    try:
+        if not clients_ready.wait(timeout):
+            raise TimeoutError('headless clients did not start')
+
+        servers.start()
+        if not servers_ready.wait(timeout):
+            raise TimeoutError('servers did not start')
+
+        go.set()
+        by_process = dict(results.get(timeout=timeout) for _ in range(0, 2))
+    finally:
+        for process in [servers, clients]:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+    client_results, server_results = by_process['clients'], by_process['servers']
+    elapsed = client_results['elapsed']
+    frames = sum(client_results['frames_by_client'])
+
+    return {
+        'players': players,
+        'width': width,
+        'height': height,
+        'codec': codec,
+        'fps': fps,
+        'frames_per_second': frames / elapsed,
+        'frames_per_second_per_player': {
+            'min': min(client_results['frames_by_client']) / elapsed,
+            'mean': frames / players / elapsed,
+        },
+        'latency_ms': {k: v * 1e3 if v is not None else None for k, v in _get_percentiles(client_results['latencies']).items()},
+        'bytes_per_second': (client_results['frame_bytes'] + client_results['telemetry_bytes']) / elapsed,
+        'frame_bytes_mean': client_results['frame_bytes'] / frames if frames > 0 else None,
+        'cpu_percent': {  # of one core
+            'server': (server_results['cpu_seconds'] - server_results['simulator_cpu_seconds']) / server_results['elapsed'] * 100,
+            'simulator': server_results['simulator_cpu_seconds'] / server_results['elapsed'] * 100,
+            'clients': client_results['cpu_seconds'] / elapsed * 100,
+        },
+        'carla_rpcs_per_second': server_results['rpcs'] / server_results['elapsed'],
+        'images_superseded': server_results['images_superseded'],
+        'send_queue_full': server_results['send_queue_full'],
+        'send_errors': server_results['send_errors'],
+    }
+
+
+def _parse_resolution(resolution: str) -> Tuple[int, int]:
+    width, height = resolution.lower().split('x')
+
+    return int(width), int(height)
+
+
+def benchmark_loopback(
+        players: Optional[List[int]] = None,
+        resolutions: Optional[List[str]] = None,
+        codecs: Optional[List[str]] = None,
+        fps: int = _LOOPBACK_FPS,
+        warmup: float = _LOOPBACK_WARMUP,
+        duration: float = _LOOPBACK_DURATION) -> Dict[str, Any]:
+    runs = []
+    for player_count in players if players is not None else _LOOPBACK_PLAYERS:
+        for resolution in resolutions if resolutions is not None else _LOOPBACK_RESOLUTIONS:
+            width, height = _parse_resolution(resolution)
+            for codec in codecs if codecs is not None else _LOOPBACK_CODECS:
+                runs += [_run_loopback(player_count, width, height, codec, fps, warmup, duration)]
+
+    # everything needed to tell whether two results can be compared
+    return {
+        'commit': _get_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'warmup': warmup,
+        'duration': duration,
+        'runs': runs,
+    }
+
+
+_BENCHMARKS = {
+    'controller-state': benchmark_controller_state,
+    'coordinator-rpc': benchmark_coordinator_rpc,
+    'loopback': benchmark_loopback,
+    'server-start-stop': benchmark_server_start_stop,
+}
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmark', type=str, choices=sorted(_BENCHMARKS.keys()))
+    parser.add_argument('--iterations', type=int, default=None)  # defaults per benchmark
+    parser.add_argument('--players', type=int, nargs='+', default=None)  # loopback
+    parser.add_argument('--resolutions', type=str, nargs='+', default=None)  # loopback, e.g. 640x360
+    parser.add_argument('--codecs', type=str, nargs='+', default=None)  # loopback; webp, jpeg or png
+    parser.add_argument('--duration', type=float, default=None)  # loopback; s measured per run
+    parser.add_argument('--output', type=str, default=None)  # write the results here too, to compare against later
+
+    args = parser.parse_args()
+
+    _benchmark = _BENCHMARKS[args.benchmark]
+    _parameters = inspect.signature(_benchmark).parameters
+
+    _kwargs = {}
+    for _name in ['iterations', 'players', 'resolutions', 'codecs', 'duration']:
+        if getattr(args, _name) is None:
+            continue
+
+        if _name not in _parameters:
+            parser.error('--{} does not apply to the {} benchmark'.format(_name, args.benchmark))
+
+        _kwargs[_name] = getattr(args, _name)
+
+    _results = json.dumps(_benchmark(**_kwargs), indent=4, sort_keys=True)
+
+    print(_results)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write(_results + '\n')
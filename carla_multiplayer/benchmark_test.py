@@ -0,0 +1,52 @@
+import time
+import unittest
+from io import BytesIO
+
+import numpy
+from PIL import Image
+
+from .benchmark import _SimulatedClient, _draw_stamp, _get_percentiles, _read_stamp
+
+
+class StampTest(unittest.TestCase):
+    def test_round_trip(self):
+        for codec in ['WEBP', 'JPEG', 'PNG']:
+            for width, height in [(320, 180), (640, 360)]:
+                bgra = numpy.full((height, width, 4), 96, dtype=numpy.uint8)
+                _draw_stamp(bgra, 0xDEADBEEF)
+
+                buffer = BytesIO()
+                Image.fromarray(bgra[:, :, [2, 1, 0]]).save(buffer, format=codec)
+
+                rgb = numpy.asarray(Image.open(BytesIO(buffer.getvalue())).convert('RGB'))
+
+                self.assertEqual(0xDEADBEEF, _read_stamp(rgb), (codec, width, height))
+
+    def test_get_percentiles(self):
+        self.assertEqual({'p50': 50, 'p90': 90, 'p99': 99, 'max': 99}, _get_percentiles(list(range(0, 100))))
+        self.assertEqual({'p50': None, 'p90': None, 'p99': None, 'max': None}, _get_percentiles([]))
+
+
+class SimulatedClientTest(unittest.TestCase):
+    def test_camera(self):
+        world = _SimulatedClient().get_world()
+        library = world.get_blueprint_library()
+
+        vehicle = world.spawn_actor(library.find('vehicle.tesla.model3'), world.get_map().get_spawn_points()[0])
+        blueprint = library.find('sensor.camera.rgb')
+        blueprint.set_attribute('image_size_x', '64')
+        blueprint.set_attribute('image_size_y', '32')
+        blueprint.set_attribute('sensor_tick', '0.01')
+        camera = world.spawn_actor(blueprint, None, attach_to=vehicle)
+
+        self.assertEqual([camera], world.get_actors().filter('sensor.*'))
+
+        images = []
+        camera.listen(images.append)
+        time.sleep(0.1)
+        camera.destroy()
+
+        self.assertGreater(len(images), 0)
+        self.assertEqual((64, 32, 64 * 32 * 4), (images[0].width, images[0].height, len(images[0].raw_data)))
+        self.assertEqual([vehicle], world.get_actors())
+        self.assertGreater(world.get_cpu_seconds(), 0)
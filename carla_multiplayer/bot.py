@@ -0,0 +1,245 @@
+import bisect
+import datetime
+import json
+import math
+from threading import Event
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from .controller import Controller, ControllerState, _CONTROL_RATE, _KEEPALIVE_RATE, _REDUNDANCY
+from .recording import RecordedControllerState, read_controller_states
+from .udp import Sender
+
+_QUEUE_SIZE = 2
+_WAYPOINT_THROTTLE = 0.5
+_WAYPOINT_RADIUS = 5.0  # metres
+_MAX_STEER_ANGLE = 70.0  # degrees
+
+_STOPPED_CONTROLLER_STATE = ControllerState(
+    throttle=0.0,
+    brake=1.0,
+    steer=0.0,
+    hand_brake=False,
+    reverse=False,
+    reset=False,
+)
+
+Policy = Callable[[float], Optional[ControllerState]]  # seconds since start -> state to send (or None when finished)
+Pose = Tuple[float, float, float]  # x, y, yaw (degrees)
+
+
+class ScriptStep(NamedTuple):
+    duration: float
+    controller_state: ControllerState
+
+
+class ReplayPolicy(object):
+    def __init__(self, recorded_controller_states: List[RecordedControllerState], loop: bool = False):
+        if len(recorded_controller_states) == 0:
+            raise ValueError('cannot replay an empty recording')
+
+        self._recorded_controller_states: List[RecordedControllerState] = recorded_controller_states
+        self._loop: bool = loop
+
+        self._timestamps: List[float] = [x.timestamp for x in self._recorded_controller_states]
+        self._duration: float = self._timestamps[-1]
+
+    def __call__(self, elapsed: float) -> Optional[ControllerState]:
+        if elapsed > self._duration:
+            if not self._loop or self._duration <= 0:
+                return None
+
+            elapsed %= self._duration
+
+        index = bisect.bisect_right(self._timestamps, elapsed) - 1
+        if index < 0:
+            index = 0
+
+        return self._recorded_controller_states[index].controller_state
+
+
+class ScriptedPolicy(ReplayPolicy):
+    def __init__(self, steps: List[ScriptStep], loop: bool = False):
+        recorded_controller_states = []
+
+        timestamp = 0.0
+        for step in steps:
+            recorded_controller_states += [
+                RecordedControllerState(
+                    timestamp=timestamp,
+                    controller_state=step.controller_state
+                )
+            ]
+            timestamp += step.duration
+
+        if len(recorded_controller_states) > 0:  # hold the last step for its duration
+            recorded_controller_states += [recorded_controller_states[-1]._replace(timestamp=timestamp)]
+
+        super().__init__(
+            recorded_controller_states=recorded_controller_states,
+            loop=loop
+        )
+
+
+class WaypointPolicy(object):
+    def __init__(self,
+            waypoints: List[Tuple[float, float]],
+            get_pose: Callable[[], Pose],
+            throttle: float = _WAYPOINT_THROTTLE,
+            radius: float = _WAYPOINT_RADIUS,
+            max_steer_angle: float = _MAX_STEER_ANGLE,
+            loop: bool = False):
+        if len(waypoints) == 0:
+            raise ValueError('cannot follow an empty list of waypoints')
+
+        self._waypoints: List[Tuple[float, float]] = waypoints
+        self._get_pose: Callable[[], Pose] = get_pose
+        self._throttle: float = throttle
+        self._radius: float = radius
+        self._max_steer_angle: float = max_steer_angle
+        self._loop: bool = loop
+
+        self._index: int = 0
+
+    def __call__(self, elapsed: float) -> Optional[ControllerState]:
+        x, y, yaw = self._get_pose()
+
+        while True:
+            target_x, target_y = self._waypoints[self._index]
+            if math.hypot(target_x - x, target_y - y) > self._radius:
+                break
+
+            self._index += 1
+            if self._index >= len(self._waypoints):
+                if not self._loop:
+                    return None
+
+                self._index = 0
+
+        heading = math.degrees(math.atan2(target_y - y, target_x - x))
+        error = (heading - yaw + 180.0) % 360.0 - 180.0
+
+        return ControllerState(
+            throttle=self._throttle,
+            brake=0.0,
+            steer=round(max(-1.0, min(1.0, error / self._max_steer_angle)), 2),
+            hand_brake=False,
+            reverse=False,
+            reset=False,
+        )
+
+
+class BotController(Controller):
+    def __init__(self,
+            sender: Sender,
+            host: str,
+            port: int,
+            policy: Policy,
+            rate: float = _CONTROL_RATE,
+            use_json: bool = False,
+            keepalive_rate: float = _KEEPALIVE_RATE,
+            redundancy: int = _REDUNDANCY,
+            controller_state_callback: Optional[Callable] = None):
+        super().__init__(
+            sender=sender,
+            host=host,
+            port=port,
+            rate=rate,
+            use_json=use_json,
+            keepalive_rate=keepalive_rate,
+            redundancy=redundancy,
+            controller_state_callback=controller_state_callback
+        )
+
+        self._policy: Policy = policy
+
+        self._started: Optional[datetime.datetime] = None
+        self._last_policy_controller_state: Optional[ControllerState] = None
+        self._finished: Event = Event()
+
+    @property
+    def finished(self) -> bool:
+        return self._finished.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._finished.wait(timeout)
+
+    def _before_loop(self):
+        self._started = datetime.datetime.now()
+        self._last_policy_controller_state = None
+        self._finished.clear()
+
+    def _before_work(self):
+        if self._finished.is_set():
+            return
+
+        controller_state = self._policy((datetime.datetime.now() - self._started).total_seconds())
+        if controller_state is None:
+            self._set_controller_state(_STOPPED_CONTROLLER_STATE)
+            self._finished.set()
+            return
+
+        if controller_state == self._last_policy_controller_state:
+            return
+
+        self._set_controller_state(controller_state)
+        self._last_policy_controller_state = controller_state
+
+
+def load_script(path: str) -> List[ScriptStep]:
+    with open(path, 'r') as f:
+        return [
+            ScriptStep(
+                duration=step['duration'],
+                controller_state=ControllerState(**step['controller_state'])
+            ) for step in json.load(f)
+        ]
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, required=True)
+    parser.add_argument('--ports', type=int, nargs='+', required=True)
+    parser.add_argument('--recording', type=str, default=None)
+    parser.add_argument('--script', type=str, default=None)
+    parser.add_argument('--loop', action='store_true', default=False)
+    parser.add_argument('--queue-size', type=int, default=_QUEUE_SIZE)
+    parser.add_argument('--use-json', action='store_true', default=False)
+
+    args = parser.parse_args()
+
+    if (args.recording is None) == (args.script is None):
+        raise ValueError('expected exactly one of --recording or --script')
+
+    _bots: List[Tuple[Sender, BotController]] = []
+    for _port in args.ports:
+        if args.recording is not None:
+            _policy = ReplayPolicy(read_controller_states(args.recording), loop=args.loop)
+        else:
+            _policy = ScriptedPolicy(load_script(args.script), loop=args.loop)
+
+        _sender = Sender(0, args.queue_size)  # ephemeral port so many bots can share a host
+        _bot = BotController(
+            sender=_sender,
+            host=args.host,
+            port=_port,
+            policy=_policy,
+            use_json=args.use_json
+        )
+        _bots += [(_sender, _bot)]
+
+    for _sender, _bot in _bots:
+        _sender.start()
+        _bot.start()
+
+    while not all(_bot.finished for _, _bot in _bots):
+        try:
+            time.sleep(1)
+        except KeyboardInterrupt:
+            break
+
+    for _sender, _bot in _bots:
+        _bot.stop()
+        _sender.stop()
@@ -0,0 +1,102 @@
+import time
+import unittest
+
+from mock import Mock
+
+from .bot import ReplayPolicy, ScriptedPolicy, ScriptStep, WaypointPolicy, BotController, _STOPPED_CONTROLLER_STATE
+from .controller import ControllerState, deserialize_controller_state
+from .recording import RecordedControllerState
+
+_CONTROLLER_STATE = ControllerState(
+    throttle=0.75,
+    brake=0.0,
+    steer=0.0,
+    hand_brake=False,
+    reverse=False,
+    reset=False,
+)
+
+
+class ReplayPolicyTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.recorded_controller_states = [
+            RecordedControllerState(timestamp=0.5, controller_state=_CONTROLLER_STATE),
+            RecordedControllerState(timestamp=1.0, controller_state=_CONTROLLER_STATE._replace(steer=0.5)),
+            RecordedControllerState(timestamp=2.0, controller_state=_CONTROLLER_STATE._replace(throttle=0.0)),
+        ]
+
+    def test_replay(self):
+        subject = ReplayPolicy(self.recorded_controller_states)
+
+        self.assertEqual(_CONTROLLER_STATE, subject(0.0))
+        self.assertEqual(_CONTROLLER_STATE, subject(0.99))
+        self.assertEqual(_CONTROLLER_STATE._replace(steer=0.5), subject(1.0))
+        self.assertEqual(_CONTROLLER_STATE._replace(throttle=0.0), subject(2.0))
+        self.assertIsNone(subject(2.01))
+
+    def test_replay_loop(self):
+        subject = ReplayPolicy(self.recorded_controller_states, loop=True)
+
+        self.assertEqual(_CONTROLLER_STATE._replace(steer=0.5), subject(3.5))
+
+
+class ScriptedPolicyTest(unittest.TestCase):
+    def test_script(self):
+        subject = ScriptedPolicy([
+            ScriptStep(duration=1.0, controller_state=_CONTROLLER_STATE),
+            ScriptStep(duration=2.0, controller_state=_CONTROLLER_STATE._replace(steer=-1.0)),
+        ])
+
+        self.assertEqual(_CONTROLLER_STATE, subject(0.5))
+        self.assertEqual(_CONTROLLER_STATE._replace(steer=-1.0), subject(1.5))
+        self.assertEqual(_CONTROLLER_STATE._replace(steer=-1.0), subject(3.0))
+        self.assertIsNone(subject(3.5))
+
+
+class WaypointPolicyTest(unittest.TestCase):
+    def test_waypoints(self):
+        pose = [0.0, 0.0, 0.0]
+
+        subject = WaypointPolicy(
+            waypoints=[(100.0, 0.0), (100.0, 100.0)],
+            get_pose=lambda: tuple(pose),
+            radius=5.0
+        )
+
+        self.assertEqual(0.0, subject(0.0).steer)  # dead ahead
+
+        pose[:] = [98.0, 0.0, 0.0]  # arrived at the first; the second is 90 degrees to the right
+        self.assertEqual(1.0, subject(0.0).steer)
+
+        pose[:] = [98.0, 0.0, 180.0]  # facing away; the second is 90 degrees to the left
+        self.assertEqual(-1.0, subject(0.0).steer)
+
+        pose[:] = [100.0, 99.0, 90.0]
+        self.assertIsNone(subject(0.0))
+
+
+class BotControllerTest(unittest.TestCase):
+    def test_lifecycle(self):
+        sender = Mock()
+
+        subject = BotController(
+            sender=sender,
+            host='127.0.0.1',
+            port=13337,
+            policy=ScriptedPolicy([
+                ScriptStep(duration=0.2, controller_state=_CONTROLLER_STATE),
+                ScriptStep(duration=0.2, controller_state=_CONTROLLER_STATE._replace(steer=0.5)),
+            ])
+        )
+
+        subject.start()
+        self.assertTrue(subject.wait(2.0))
+        time.sleep(0.1)
+        subject.stop()
+
+        sent_controller_states = [deserialize_controller_state(x[1]['data']) for x in sender.send_datagram.call_args_list]
+
+        self.assertEqual(
+            [_CONTROLLER_STATE, _CONTROLLER_STATE._replace(steer=0.5), _STOPPED_CONTROLLER_STATE],
+            [x for i, x in enumerate(sent_controller_states) if i == 0 or x != sent_controller_states[i - 1]]
+        )
@@ -1,8 +1,14 @@
+from typing import Optional
+
 import pygame
 
 from .controller import GamepadController
+from .metrics import MetricsServer
+from .recording import Recorder
 from .screen import Screen, _FPS, _WIDTH, _HEIGHT
-from .udp import Sender, Receiver
+from .telemetry import Telemetry, TelemetryReceiver, is_telemetry
+from .udp import Datagram, Sender, Receiver
+from .viewer import ViewerKeepaliveSender
 
 _CONTROLLER_INDEX = 0
 _QUEUE_SIZE = 2
@@ -17,7 +23,11 @@ class Client(object):
             fps: int = _FPS,
             width: int = _WIDTH,
             height: int = _HEIGHT,
-            queue_size: int = _QUEUE_SIZE):
+            queue_size: int = _QUEUE_SIZE,
+            use_json: bool = False,
+            record_path: Optional[str] = None,
+            hud: bool = False,
+            multicast_group: Optional[str] = None):
         self._host: str = host
         self._controller_port: int = controller_port
         self._screen_port: int = screen_port
@@ -26,6 +36,14 @@ class Client(object):
         self._width: int = width
         self._height: int = height
         self._queue_size: int = queue_size
+        self._use_json: bool = use_json
+        self._record_path: Optional[str] = record_path
+        self._hud: bool = hud
+        self._multicast_group: Optional[str] = multicast_group  # if the server was told to send to a group
+
+        self._recorder: Optional[Recorder] = None
+        if self._record_path is not None:
+            self._recorder = Recorder(self._record_path)
 
         pygame.init()
 
@@ -37,26 +55,51 @@ class Client(object):
             sender=self._sender,
             host=self._host,
             port=self._controller_port,
-            controller_index=self._controller_index
+            controller_index=self._controller_index,
+            use_json=self._use_json,
+            controller_state_callback=self._recorder.record_controller_state if self._recorder is not None else None,
+            raw_controller_state_callback=self._recorder.record_raw_controller_state if self._recorder is not None else None
         )
         self._receiver: Receiver = Receiver(
             port=self._screen_port,
             queue_size=self._queue_size,
-            use_socket_from=self._sender
+            use_socket_from=self._sender,
+            multicast_groups=[self._multicast_group] if self._multicast_group is not None else None
         )
         self._screen: Screen = Screen(
             width=self._width,
             height=self._height
         )
-        self._receiver.set_callback(self._screen.handle_webp_bytes)
+        self._telemetry_receiver: TelemetryReceiver = TelemetryReceiver()
+        self._viewer_keepalive_sender: ViewerKeepaliveSender = ViewerKeepaliveSender(  # so the server keeps streaming
+            sender=self._sender,
+            host=self._host,
+            port=self._controller_port
+        )
+        self._receiver.set_callback(self._handle_datagram)
         self._clock: pygame.time.Clock = pygame.time.Clock()
 
         self._stopped = False
 
+    def _handle_datagram(self, datagram: Datagram):
+        # telemetry shares the socket with the frames, but never the frame path
+        if is_telemetry(datagram.data):
+            self._telemetry_receiver.handle_datagram(datagram)
+            return
+
+        self._screen.handle_webp_bytes(datagram)
+
+    def get_telemetry(self) -> Optional[Telemetry]:
+        return self._telemetry_receiver.get_telemetry()
+
     def start(self):
+        if self._recorder is not None:
+            self._recorder.start()
+
         self._sender.start()
         self._controller.start()
         self._receiver.start()
+        self._viewer_keepalive_sender.start()
 
     def run(self):
         while not self._stopped:
@@ -68,6 +111,9 @@ class Client(object):
 
                     self._controller.handle_event(event)
 
+                if self._hud:
+                    self._screen.set_hud_text(self._get_hud_text())
+
                 self._screen.update()
 
                 self._clock.tick(self._fps)
@@ -75,7 +121,23 @@ class Client(object):
                 self._stopped = True
                 break
 
+    def _get_hud_text(self) -> Optional[str]:
+        telemetry = self.get_telemetry()
+        if telemetry is None:
+            return None
+
+        return '{:.0f} km/h  gear {}{}'.format(
+            telemetry.speed * 3.6,
+            'R' if telemetry.reverse else telemetry.gear,
+            '  collisions {}'.format(telemetry.collisions) if telemetry.collisions > 0 else ''
+        )
+
     def stop(self):
+        try:
+            self._viewer_keepalive_sender.stop()
+        except Exception:
+            pass
+
         try:
             self._receiver.stop()
         except Exception:
@@ -91,6 +153,9 @@ class Client(object):
         except Exception:
             pass
 
+        if self._recorder is not None:
+            self._recorder.stop()
+
 
 def run_client(host: str,
         port: int,
@@ -98,7 +163,17 @@ def run_client(host: str,
         fps: int = _FPS,
         width: int = _WIDTH,
         height: int = _HEIGHT,
-        queue_size: int = _QUEUE_SIZE):
+        queue_size: int = _QUEUE_SIZE,
+        use_json: bool = False,
+        record_path: Optional[str] = None,
+        hud: bool = False,
+        multicast_group: Optional[str] = None,
+        metrics_port: Optional[int] = None):
+    metrics_server = None
+    if metrics_port is not None:
+        metrics_server = MetricsServer(metrics_port)
+        metrics_server.start()
+
     client = Client(
         host=host,
         controller_index=controller_index,
@@ -107,13 +182,20 @@ def run_client(host: str,
         fps=fps,
         width=width,
         height=height,
-        queue_size=queue_size
+        queue_size=queue_size,
+        use_json=use_json,
+        record_path=record_path,
+        hud=hud,
+        multicast_group=multicast_group
     )
 
     client.start()
     client.run()
     client.stop()
 
+    if metrics_server is not None:
+        metrics_server.stop()
+
 
 if __name__ == '__main__':
     import argparse
@@ -127,6 +209,11 @@ if __name__ == '__main__':
     parser.add_argument('--width', type=int, default=_WIDTH)
     parser.add_argument('--height', type=int, default=_HEIGHT)
     parser.add_argument('--queue-size', type=int, default=_QUEUE_SIZE)
+    parser.add_argument('--use-json', action='store_true', default=False)
+    parser.add_argument('--record-path', type=str, default=None)
+    parser.add_argument('--hud', action='store_true', default=False)
+    parser.add_argument('--multicast-group', type=str, default=None)
+    parser.add_argument('--metrics-port', type=int, default=None)  # serve Prometheus metrics on localhost
 
     args = parser.parse_args()
 
@@ -138,4 +225,9 @@ if __name__ == '__main__':
         width=args.width,
         height=args.height,
         queue_size=args.queue_size,
+        use_json=args.use_json,
+        record_path=args.record_path,
+        hud=args.hud,
+        multicast_group=args.multicast_group,
+        metrics_port=args.metrics_port,
     )
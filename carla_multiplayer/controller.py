@@ -1,16 +1,44 @@
 import json
-from queue import Empty
-from typing import Callable, Dict, Tuple, Optional, NamedTuple
+import random
+import struct
+import datetime
+from collections import deque
+from queue import Full
+from threading import Lock
+from typing import Callable, Deque, Dict, List, Tuple, Optional, NamedTuple, Sequence
 
 import pygame
 
 from .looper import TimedLooper
+from .metrics import get_default_registry
 from .udp import Sender
 
-_CONTROL_RATE = 1.0 / 10.0  # 10 Hz
+_CONTROL_RATE = 1.0 / 60.0  # changes are sent immediately but capped at 60 Hz
+_KEEPALIVE_RATE = 1.0 / 4.0  # 4 Hz when idle; needs to be well inside the Vehicle's control expiry
+_REDUNDANCY = 3  # each datagram carries the last 3 states so a single lost datagram doesn't lose an input
 _QUEUE_SIZE = 2
 _FPS = 30
 
+# binary wire format for ControllerState (version 1); 8 bytes instead of ~100 bytes of JSON
+_CONTROLLER_STATE_VERSION = 1
+_CONTROLLER_STATE_STRUCT = struct.Struct('<BBhhh')  # version, flags, throttle, brake, steer
+
+# binary wire format for a sequenced bundle of recent ControllerStates (version 2); 10 bytes + 7 bytes per state
+_CONTROLLER_STATES_VERSION = 2
+_CONTROLLER_STATES_HEADER_STRUCT = struct.Struct('<BBII')  # version, count, epoch, sequence of the newest state
+_CONTROLLER_STATES_ITEM_STRUCT = struct.Struct('<Bhhh')  # flags, throttle, brake, steer (oldest first)
+_MAX_CONTROLLER_STATES = 16
+
+_AXIS_SCALE = 10000  # axes are quantized to 4 decimal places (inputs are rounded to 2)
+_FLAG_HAND_BRAKE = 1 << 0
+_FLAG_REVERSE = 1 << 1
+_FLAG_RESET = 1 << 2
+_FLAGS_MASK = _FLAG_HAND_BRAKE | _FLAG_REVERSE | _FLAG_RESET
+_JSON_PREFIX = b'{'[0]
+
+_SEQUENCE_MODULO = 1 << 32
+_EPOCH_BITS = 32  # picked at random by each Controller, so a restarted (or different) client starts a new stream
+
 
 class ControllerState(NamedTuple):
     throttle: float
@@ -21,6 +49,16 @@ class ControllerState(NamedTuple):
     reset: bool
 
 
+class SequenceNumber(NamedTuple):
+    epoch: int
+    sequence: int
+    previous_epoch: Optional[int] = None  # never sent; kept by filter_unseen_controller_states to spot stragglers
+
+
+def get_epoch() -> int:
+    return random.getrandbits(_EPOCH_BITS)
+
+
 def handle_steer_deadzone(steer) -> float:
     if -0.16 <= steer <= 0.16:
         steer = 0.0
@@ -28,12 +66,184 @@ def handle_steer_deadzone(steer) -> float:
     return steer
 
 
-def deserialize_controller_state(data: bytes) -> ControllerState:
+def _quantize_axis(value: float, minimum: float) -> int:
+    if value < minimum:
+        value = minimum
+    elif value > 1.0:
+        value = 1.0
+
+    return int(round(value * _AXIS_SCALE))
+
+
+def _pack_flags(controller_state: ControllerState) -> int:
+    flags = 0
+    if controller_state.hand_brake:
+        flags |= _FLAG_HAND_BRAKE
+    if controller_state.reverse:
+        flags |= _FLAG_REVERSE
+    if controller_state.reset:
+        flags |= _FLAG_RESET
+
+    return flags
+
+
+def _unpack_controller_state(flags: int, throttle: int, brake: int, steer: int) -> ControllerState:
+    if flags & ~_FLAGS_MASK:
+        raise ValueError('unknown ControllerState flags {}'.format(bin(flags)))
+
+    if not 0 <= throttle <= _AXIS_SCALE or not 0 <= brake <= _AXIS_SCALE or not -_AXIS_SCALE <= steer <= _AXIS_SCALE:
+        raise ValueError('ControllerState axes out of range; throttle={}, brake={}, steer={}'.format(
+            throttle,
+            brake,
+            steer
+        ))
+
+    return ControllerState(
+        throttle=throttle / _AXIS_SCALE,
+        brake=brake / _AXIS_SCALE,
+        steer=steer / _AXIS_SCALE,
+        hand_brake=bool(flags & _FLAG_HAND_BRAKE),
+        reverse=bool(flags & _FLAG_REVERSE),
+        reset=bool(flags & _FLAG_RESET),
+    )
+
+
+def _deserialize_json_controller_state(data: bytes) -> ControllerState:
     return ControllerState(**json.loads(data.decode('utf-8')))
 
 
-def serialize_controller_state(controller_state: ControllerState) -> str:
-    return json.dumps(controller_state._asdict()).encode('utf-8')
+def _deserialize_binary_controller_state(data: bytes) -> ControllerState:
+    if len(data) != _CONTROLLER_STATE_STRUCT.size:
+        raise ValueError('expected {} bytes for binary ControllerState but got {}'.format(
+            _CONTROLLER_STATE_STRUCT.size,
+            len(data)
+        ))
+
+    _, flags, throttle, brake, steer = _CONTROLLER_STATE_STRUCT.unpack_from(data)
+
+    return _unpack_controller_state(flags, throttle, brake, steer)
+
+
+def _deserialize_binary_controller_states(data: bytes) -> Tuple[SequenceNumber, List[ControllerState]]:
+    if len(data) < _CONTROLLER_STATES_HEADER_STRUCT.size:
+        raise ValueError('expected at least {} bytes for binary ControllerStates but got {}'.format(
+            _CONTROLLER_STATES_HEADER_STRUCT.size,
+            len(data)
+        ))
+
+    _, count, epoch, sequence = _CONTROLLER_STATES_HEADER_STRUCT.unpack_from(data)
+
+    expected_length = _CONTROLLER_STATES_HEADER_STRUCT.size + (count * _CONTROLLER_STATES_ITEM_STRUCT.size)
+    if count == 0 or count > _MAX_CONTROLLER_STATES or len(data) != expected_length:
+        raise ValueError('expected {} bytes for {} binary ControllerStates but got {}'.format(
+            expected_length,
+            count,
+            len(data)
+        ))
+
+    controller_states = [
+        _unpack_controller_state(*item)
+        for item in _CONTROLLER_STATES_ITEM_STRUCT.iter_unpack(memoryview(data)[_CONTROLLER_STATES_HEADER_STRUCT.size:])
+    ]
+
+    return SequenceNumber(epoch, sequence), controller_states
+
+
+def deserialize_controller_states(data: bytes) -> Tuple[Optional[SequenceNumber], List[ControllerState]]:
+    if not data:
+        raise ValueError('cannot deserialize ControllerState from empty data')
+
+    version = data[0]
+
+    if version == _CONTROLLER_STATES_VERSION:
+        return _deserialize_binary_controller_states(data)
+
+    if version == _CONTROLLER_STATE_VERSION:
+        return None, [_deserialize_binary_controller_state(data)]
+
+    if version == _JSON_PREFIX:  # older clients send JSON
+        return None, [_deserialize_json_controller_state(data)]
+
+    raise ValueError('unsupported ControllerState version {}'.format(version))
+
+
+def deserialize_controller_state(data: bytes) -> ControllerState:
+    _, controller_states = deserialize_controller_states(data)
+
+    return controller_states[-1]
+
+
+def serialize_controller_state(controller_state: ControllerState, use_json: bool = False) -> bytes:
+    if use_json:
+        return json.dumps(controller_state._asdict()).encode('utf-8')
+
+    return _CONTROLLER_STATE_STRUCT.pack(
+        _CONTROLLER_STATE_VERSION,
+        _pack_flags(controller_state),
+        _quantize_axis(controller_state.throttle, 0.0),
+        _quantize_axis(controller_state.brake, 0.0),
+        _quantize_axis(controller_state.steer, -1.0),
+    )
+
+
+def serialize_controller_states(controller_states: Sequence[ControllerState], sequence: int, epoch: int = 0) -> bytes:
+    if not 0 < len(controller_states) <= _MAX_CONTROLLER_STATES:
+        raise ValueError('expected between 1 and {} ControllerStates but got {}'.format(
+            _MAX_CONTROLLER_STATES,
+            len(controller_states)
+        ))
+
+    data = bytearray(_CONTROLLER_STATES_HEADER_STRUCT.size + (len(controller_states) * _CONTROLLER_STATES_ITEM_STRUCT.size))
+
+    _CONTROLLER_STATES_HEADER_STRUCT.pack_into(
+        data,
+        0,
+        _CONTROLLER_STATES_VERSION,
+        len(controller_states),
+        epoch % (1 << _EPOCH_BITS),
+        sequence % _SEQUENCE_MODULO
+    )
+
+    offset = _CONTROLLER_STATES_HEADER_STRUCT.size
+    for controller_state in controller_states:
+        _CONTROLLER_STATES_ITEM_STRUCT.pack_into(
+            data,
+            offset,
+            _pack_flags(controller_state),
+            _quantize_axis(controller_state.throttle, 0.0),
+            _quantize_axis(controller_state.brake, 0.0),
+            _quantize_axis(controller_state.steer, -1.0),
+        )
+        offset += _CONTROLLER_STATES_ITEM_STRUCT.size
+
+    return bytes(data)
+
+
+def filter_unseen_controller_states(
+        last_sequence: Optional[SequenceNumber],
+        sequence: Optional[SequenceNumber],
+        controller_states: List[ControllerState]) -> Tuple[Optional[SequenceNumber], List[ControllerState], bool]:
+    # the last element is False for a bundle that's behind the stream; it says nothing about the client as it is now
+    if sequence is None:  # unsequenced (older clients); everything is new
+        return last_sequence, controller_states, True
+
+    if last_sequence is None:
+        return sequence, controller_states, True
+
+    if sequence.epoch == last_sequence.previous_epoch:  # still in flight from before the client restarted
+        return last_sequence, [], False
+
+    if sequence.epoch != last_sequence.epoch:  # the client restarted (or changed)
+        return sequence._replace(previous_epoch=last_sequence.epoch), controller_states, True
+
+    delta = (sequence.sequence - last_sequence.sequence) % _SEQUENCE_MODULO
+    if delta == 0:  # duplicate (or keepalive)
+        return last_sequence, [], True
+
+    if delta >= _SEQUENCE_MODULO // 2:  # behind us; reordered
+        return last_sequence, [], False
+
+    return sequence._replace(previous_epoch=last_sequence.previous_epoch), controller_states[-delta:], True
 
 
 class RawControllerState(NamedTuple):
@@ -90,9 +300,10 @@ class ControllerEventHandler(object):
 
 
 class _GamepadController(object):
-    def __init__(self, controller_index: int, callback: Callable):
+    def __init__(self, controller_index: int, callback: Callable, raw_callback: Optional[Callable] = None):
         self._controller_index: int = controller_index
         self._callback: Callable = callback
+        self._raw_callback: Optional[Callable] = raw_callback
 
         pygame.joystick.init()
 
@@ -106,6 +317,9 @@ class _GamepadController(object):
         self._last_controller_state: Optional[ControllerState] = None
 
     def _callback_wrapper(self, raw_controller_state: RawControllerState):
+        if self._raw_callback is not None:
+            self._raw_callback(raw_controller_state)
+
         controller_state = self._handle_callback(raw_controller_state)
         if controller_state == self._last_controller_state:
             return
@@ -161,8 +375,16 @@ class _GamepadController(object):
         self._handler.handle_event(event)
 
 
-class GamepadController(TimedLooper):
-    def __init__(self, sender: Sender, host: str, port: int, controller_index: int, rate=_CONTROL_RATE):
+class Controller(TimedLooper):
+    def __init__(self,
+            sender: Sender,
+            host: str,
+            port: int,
+            rate: float = _CONTROL_RATE,
+            use_json: bool = False,
+            keepalive_rate: float = _KEEPALIVE_RATE,
+            redundancy: int = _REDUNDANCY,
+            controller_state_callback: Optional[Callable] = None):
         super().__init__(
             period=rate
         )
@@ -170,27 +392,115 @@ class GamepadController(TimedLooper):
         self._sender: Sender = sender
         self._host: str = host
         self._port: int = port
-        self._gamepad_controller = _GamepadController(
-            controller_index=controller_index,
-            callback=self._set_controller_state
-        )
-
-        self._controller_state: Optional[ControllerState] = None
+        self._rate: float = rate
+        self._use_json: bool = use_json
+        self._keepalive_rate: float = keepalive_rate
+        self._redundancy: int = redundancy
+        self._controller_state_callback: Optional[Callable] = controller_state_callback
+
+        self._rate_delta = datetime.timedelta(seconds=self._rate)
+        self._keepalive_rate_delta = datetime.timedelta(seconds=self._keepalive_rate)
+
+        self._lock: Lock = Lock()
+        self._controller_states: Deque[ControllerState] = deque(maxlen=self._redundancy)
+        self._epoch: int = get_epoch()
+        self._sequence: int = 0
+        self._pending: bool = False
+        self._last_sent: Optional[datetime.datetime] = None
+
+        registry = get_default_registry()
+        self._sent_metric = registry.counter('controller_datagrams_sent_total', 'Controller datagrams queued for sending').labels()
+        self._keepalives_metric = registry.counter(
+            'controller_keepalives_sent_total', 'Controller datagrams sent with no new controller state in them'
+        ).labels()
+        self._dropped_metric = registry.counter(
+            'controller_datagrams_dropped_total', 'Controller datagrams thrown away as the send queue was full'
+        ).labels()
 
     def _set_controller_state(self, controller_state: Optional[ControllerState]):
-        self._controller_state = controller_state
-
-    def _work(self):
-        if self._controller_state is None:
+        if controller_state is None:
             return
 
+        if self._controller_state_callback is not None:
+            self._controller_state_callback(controller_state)
+
+        with self._lock:
+            self._controller_states.append(controller_state)
+            self._sequence += 1
+            self._pending = True
+
+        self._send_controller_states()
+
+    def _send_controller_states(self):
+        with self._lock:
+            if len(self._controller_states) == 0:
+                return
+
+            now = datetime.datetime.now()
+
+            if self._last_sent is not None:
+                since_last_sent = now - self._last_sent
+
+                if self._pending:
+                    if since_last_sent < self._rate_delta:  # rate cap; the loop will send it shortly
+                        return
+                elif since_last_sent < self._keepalive_rate_delta:
+                    return
+
+            if self._use_json:
+                data = serialize_controller_state(self._controller_states[-1], use_json=True)
+            else:
+                data = serialize_controller_states(self._controller_states, self._sequence, self._epoch)
+
+            keepalive = not self._pending
+            self._pending = False
+            self._last_sent = now
+
         try:
             self._sender.send_datagram(
-                data=serialize_controller_state(self._controller_state),
+                data=data,
                 address=(self._host, self._port)
             )
-        except Empty:
-            pass
+        except Full:
+            self._dropped_metric.inc()
+            return
+
+        self._sent_metric.inc()
+        if keepalive:
+            self._keepalives_metric.inc()
+
+    def _work(self):
+        self._send_controller_states()
+
+
+class GamepadController(Controller):
+    def __init__(self,
+            sender: Sender,
+            host: str,
+            port: int,
+            controller_index: int,
+            rate: float = _CONTROL_RATE,
+            use_json: bool = False,
+            keepalive_rate: float = _KEEPALIVE_RATE,
+            redundancy: int = _REDUNDANCY,
+            controller_state_callback: Optional[Callable] = None,
+            raw_controller_state_callback: Optional[Callable] = None):
+        super().__init__(
+            sender=sender,
+            host=host,
+            port=port,
+            rate=rate,
+            use_json=use_json,
+            keepalive_rate=keepalive_rate,
+            redundancy=redundancy,
+            controller_state_callback=controller_state_callback
+        )
+
+        self._gamepad_controller = _GamepadController(
+            controller_index=controller_index,
+            callback=self._set_controller_state,
+            raw_callback=raw_controller_state_callback
+        )
 
     def handle_event(self, event: pygame.event.EventType):
         self._gamepad_controller.handle_event(event)
@@ -206,6 +516,7 @@ if __name__ == '__main__':
     parser.add_argument('--controller-index', type=int, default=0)
     parser.add_argument('--queue-size', type=int, default=_QUEUE_SIZE)
     parser.add_argument('--fps', type=int, default=_FPS)
+    parser.add_argument('--use-json', action='store_true', default=False)
 
     args = parser.parse_args()
 
@@ -218,7 +529,8 @@ if __name__ == '__main__':
         sender=_sender,
         host=args.host,
         port=args.port,
-        controller_index=args.controller_index
+        controller_index=args.controller_index,
+        use_json=args.use_json
     )
     _controller.start()
 
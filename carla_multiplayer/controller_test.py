@@ -1,5 +1,170 @@
+import json
 import unittest
 
+from .controller import ControllerState, serialize_controller_state, deserialize_controller_state, serialize_controller_states, \
+    deserialize_controller_states, filter_unseen_controller_states, SequenceNumber
+
+_CONTROLLER_STATE = ControllerState(
+    throttle=0.75,
+    brake=0.12,
+    steer=-0.33,
+    hand_brake=True,
+    reverse=False,
+    reset=True,
+)
+
+
+class ControllerStateSerializationTest(unittest.TestCase):
+    def test_binary_round_trip(self):
+        data = serialize_controller_state(_CONTROLLER_STATE)
+
+        self.assertEqual(8, len(data))
+        self.assertEqual(_CONTROLLER_STATE, deserialize_controller_state(data))
+
+    def test_binary_clamps_axes(self):
+        data = serialize_controller_state(
+            ControllerState(throttle=1.5, brake=-0.5, steer=-2.0, hand_brake=False, reverse=True, reset=False)
+        )
+
+        self.assertEqual(
+            ControllerState(throttle=1.0, brake=0.0, steer=-1.0, hand_brake=False, reverse=True, reset=False),
+            deserialize_controller_state(data)
+        )
+
+    def test_json_round_trip(self):
+        data = serialize_controller_state(_CONTROLLER_STATE, use_json=True)
+
+        self.assertEqual(_CONTROLLER_STATE._asdict(), json.loads(data.decode('utf-8')))
+        self.assertEqual(_CONTROLLER_STATE, deserialize_controller_state(data))
+
+    def test_binary_rejects_invalid_data(self):
+        data = serialize_controller_state(_CONTROLLER_STATE)
+
+        for invalid_data in [
+            b'',
+            data[:-1],
+            data + b'\x00',
+            b'\x03' + data[1:],  # unknown version
+            data[:1] + b'\x80' + data[2:],  # unknown flags
+            data[:2] + b'\xff\xff' + data[4:],  # negative throttle
+        ]:
+            with self.assertRaises(ValueError):
+                deserialize_controller_state(invalid_data)
+
+    def test_bundle_round_trip(self):
+        controller_states = [
+            _CONTROLLER_STATE._replace(throttle=0.25),
+            _CONTROLLER_STATE._replace(throttle=0.5),
+            _CONTROLLER_STATE,
+        ]
+
+        data = serialize_controller_states(controller_states, 1337, 7)
+
+        self.assertEqual(10 + (3 * 7), len(data))
+        self.assertEqual((SequenceNumber(7, 1337), controller_states), deserialize_controller_states(data))
+        self.assertEqual(_CONTROLLER_STATE, deserialize_controller_state(data))
+
+    def test_bundle_rejects_invalid_data(self):
+        data = serialize_controller_states([_CONTROLLER_STATE, _CONTROLLER_STATE], 1)
+
+        for invalid_data in [
+            data[:5],
+            data[:-1],
+            data[:1] + b'\x03' + data[2:],  # count doesn't match length
+            data[:1] + b'\x00' + data[2:6],  # empty
+        ]:
+            with self.assertRaises(ValueError):
+                deserialize_controller_states(invalid_data)
+
+    def test_older_formats_are_unsequenced(self):
+        for data in [serialize_controller_state(_CONTROLLER_STATE), serialize_controller_state(_CONTROLLER_STATE, use_json=True)]:
+            self.assertEqual((None, [_CONTROLLER_STATE]), deserialize_controller_states(data))
+
+
+class FilterUnseenControllerStatesTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.controller_states = [
+            _CONTROLLER_STATE._replace(throttle=0.25),
+            _CONTROLLER_STATE._replace(throttle=0.5),
+            _CONTROLLER_STATE,
+        ]
+
+    def test_first(self):
+        self.assertEqual(
+            (SequenceNumber(1, 10), self.controller_states, True),
+            filter_unseen_controller_states(None, SequenceNumber(1, 10), self.controller_states)
+        )
+
+    def test_unsequenced(self):
+        self.assertEqual(
+            (SequenceNumber(1, 10), self.controller_states, True),
+            filter_unseen_controller_states(SequenceNumber(1, 10), None, self.controller_states)
+        )
+
+    def test_duplicate(self):
+        self.assertEqual(
+            (SequenceNumber(1, 10), [], True),
+            filter_unseen_controller_states(SequenceNumber(1, 10), SequenceNumber(1, 10), self.controller_states)
+        )
+
+    def test_one_lost(self):
+        self.assertEqual(
+            (SequenceNumber(1, 12), self.controller_states[1:], True),
+            filter_unseen_controller_states(SequenceNumber(1, 10), SequenceNumber(1, 12), self.controller_states)
+        )
+
+    def test_many_lost(self):
+        self.assertEqual(
+            (SequenceNumber(1, 20), self.controller_states, True),
+            filter_unseen_controller_states(SequenceNumber(1, 10), SequenceNumber(1, 20), self.controller_states)
+        )
+
+    def test_reordered(self):
+        self.assertEqual(
+            (SequenceNumber(1, 10), [], False),
+            filter_unseen_controller_states(SequenceNumber(1, 10), SequenceNumber(1, 9), self.controller_states)
+        )
+
+    def test_far_behind_is_still_reordered(self):
+        self.assertEqual(
+            (SequenceNumber(1, 100000), [], False),
+            filter_unseen_controller_states(SequenceNumber(1, 100000), SequenceNumber(1, 3), self.controller_states)
+        )
+
+    def test_wrapped(self):
+        self.assertEqual(
+            (SequenceNumber(1, 1), self.controller_states[1:], True),
+            filter_unseen_controller_states(SequenceNumber(1, (1 << 32) - 1), SequenceNumber(1, 1), self.controller_states)
+        )
+
+    def test_restarted(self):
+        self.assertEqual(
+            (SequenceNumber(2, 3, previous_epoch=1), self.controller_states, True),
+            filter_unseen_controller_states(SequenceNumber(1, 100000), SequenceNumber(2, 3), self.controller_states)
+        )
+
+    def test_restarted_within_what_looks_like_reordering(self):
+        self.assertEqual(
+            (SequenceNumber(2, 1, previous_epoch=1), self.controller_states, True),
+            filter_unseen_controller_states(SequenceNumber(1, 500), SequenceNumber(2, 1), self.controller_states)
+        )
+
+    def test_late_from_before_restart(self):
+        last_sequence, _, _ = filter_unseen_controller_states(
+            SequenceNumber(1, 500),
+            SequenceNumber(2, 1),
+            self.controller_states
+        )
+
+        self.assertEqual(
+            (last_sequence, [], False),  # still on the new stream
+            filter_unseen_controller_states(last_sequence, SequenceNumber(1, 499), self.controller_states)
+        )
+
+        last_sequence, _, _ = filter_unseen_controller_states(last_sequence, SequenceNumber(2, 2), self.controller_states)
+
+        self.assertEqual(SequenceNumber(2, 2, previous_epoch=1), last_sequence)  # remembered as the stream advances
+
 
 class ControllerTest(unittest.TestCase):
     pass  # TODO: pygame makes testing hard
@@ -1,38 +1,469 @@
-from typing import Dict
+import datetime
+import os
+import subprocess
+import sys
+from threading import Lock
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
 from uuid import UUID, uuid4
 
 import Pyro4
+import Pyro4.errors
+import Pyro4.util
+
+from .looper import TimedLooper
+
+try:  # cater for python3 -m (module) vs python3 (file)
+    from . import wrapped_carla as carla
+except ImportError:
+    import wrapped_carla as carla
 
 _START_PORT = 13337
+_PYRO_PORT = 9090
+_OBJECT_ID = 'carla_multiplayer.coordinator'
+_SESSIONS_PER_HOST = 16
+_SESSIONS_PER_SERVER = 8
+_TARGET_FPS = 30.0
+_REPORT_RATE = 1.0  # 1 Hz
+_REPORT_EXPIRE = datetime.timedelta(seconds=5)  # after which a host's fps and CPU are treated as unknown
+_CARLA_PORT = 2000
+_VEHICLE_BLUEPRINT_NAME = 'vehicle.tesla.model3'
+_SERIALIZER = 'pickle'  # the only one that can carry Client objects; the plain-data calls work with any of them
+_SERIALIZERS = ['pickle', 'marshal', 'msgpack', 'serpent', 'json']
+
+
+def get_available_serializers() -> List[str]:
+    available = []
+    for serializer in _SERIALIZERS:
+        try:
+            Pyro4.util.get_serializer(serializer)
+        except Pyro4.errors.SerializeError:  # e.g. msgpack not installed
+            continue
+
+        available += [serializer]
+
+    return available
+
+
+def configure_serializer(serializer: str = _SERIALIZER):
+    if serializer not in get_available_serializers():
+        raise ValueError('serializer {} not one of the available {}'.format(
+            repr(serializer),
+            get_available_serializers()
+        ))
+
+    Pyro4.config.SERIALIZER = serializer  # what our proxies send with
+    Pyro4.config.SERIALIZERS_ACCEPTED = set(get_available_serializers())  # what our daemons answer; the caller picks
+
+
+configure_serializer()
+
+ClientAddress = Tuple[str, Optional[str], Optional[int]]  # uuid, server host, port; plain data for any serializer
+
+
+def _to_uuid(value: Union[UUID, str]) -> UUID:  # UUIDs arrive as strings over anything but pickle
+    return value if isinstance(value, UUID) else UUID(value)
+
+
+class ServerSpec(NamedTuple):
+    carla_host: str
+    carla_port: int
+    port: int
+    max_sessions: int
+
+
+Launcher = Callable[[ServerSpec], subprocess.Popen]  # or anything else with poll() and terminate()
+
+
+def launch_server_process(spec: ServerSpec, vehicle_blueprint_name: str = _VEHICLE_BLUEPRINT_NAME) -> subprocess.Popen:
+    return subprocess.Popen([
+        sys.executable, '-m', 'carla_multiplayer.multiplayer',
+        '--port', str(spec.port),
+        '--vehicle-blueprint-name', vehicle_blueprint_name,
+        '--carla-host', spec.carla_host,
+        '--carla-port', str(spec.carla_port),
+        '--max-sessions', str(spec.max_sessions),
+    ])
+
+
+class HostLoad(NamedTuple):
+    host_id: UUID
+    carla_host: str
+    sessions: int
+    capacity: int
+    fps: Optional[float]  # as last reported; None if never reported or expired
+    cpu: Optional[float]  # 0.0 - 1.0
+    load: float  # the most constrained of sessions / capacity, cpu and fps shortfall
+
+
+class _Host(object):
+    def __init__(self, host_id: UUID, carla_host: str, carla_port: int, capacity: int):
+        self.host_id: UUID = host_id
+        self.carla_host: str = carla_host
+        self.carla_port: int = carla_port
+        self.capacity: int = capacity
+
+        self.fps: Optional[float] = None
+        self.cpu: Optional[float] = None
+        self.last_report: Optional[datetime.datetime] = None
 
-Pyro4.config.SERIALIZERS_ACCEPTED = ['pickle']
-Pyro4.config.SERIALIZER = 'pickle'
+
+class _ServerProcess(object):
+    def __init__(self, host_id: UUID, port: int, process: subprocess.Popen):
+        self.host_id: UUID = host_id
+        self.port: int = port
+        self.process: subprocess.Popen = process
+
+        self.sessions: List[UUID] = []
 
 
 @Pyro4.expose
 class Client(object):
-    def __init__(self, uuid: UUID):
+    def __init__(self, uuid: UUID, server_host: Optional[str] = None, port: Optional[int] = None):
         self._uuid: UUID = uuid
+        self._server_host: Optional[str] = server_host
+        self._port: Optional[int] = port
 
     def get_uuid(self) -> UUID:
         return self._uuid
 
+    def get_address(self) -> Tuple[str, int]:  # where to send controls to (and receive frames from)
+        return self._server_host, self._port
 
-@Pyro4.expose
-class Server(object):
-    def __init__(self, start_port: int = _START_PORT):
+
+class Server(object):  # exposed method by method, so stop() isn't for anyone who has the URI
+    def __init__(self,
+            start_port: int = _START_PORT,
+            public_host: str = '127.0.0.1',
+            sessions_per_server: int = _SESSIONS_PER_SERVER,
+            target_fps: float = _TARGET_FPS,
+            launcher: Optional[Launcher] = None):
         self._start_port: int = start_port
+        self._public_host: str = public_host  # where clients can reach the server processes we launch
+        self._sessions_per_server: int = sessions_per_server
+        self._target_fps: float = target_fps
+        self._launcher: Launcher = launcher if launcher is not None else launch_server_process
 
+        self._lock: Lock = Lock()
         self._clients_by_uuid: Dict[UUID, Client] = {}
+        self._hosts_by_id: Dict[UUID, _Host] = {}
+        self._server_processes_by_port: Dict[int, _ServerProcess] = {}
+        self._server_processes_by_client_uuid: Dict[UUID, _ServerProcess] = {}
+
+    @Pyro4.expose
+    def register_host(self, carla_host: str, carla_port: int = _CARLA_PORT, capacity: int = _SESSIONS_PER_HOST) -> UUID:
+        host_id = uuid4()
+
+        with self._lock:
+            self._hosts_by_id[host_id] = _Host(host_id, carla_host, carla_port, capacity)
+
+        return host_id
+
+    @Pyro4.expose
+    def unregister_host(self, host_id: UUID):
+        host_id = _to_uuid(host_id)
+
+        with self._lock:
+            host = self._hosts_by_id.pop(host_id, None)
+            if host is None:
+                raise ValueError('could not find host for {}'.format(host_id))
+
+            server_processes = [x for x in self._server_processes_by_port.values() if x.host_id == host_id]
+            for server_process in server_processes:
+                self._forget_server_process(server_process)
+
+        for server_process in server_processes:
+            server_process.process.terminate()
+
+    def _report_load(self, host_id: UUID, fps: Optional[float], cpu: Optional[float], now: datetime.datetime):
+        host = self._hosts_by_id.get(_to_uuid(host_id))
+        if host is None:
+            raise ValueError('could not find host for {}'.format(host_id))
+
+        host.fps = fps
+        host.cpu = cpu
+        host.last_report = now
+
+    @Pyro4.expose
+    @Pyro4.oneway  # a heartbeat; the reporter doesn't need to wait for it
+    def report_load(self, host_id: UUID, fps: Optional[float], cpu: Optional[float]):
+        with self._lock:
+            self._report_load(host_id, fps, cpu, datetime.datetime.now())
+
+    @Pyro4.expose
+    @Pyro4.oneway
+    def report_loads(self, reports: List[Tuple[UUID, Optional[float], Optional[float]]]):
+        now = datetime.datetime.now()
+
+        with self._lock:
+            for host_id, fps, cpu in reports:
+                try:
+                    self._report_load(host_id, fps, cpu, now)
+                except ValueError:  # unregistered since; nobody is waiting to be told
+                    continue
+
+    def _get_host_load(self, host: _Host, now: datetime.datetime) -> HostLoad:
+        sessions = sum(len(x.sessions) for x in self._server_processes_by_port.values() if x.host_id == host.host_id)
+
+        fps, cpu = None, None
+        if host.last_report is not None and now - host.last_report < _REPORT_EXPIRE:
+            fps, cpu = host.fps, host.cpu
+
+        load = sessions / host.capacity if host.capacity > 0 else 1.0
+        if cpu is not None:
+            load = max(load, cpu)
+        if fps is not None:
+            load = max(load, 1.0 - (min(fps, self._target_fps) / self._target_fps))
+
+        return HostLoad(
+            host_id=host.host_id,
+            carla_host=host.carla_host,
+            sessions=sessions,
+            capacity=host.capacity,
+            fps=fps,
+            cpu=cpu,
+            load=load,
+        )
+
+    @Pyro4.expose
+    def get_hosts(self) -> List[HostLoad]:
+        now = datetime.datetime.now()
+
+        with self._lock:
+            self._reap_server_processes()
+
+            return [self._get_host_load(x, now) for x in self._hosts_by_id.values()]
+
+    def _allocate_port(self) -> int:
+        port = self._start_port
+        while port in self._server_processes_by_port:
+            port += 1
+
+        return port
 
-    def register_client(self):
+    def _reap_server_processes(self):
+        for server_process in list(self._server_processes_by_port.values()):
+            if server_process.process.poll() is not None:  # exited; its sessions went with it
+                self._forget_server_process(server_process)
+
+    def _forget_server_process(self, server_process: _ServerProcess):
+        self._server_processes_by_port.pop(server_process.port, None)
+
+        for uuid in server_process.sessions:
+            self._server_processes_by_client_uuid.pop(uuid, None)
+
+    def _place(self, uuid: UUID) -> _ServerProcess:
+        now = datetime.datetime.now()
+
+        self._reap_server_processes()
+
+        candidates = [
+            (self._get_host_load(host, now), host) for host in self._hosts_by_id.values()
+        ]
+        candidates = [(load, host) for load, host in candidates if load.sessions < load.capacity and load.load < 1.0]
+        if len(candidates) == 0:
+            raise ValueError('no capacity for another session across {} hosts'.format(len(self._hosts_by_id)))
+
+        _, host = min(candidates, key=lambda x: (x[0].load, x[0].sessions))
+
+        # reuse a running server process for that host if it has room (fullest first, to leave others free to go idle)
+        server_processes = [
+            x for x in self._server_processes_by_port.values()
+            if x.host_id == host.host_id and len(x.sessions) < self._sessions_per_server
+        ]
+
+        if len(server_processes) > 0:
+            server_process = max(server_processes, key=lambda x: len(x.sessions))
+        else:
+            port = self._allocate_port()
+            server_process = _ServerProcess(
+                host_id=host.host_id,
+                port=port,
+                process=self._launcher(ServerSpec(
+                    carla_host=host.carla_host,
+                    carla_port=host.carla_port,
+                    port=port,
+                    max_sessions=self._sessions_per_server,
+                ))
+            )
+            self._server_processes_by_port[port] = server_process
+
+        server_process.sessions += [uuid]
+        self._server_processes_by_client_uuid[uuid] = server_process
+
+        return server_process
+
+    @Pyro4.expose
+    def register_client(self) -> Client:
         uuid = uuid4()
-        client = Client(uuid=uuid)
-        self._clients_by_uuid[uuid] = client
+
+        with self._lock:
+            server_process = None
+            if len(self._hosts_by_id) > 0:
+                server_process = self._place(uuid)
+
+            client = Client(
+                uuid=uuid,
+                server_host=self._public_host if server_process is not None else None,
+                port=server_process.port if server_process is not None else None
+            )
+            self._clients_by_uuid[uuid] = client
 
         return client
 
-    def unregister_client(self, uuid: UUID):
+    @Pyro4.expose
+    def register_clients(self, count: int = 1) -> List[ClientAddress]:  # many in one round trip, as plain data
+        clients = []
+        for _ in range(0, count):
+            try:
+                clients += [self.register_client()]
+            except ValueError:  # out of capacity; the rest would be too
+                break
+
+        return [(str(x.get_uuid()),) + x.get_address() for x in clients]
+
+    def _unregister_client(self, uuid: UUID):
         client = self._clients_by_uuid.pop(uuid, None)
         if client is None:
             raise ValueError('could not find Client for {}'.format(uuid))
+
+        server_process = self._server_processes_by_client_uuid.pop(uuid, None)
+        if server_process is not None:  # left running (idle) to be reused by the next client placed on that host
+            server_process.sessions = [x for x in server_process.sessions if x != uuid]
+
+    @Pyro4.expose
+    def unregister_client(self, uuid: UUID):
+        with self._lock:
+            self._unregister_client(_to_uuid(uuid))
+
+    @Pyro4.expose
+    @Pyro4.oneway
+    def unregister_clients(self, uuids: List[UUID]):
+        with self._lock:
+            for uuid in uuids:
+                try:
+                    self._unregister_client(_to_uuid(uuid))
+                except ValueError:  # already gone
+                    continue
+
+    @Pyro4.expose
+    def get_status(self) -> Dict[str, Any]:  # one round trip for everything a dashboard polls, as plain data
+        now = datetime.datetime.now()
+
+        with self._lock:
+            self._reap_server_processes()
+
+            return {
+                'clients': len(self._clients_by_uuid),
+                'server_processes': len(self._server_processes_by_port),
+                'hosts': [
+                    (str(x.host_id),) + tuple(x)[1:] for x in (self._get_host_load(y, now) for y in self._hosts_by_id.values())
+                ],
+            }
+
+    def stop(self):
+        with self._lock:
+            server_processes = list(self._server_processes_by_port.values())
+            for server_process in server_processes:
+                self._forget_server_process(server_process)
+
+        for server_process in server_processes:
+            server_process.process.terminate()
+
+
+def get_cpu() -> Optional[float]:
+    try:
+        return min(1.0, os.getloadavg()[0] / (os.cpu_count() or 1))
+    except (AttributeError, OSError):  # not on Windows
+        return None
+
+
+class LoadReporter(TimedLooper):
+    def __init__(self, coordinator: Server, host_id: UUID, client: carla.Client, rate: float = _REPORT_RATE):
+        super().__init__(
+            period=rate
+        )
+
+        self._coordinator: Server = coordinator
+        self._host_id: UUID = host_id
+        self._client: carla.Client = client
+
+    def _get_fps(self) -> Optional[float]:
+        delta_seconds = self._client.get_world().wait_for_tick().timestamp.delta_seconds
+        if not delta_seconds:
+            return None
+
+        return 1.0 / delta_seconds
+
+    def _before_loop(self):
+        if hasattr(self._coordinator, '_pyroClaimOwnership'):  # Pyro4 proxies belong to the thread that made them
+            self._coordinator._pyroClaimOwnership()
+
+    def _work(self):
+        self._coordinator.report_load(self._host_id, self._get_fps(), get_cpu())
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command')
+
+    serve_parser = subparsers.add_parser('serve')
+    serve_parser.add_argument('--host', type=str, default='0.0.0.0')
+    serve_parser.add_argument('--port', type=int, default=_PYRO_PORT)
+    serve_parser.add_argument('--public-host', type=str, required=True)
+    serve_parser.add_argument('--start-port', type=int, default=_START_PORT)
+    serve_parser.add_argument('--sessions-per-server', type=int, default=_SESSIONS_PER_SERVER)
+    serve_parser.add_argument('--target-fps', type=float, default=_TARGET_FPS)
+
+    report_parser = subparsers.add_parser('report')
+    report_parser.add_argument('--uri', type=str, required=True)
+    report_parser.add_argument('--carla-host', type=str, required=True)
+    report_parser.add_argument('--carla-port', type=int, default=_CARLA_PORT)
+    report_parser.add_argument('--capacity', type=int, default=_SESSIONS_PER_HOST)
+    report_parser.add_argument('--rate', type=float, default=_REPORT_RATE)
+    report_parser.add_argument('--serializer', type=str, default=_SERIALIZER, choices=get_available_serializers())
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        _server = Server(
+            start_port=args.start_port,
+            public_host=args.public_host,
+            sessions_per_server=args.sessions_per_server,
+            target_fps=args.target_fps
+        )
+
+        _daemon = Pyro4.Daemon(host=args.host, port=args.port)
+        print(_daemon.register(_server, objectId=_OBJECT_ID))
+
+        try:
+            _daemon.requestLoop()
+        except KeyboardInterrupt:
+            pass
+
+        _daemon.shutdown()
+        _server.stop()
+    elif args.command == 'report':
+        configure_serializer(args.serializer)  # the coordinator answers in whichever we send with
+
+        _coordinator = Pyro4.Proxy(args.uri)
+        _host_id = _coordinator.register_host(args.carla_host, args.carla_port, args.capacity)
+
+        _client = carla.Client(args.carla_host, args.carla_port)
+        _client.set_timeout(2.0)
+
+        _reporter = LoadReporter(_coordinator, _host_id, _client, args.rate)
+        _reporter.start()
+
+        while 1:
+            try:
+                time.sleep(1)
+            except KeyboardInterrupt:
+                break
+
+        _reporter.stop()
+        _coordinator.unregister_host(_host_id)
+    else:
+        parser.print_help()
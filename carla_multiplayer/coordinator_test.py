@@ -1,6 +1,189 @@
+import time
 import unittest
+from threading import Thread
+
+import Pyro4
+from mock import Mock, call
+
+from .coordinator import Server, ServerSpec, LoadReporter, configure_serializer, get_available_serializers
 
 
 class CoordinatorTest(unittest.TestCase):
     def setUp(self):
-        pass
+        self.launcher = Mock(side_effect=lambda spec: Mock(**{'poll.return_value': None}))
+
+        self.subject = Server(
+            start_port=13337,
+            public_host='10.0.0.1',
+            sessions_per_server=2,
+            launcher=self.launcher
+        )
+
+    def test_register_client_without_hosts(self):
+        client = self.subject.register_client()
+
+        self.assertEqual((None, None), client.get_address())
+
+        self.subject.unregister_client(client.get_uuid())
+
+        with self.assertRaises(ValueError):
+            self.subject.unregister_client(client.get_uuid())
+
+    def test_spawn_and_reuse(self):
+        self.subject.register_host('carla-1', capacity=4)
+
+        clients = [self.subject.register_client() for _ in range(0, 3)]
+
+        self.assertEqual(
+            [('10.0.0.1', 13337), ('10.0.0.1', 13337), ('10.0.0.1', 13338)],
+            [x.get_address() for x in clients]
+        )
+        self.assertEqual(
+            [call(ServerSpec('carla-1', 2000, 13337, 2)), call(ServerSpec('carla-1', 2000, 13338, 2))],
+            self.launcher.call_args_list
+        )
+
+        self.subject.unregister_client(clients[0].get_uuid())
+
+        self.assertEqual(('10.0.0.1', 13337), self.subject.register_client().get_address())  # reused, not respawned
+        self.assertEqual(2, self.launcher.call_count)
+
+        self.subject.register_client()
+
+        with self.assertRaises(ValueError):  # host capacity
+            self.subject.register_client()
+
+    def test_least_loaded(self):
+        host_1 = self.subject.register_host('carla-1')
+        host_2 = self.subject.register_host('carla-2')
+
+        self.subject.report_load(host_1, fps=15.0, cpu=0.2)  # struggling
+        self.subject.report_load(host_2, fps=30.0, cpu=0.3)
+
+        self.subject.register_client()
+
+        self.assertEqual('carla-2', self.launcher.call_args[0][0].carla_host)
+
+        loads = {x.carla_host: x for x in self.subject.get_hosts()}
+        self.assertEqual(0.5, loads['carla-1'].load)
+        self.assertEqual(1, loads['carla-2'].sessions)
+
+        self.subject.report_load(host_2, fps=3.0, cpu=1.0)  # now full
+
+        self.subject.register_client()
+
+        self.assertEqual('carla-1', self.launcher.call_args[0][0].carla_host)
+
+    def test_dead_server_process(self):
+        self.subject.register_host('carla-1')
+
+        client = self.subject.register_client()
+        process = self.subject._server_processes_by_port[13337].process
+        process.poll.return_value = 1
+
+        self.subject.register_client()
+
+        self.assertEqual(2, self.launcher.call_count)
+        self.assertEqual(13337, self.launcher.call_args[0][0].port)  # port freed up
+
+        self.subject.unregister_client(client.get_uuid())
+
+    def test_unregister_host_and_stop(self):
+        host_1 = self.subject.register_host('carla-1')
+        self.subject.register_host('carla-2')
+
+        self.subject.register_client()
+        self.subject.register_client()
+
+        processes = [x.process for x in self.subject._server_processes_by_port.values()]
+        self.subject.unregister_host(host_1)
+        self.subject.stop()
+
+        for process in processes:
+            process.terminate.assert_called_once_with()
+
+        self.assertEqual([], [x for x in self.subject.get_hosts() if x.sessions > 0])
+
+    def test_batched_plain_data(self):
+        host_id = self.subject.register_host('carla-1', capacity=3)
+
+        clients = self.subject.register_clients(4)  # stops short at capacity rather than failing the lot
+
+        self.assertEqual([('10.0.0.1', 13337), ('10.0.0.1', 13337), ('10.0.0.1', 13338)], [x[1:] for x in clients])
+        self.assertTrue(all(isinstance(x[0], str) for x in clients))
+
+        self.subject.report_loads([(str(host_id), 30.0, 0.5), ('00000000-0000-0000-0000-000000000000', 1.0, 1.0)])
+        self.subject.unregister_clients([clients[0][0], clients[0][0]])
+
+        status = self.subject.get_status()
+
+        self.assertEqual(2, status['clients'])
+        self.assertEqual(2, status['server_processes'])
+        self.assertEqual([(str(host_id), 'carla-1', 2, 3, 30.0, 0.5, 2 / 3)], status['hosts'])
+
+    def test_configure_serializer(self):
+        with self.assertRaises(ValueError):
+            configure_serializer('yaml')
+
+        self.assertEqual(['pickle', 'marshal'], get_available_serializers()[:2])
+
+
+class CoordinatorOverPyroTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = Server(launcher=Mock(side_effect=lambda spec: Mock(**{'poll.return_value': None})))
+        self.daemon = Pyro4.Daemon(host='127.0.0.1', port=0)
+        self.uri = self.daemon.register(self.server)
+
+        self.thread = Thread(target=self.daemon.requestLoop)
+        self.thread.start()
+
+    def tearDown(self) -> None:
+        self.daemon.shutdown()
+        self.thread.join()
+        self.daemon.close()
+
+    def test_plain_data_serializers(self):
+        host_id = self.server.register_host('carla-1')
+
+        for serializer in ['marshal', 'serpent', 'json']:
+            with Pyro4.Proxy(self.uri) as proxy:
+                proxy._pyroSerializer = serializer
+
+                uuid, host, port = proxy.register_clients(1)[0]
+                proxy.report_load(str(host_id), 30.0, 0.1)
+                proxy.unregister_clients([uuid])
+
+                self.assertEqual(('127.0.0.1', 13337), (host, port))
+
+                for _ in range(0, 100):  # oneways are handled in their own thread
+                    if proxy.get_status()['clients'] == 0:
+                        break
+
+                    time.sleep(0.01)
+
+                self.assertEqual(0, proxy.get_status()['clients'])
+
+    def test_stop_not_exposed(self):
+        self.server.register_host('carla-1')
+        self.server.register_clients(1)
+
+        with Pyro4.Proxy(self.uri) as proxy:
+            with self.assertRaises(AttributeError):
+                proxy.stop()
+
+        self.assertEqual(1, len(self.server._server_processes_by_port))  # still running
+
+
+class LoadReporterTest(unittest.TestCase):
+    def test_work(self):
+        coordinator = Mock(spec=['report_load'])
+        client = Mock()
+        client.get_world.return_value.wait_for_tick.return_value.timestamp.delta_seconds = 0.05
+
+        subject = LoadReporter(coordinator, 'some-host-id', client)
+        subject._work()
+
+        host_id, fps, cpu = coordinator.report_load.call_args[0]
+
+        self.assertEqual('some-host-id', host_id)
+        self.assertEqual(20.0, fps)
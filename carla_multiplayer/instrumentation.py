@@ -0,0 +1,115 @@
+import time
+from threading import Lock, get_ident
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from .stats import Histogram, HistogramSnapshot
+
+_HAS_THREAD_CPU_CLOCKS = hasattr(time, 'pthread_getcpuclockid')  # not on Windows
+
+
+class InstrumentationSnapshot(NamedTuple):
+    phases: Dict[str, HistogramSnapshot]  # e.g. before_work, work, after_work, sleep -> durations
+    skipped: Dict[str, int]  # how many times each phase asked for the rest of the iteration to be skipped
+    cpu_time: Dict[str, float]  # thread name -> seconds of CPU used (so far, for threads that are still running)
+
+
+class Instrumentation(object):
+    def __init__(self):
+        self._lock: Lock = Lock()
+        self._histograms_by_phase: Dict[str, Histogram] = {}
+        self._skipped_by_phase: Dict[str, int] = {}
+        self._clock_ids_by_thread: Dict[str, int] = {}
+        self._cpu_time_by_thread: Dict[str, float] = {}
+
+    def observe(self, phase: str, duration: float):
+        histogram = self._histograms_by_phase.get(phase)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms_by_phase.setdefault(phase, Histogram())
+
+        histogram.observe(duration)
+
+    def skip(self, phase: str):
+        with self._lock:
+            self._skipped_by_phase[phase] = self._skipped_by_phase.get(phase, 0) + 1
+
+    def run_thread(self, name: str, function: Callable[[], Any]):
+        # the thread registers its own CPU clock (rather than us looking it up from the outside) so that we never
+        # ask about a thread that has already gone away
+        if _HAS_THREAD_CPU_CLOCKS:
+            with self._lock:
+                self._clock_ids_by_thread[name] = time.pthread_getcpuclockid(get_ident())
+
+        try:
+            function()
+        finally:
+            cpu_time = time.thread_time()
+
+            with self._lock:
+                self._clock_ids_by_thread.pop(name, None)
+                self._cpu_time_by_thread[name] = self._cpu_time_by_thread.get(name, 0.0) + cpu_time
+
+    def _get_cpu_time(self) -> Dict[str, float]:
+        cpu_time = dict(self._cpu_time_by_thread)
+
+        for name, clock_id in self._clock_ids_by_thread.items():
+            try:
+                cpu_time[name] = cpu_time.get(name, 0.0) + time.clock_gettime(clock_id)
+            except OSError:  # exited between registering and unregistering
+                continue
+
+        return cpu_time
+
+    def snapshot(self) -> InstrumentationSnapshot:
+        with self._lock:
+            histograms_by_phase = dict(self._histograms_by_phase)
+            skipped = dict(self._skipped_by_phase)
+            cpu_time = self._get_cpu_time()
+
+        return InstrumentationSnapshot(
+            phases={phase: histogram.snapshot() for phase, histogram in histograms_by_phase.items()},
+            skipped=skipped,
+            cpu_time=cpu_time,
+        )
+
+    def reset(self):
+        with self._lock:
+            self._histograms_by_phase = {}
+            self._skipped_by_phase = {}
+            self._cpu_time_by_thread = {}
+
+
+class InstrumentedMixIn(object):
+    _instrumentation: Optional[Instrumentation] = None  # off unless enabled; the uninstrumented path is one None check
+
+    def enable_instrumentation(self):  # call before start() so that the threads' CPU time is captured too
+        if self._instrumentation is None:
+            self._instrumentation = Instrumentation()
+
+    def get_instrumentation(self) -> Optional[InstrumentationSnapshot]:
+        if self._instrumentation is None:
+            return None
+
+        return self._instrumentation.snapshot()
+
+    def _run_phase(self, phase: str, function: Callable[[], Any]) -> Any:
+        instrumentation = self._instrumentation
+        if instrumentation is None:
+            return function()
+
+        started = time.perf_counter()
+        result = function()
+        instrumentation.observe(phase, time.perf_counter() - started)
+
+        return result
+
+    def _skip_phase(self, phase: str):
+        if self._instrumentation is not None:
+            self._instrumentation.skip(phase)
+
+    def _get_thread_target(self, name: str, function: Callable[[], Any]) -> Callable[[], Any]:
+        instrumentation = self._instrumentation
+        if instrumentation is None:
+            return function
+
+        return lambda: instrumentation.run_thread(name, function)
@@ -0,0 +1,61 @@
+import time
+import unittest
+from threading import Thread
+
+from .instrumentation import Instrumentation, InstrumentedMixIn
+
+
+class InstrumentationTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.subject = Instrumentation()
+
+    def test_observe_and_skip(self):
+        self.subject.observe('work', 0.001)
+        self.subject.observe('work', 0.003)
+        self.subject.skip('before_work')
+
+        snapshot = self.subject.snapshot()
+
+        self.assertEqual(['work'], list(snapshot.phases.keys()))
+        self.assertEqual(2, snapshot.phases['work'].count)
+        self.assertAlmostEqual(0.004, snapshot.phases['work'].sum)
+        self.assertEqual({'before_work': 1}, snapshot.skipped)
+
+        self.subject.reset()
+
+        self.assertEqual({}, self.subject.snapshot().phases)
+
+    def test_run_thread(self):
+        def burn():
+            started = time.perf_counter()
+            while time.perf_counter() - started < 0.05:
+                pass
+
+        thread = Thread(target=lambda: self.subject.run_thread('burner', burn))
+        thread.start()
+        thread.join()
+
+        cpu_time = self.subject.snapshot().cpu_time
+
+        self.assertEqual(['burner'], list(cpu_time.keys()))
+        self.assertGreater(cpu_time['burner'], 0.01)
+
+
+class InstrumentedMixInTest(unittest.TestCase):
+    def test_disabled(self):
+        subject = InstrumentedMixIn()
+
+        self.assertEqual(1, subject._run_phase('work', lambda: 1))
+        self.assertIsNone(subject.get_instrumentation())
+
+    def test_enabled(self):
+        subject = InstrumentedMixIn()
+        subject.enable_instrumentation()
+
+        self.assertEqual(1, subject._run_phase('work', lambda: 1))
+        subject._skip_phase('work')
+
+        snapshot = subject.get_instrumentation()
+
+        self.assertEqual(1, snapshot.phases['work'].count)
+        self.assertEqual({'work': 1}, snapshot.skipped)
@@ -1,10 +1,37 @@
-import datetime
 import time
 from threading import Event, Thread
-from typing import Optional, Union
+from typing import Any, Callable, NamedTuple, Optional, Union
 
+from .instrumentation import InstrumentedMixIn
+from .stats import Histogram, HistogramSnapshot
 
-class _LooperMixIn(object):
+# what a TimedLooper does when an iteration overruns its period
+SKIP = 'skip'  # drop the missed periods and carry on in phase
+CATCH_UP = 'catch_up'  # run the missed periods back-to-back until back on schedule
+
+
+class LooperStats(NamedTuple):
+    iterations: int
+    overruns: int  # iterations that finished after the next one should have started
+    skipped: int  # periods dropped under the SKIP policy
+    jitter: HistogramSnapshot  # how late each iteration started relative to its deadline
+
+
+# when set, TimedLoopers run on this Scheduler's thread(s) instead of a thread each (unless given their own)
+_default_scheduler: Optional['Scheduler'] = None
+
+
+def set_default_scheduler(scheduler: Optional['Scheduler']):
+    global _default_scheduler
+
+    _default_scheduler = scheduler
+
+
+def get_default_scheduler() -> Optional['Scheduler']:
+    return _default_scheduler
+
+
+class _LooperMixIn(InstrumentedMixIn):
     def __init__(self):
         self._stop_event = Event()
         self._thread: Optional[Thread] = None
@@ -27,15 +54,19 @@ class _LooperMixIn(object):
     def _loop(self):
         raise NotImplementedError('_work needs to be implemented')
 
+    def _wake(self):  # unblock work waiting on something other than _stop_event so stop() needn't wait out timeouts
+        pass
+
     def start(self):
         self._stop_event.clear()
 
         if self._thread is None:
-            self._thread = Thread(target=self._loop)
+            self._thread = Thread(target=self._get_thread_target(type(self).__name__, self._loop))
             self._thread.start()
 
     def stop(self):
         self._stop_event.set()
+        self._wake()
 
         if self._thread is not None:
             self._thread.join()
@@ -44,58 +75,169 @@ class _LooperMixIn(object):
 
 class Looper(_LooperMixIn):
     def _loop(self):
-        if self._before_loop() is True:
+        if self._run_phase('before_loop', self._before_loop) is True:
             return
 
         while not self._stop_event.is_set():
-            if self._before_work() is True:
+            if self._run_phase('before_work', self._before_work) is True:
+                self._skip_phase('before_work')
                 continue
 
-            if self._work() is True:
+            if self._run_phase('work', self._work) is True:
+                self._skip_phase('work')
                 continue
 
-            if self._after_work() is True:
+            if self._run_phase('after_work', self._after_work) is True:
+                self._skip_phase('after_work')
                 continue
 
-        if self._after_loop() is True:
+        if self._run_phase('after_loop', self._after_loop) is True:
             return
 
 
 class TimedLooper(_LooperMixIn):
-    def __init__(self, period: Union[float, int]):
+    _schedulable: bool = True  # False for loopers whose work blocks (and so would hold up a shared Scheduler)
+
+    def __init__(self,
+            period: Union[float, int],
+            missed_deadline_policy: str = SKIP,
+            clock: Callable[[], float] = time.monotonic,
+            sleep: Optional[Callable[[float], Any]] = None,
+            scheduler: Optional['Scheduler'] = None):
         super().__init__()
 
+        if missed_deadline_policy not in (SKIP, CATCH_UP):
+            raise ValueError('expected missed_deadline_policy to be one of {} but was {}'.format(
+                repr((SKIP, CATCH_UP)),
+                repr(missed_deadline_policy)
+            ))
+
         self._period: float = period
-        self._period_delta: datetime.timedelta = datetime.timedelta(seconds=self._period)
+        self._missed_deadline_policy: str = missed_deadline_policy
+        self._clock: Callable[[], float] = clock
+        self._sleep_function: Callable[[float], Any] = sleep if sleep is not None else self._stop_event.wait
+
+        self._deadline: Optional[float] = None
+        self._iterations: int = 0
+        self._overruns: int = 0
+        self._skipped: int = 0
+        self._jitter: Histogram = Histogram()
+
+        self._scheduler: Optional['Scheduler'] = scheduler
+        self._scheduled_by: Optional['Scheduler'] = None
+
+    def get_looper_stats(self) -> LooperStats:
+        return LooperStats(
+            iterations=self._iterations,
+            overruns=self._overruns,
+            skipped=self._skipped,
+            jitter=self._jitter.snapshot(),
+        )
+
+    def _start_work(self):
+        self._iterations += 1
+
+        if self._period <= 0:
+            return
+
+        now = self._clock()
+        if self._deadline is None:
+            self._deadline = now
+
+        self._jitter.observe(max(0.0, now - self._deadline))
+
+    def _advance_deadline(self) -> float:
+        if self._period <= 0:  # free-running
+            return 0.0
+
+        # deadlines are absolute (start + n * period) so errors don't accumulate from iteration to iteration
+        self._deadline += self._period
+
+        now = self._clock()
+        if now < self._deadline:
+            return self._deadline - now
+
+        self._overruns += 1
+
+        if self._missed_deadline_policy == SKIP:  # stay in phase, but drop the periods we've missed
+            missed = int((now - self._deadline) // self._period) + 1
+            self._skipped += missed
+            self._deadline += missed * self._period
+            return self._deadline - now
+
+        return 0.0  # for CATCH_UP we just go again straight away, until we're back on schedule
+
+    def _sleep(self):
+        wait = self._advance_deadline()
+        if wait > 0:
+            self._run_phase('sleep', lambda: self._sleep_function(wait))
+
+    def _iterate(self):
+        self._start_work()
 
-    def _sleep(self, work_started: datetime.datetime):
-        work_finished = datetime.datetime.now()
+        if self._run_phase('before_work', self._before_work) is False:
+            self._skip_phase('before_work')
+            return
 
-        work_should_have_finished = work_started + self._period_delta
-        if work_finished >= work_should_have_finished:
+        if self._run_phase('work', self._work) is False:
+            self._skip_phase('work')
             return
 
-        time.sleep((work_should_have_finished - work_finished).total_seconds())
+        self._run_phase('after_work', self._after_work)
 
-    def _loop(self):
-        if self._before_loop() is False:
+    def _run_scheduled(self, first: bool) -> Optional[float]:
+        # called by a Scheduler in place of _loop; returns the time until the next run, or None to be dropped
+        if first:
+            if self._run_phase('before_loop', self._before_loop) is False:
+                return None
+
+            self._deadline = None
+
+        self._iterate()
+
+        return self._advance_deadline()
+
+    def _get_scheduler(self) -> Optional['Scheduler']:
+        if not self._schedulable or self._period <= 0:  # blocking or free-running loopers need their own thread
+            return None
+
+        if self._scheduler is not None:
+            return self._scheduler
+
+        return _default_scheduler
+
+    def start(self):
+        scheduler = self._get_scheduler()
+        if scheduler is None:
+            super().start()
             return
 
-        while not self._stop_event.is_set():
-            work_started = datetime.datetime.now()
-            if self._before_work() is False:
-                self._sleep(work_started)
-                continue
+        self._stop_event.clear()
 
-            if self._work() is False:
-                self._sleep(work_started)
-                continue
+        if self._scheduled_by is None:
+            self._scheduled_by = scheduler
+            scheduler.add(self)
 
-            if self._after_work() is False:
-                self._sleep(work_started)
-                continue
+    def stop(self):
+        if self._scheduled_by is None:
+            super().stop()
+            return
+
+        self._stop_event.set()
+        self._wake()
 
-            self._sleep(work_started)
+        self._scheduled_by.remove(self)
+        self._scheduled_by = None
+
+    def _loop(self):
+        if self._run_phase('before_loop', self._before_loop) is False:
+            return
+
+        self._deadline = None
+
+        while not self._stop_event.is_set():
+            self._iterate()
+            self._sleep()
 
-        if not self._after_loop():
+        if not self._run_phase('after_loop', self._after_loop):
             return
@@ -5,7 +5,7 @@ from typing import List
 
 from mock import Mock
 
-from .looper import Looper, TimedLooper
+from .looper import Looper, TimedLooper, SKIP, CATCH_UP
 
 
 class ImplementationMixIn(object):
@@ -101,3 +101,122 @@ class TimedLooperTest(unittest.TestCase):
             average_frequency,
             delta=0.004
         )
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def clock(self) -> float:
+        return self.now
+
+    def sleep(self, duration: float):
+        self.sleeps += [duration]
+        self.now += duration
+
+
+class ScriptedTimedLooper(TimedLooper):
+    def __init__(self, period: float, durations: List[float], missed_deadline_policy: str = SKIP):
+        self.fake_clock = FakeClock()
+
+        super().__init__(
+            period=period,
+            missed_deadline_policy=missed_deadline_policy,
+            clock=self.fake_clock.clock,
+            sleep=self.fake_clock.sleep
+        )
+
+        self.durations = list(durations)
+        self.work_starts = []
+
+    def _work(self):
+        self.work_starts += [self.fake_clock.now]
+        self.fake_clock.now += self.durations.pop(0)
+        if not self.durations:
+            self._stop_event.set()
+
+
+class TimedLooperDeadlineTest(unittest.TestCase):
+    def test_no_drift(self):
+        subject = ScriptedTimedLooper(period=0.1, durations=[0.03, 0.07, 0.01, 0.05, 0.09])
+
+        subject._loop()
+
+        for i, work_start in enumerate(subject.work_starts):
+            self.assertAlmostEqual(100.0 + (i * 0.1), work_start, places=9)
+
+        stats = subject.get_looper_stats()
+        self.assertEqual(5, stats.iterations)
+        self.assertEqual(0, stats.overruns)
+        self.assertEqual(0, stats.skipped)
+        self.assertEqual(5, stats.jitter.count)
+        self.assertAlmostEqual(0.0, stats.jitter.max, places=9)
+
+    def test_skip(self):
+        subject = ScriptedTimedLooper(period=0.1, durations=[0.01, 0.25, 0.01, 0.01])
+
+        subject._loop()
+
+        self.assertEqual(4, len(subject.work_starts))
+        self.assertAlmostEqual(100.0, subject.work_starts[0], places=9)
+        self.assertAlmostEqual(100.1, subject.work_starts[1], places=9)
+        self.assertAlmostEqual(100.4, subject.work_starts[2], places=9)  # 100.2 and 100.3 were dropped
+        self.assertAlmostEqual(100.5, subject.work_starts[3], places=9)
+
+        stats = subject.get_looper_stats()
+        self.assertEqual(1, stats.overruns)
+        self.assertEqual(2, stats.skipped)
+
+    def test_catch_up(self):
+        subject = ScriptedTimedLooper(period=0.1, durations=[0.01, 0.25, 0.01, 0.01, 0.01], missed_deadline_policy=CATCH_UP)
+
+        subject._loop()
+
+        self.assertAlmostEqual(100.1, subject.work_starts[1], places=9)
+        self.assertAlmostEqual(100.35, subject.work_starts[2], places=9)  # late for 100.2, run straight away
+        self.assertAlmostEqual(100.36, subject.work_starts[3], places=9)  # late for 100.3, run straight away
+        self.assertAlmostEqual(100.4, subject.work_starts[4], places=9)  # back on schedule
+
+        stats = subject.get_looper_stats()
+        self.assertEqual(2, stats.overruns)
+        self.assertEqual(0, stats.skipped)
+        self.assertAlmostEqual(0.15, stats.jitter.max, places=9)
+
+    def test_free_running(self):
+        subject = ScriptedTimedLooper(period=0, durations=[0.01, 0.01, 0.01])
+
+        subject._loop()
+
+        self.assertEqual([], subject.fake_clock.sleeps)
+        stats = subject.get_looper_stats()
+        self.assertEqual(3, stats.iterations)
+        self.assertEqual(0, stats.overruns)
+        self.assertEqual(0, stats.jitter.count)
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            TimedLooper(period=0.1, missed_deadline_policy='bogus')
+
+
+class InstrumentedTimedLooperTest(unittest.TestCase):
+    def test_phases(self):
+        subject = ScriptedTimedLooper(period=0.1, durations=[0.01, 0.01, 0.01])
+        before_work_results = [None, False, None, None]
+        subject._before_work = lambda: before_work_results.pop(0)
+        subject.enable_instrumentation()
+
+        subject.start()
+        subject._thread.join()
+        subject.stop()
+
+        snapshot = subject.get_instrumentation()
+
+        self.assertEqual(1, snapshot.phases['before_loop'].count)
+        self.assertEqual(4, snapshot.phases['before_work'].count)
+        self.assertEqual(3, snapshot.phases['work'].count)
+        self.assertEqual(3, snapshot.phases['after_work'].count)
+        self.assertEqual(4, snapshot.phases['sleep'].count)
+        self.assertEqual(1, snapshot.phases['after_loop'].count)
+        self.assertEqual({'before_work': 1}, snapshot.skipped)
+        self.assertIn('ScriptedTimedLooper', snapshot.cpu_time)
@@ -0,0 +1,290 @@
+import math
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+from .stats import Histogram, _LATENCY_BUCKETS
+from .threader import Threader
+
+_NAMESPACE = 'carla_multiplayer'
+_METRICS_HOST = '127.0.0.1'  # local only; scrape it from this host or put something in front of it
+_METRICS_PATH = '/metrics'
+_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'  # Prometheus text format
+
+LabelValues = Tuple[str, ...]
+
+
+class _CounterChild(object):
+    def __init__(self):
+        self._lock: Lock = Lock()
+        self._value: float = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def get(self) -> float:
+        with self._lock:
+            return self._value
+
+
+class _GaugeChild(_CounterChild):
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+
+class _Metric(object):
+    type_name: str
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name: str = name
+        self.documentation: str = documentation
+        self.label_names: Tuple[str, ...] = tuple(label_names)
+
+        self._lock: Lock = Lock()
+        self._children: Dict[LabelValues, Any] = {}
+
+    def _create_child(self) -> Any:
+        raise NotImplementedError('_create_child needs to be implemented')
+
+    def labels(self, *label_values) -> Any:  # hold on to the child on hot paths rather than calling this every time
+        if len(label_values) != len(self.label_names):
+            raise ValueError('expected values for {} but got {}'.format(self.label_names, label_values))
+
+        label_values = tuple(str(x) for x in label_values)
+
+        child = self._children.get(label_values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(label_values, self._create_child())
+
+        return child
+
+    def get_children(self) -> List[Tuple[LabelValues, Any]]:
+        with self._lock:
+            return list(self._children.items())
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def _create_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def _create_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class HistogramMetric(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self,
+            name: str,
+            documentation: str,
+            label_names: Sequence[str] = (),
+            buckets: Sequence[float] = _LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+
+    def _create_child(self) -> Histogram:
+        return Histogram(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if len(names) == 0:
+        return ''
+
+    escaped = [x.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for x in values]
+
+    return '{' + ','.join('{}="{}"'.format(k, v) for k, v in zip(names, escaped)) + '}'
+
+
+class Registry(object):
+    def __init__(self, namespace: str = _NAMESPACE):
+        self._namespace: str = namespace
+
+        self._lock: Lock = Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get_or_create(self, metric_type: Type[_Metric], name: str, *args, **kwargs) -> _Metric:
+        name = '{}_{}'.format(self._namespace, name) if self._namespace else name
+
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_type(name, *args, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, metric_type):
+                raise ValueError('{} is already registered as a {}'.format(name, metric.type_name))
+
+        return metric
+
+    # all get-or-create, so every instance of a component shares (and labels) the same metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, label_names)
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, label_names)
+
+    def histogram(self,
+            name: str,
+            documentation: str,
+            label_names: Sequence[str] = (),
+            buckets: Sequence[float] = _LATENCY_BUCKETS) -> HistogramMetric:
+        return self._get_or_create(HistogramMetric, name, documentation, label_names, buckets=buckets)
+
+    def get(self, name: str, *label_values) -> Optional[float]:  # a counter or gauge value, or a histogram's count
+        with self._lock:
+            metric = self._metrics.get('{}_{}'.format(self._namespace, name) if self._namespace else name)
+
+        if metric is None:
+            return None
+
+        child = dict(metric.get_children()).get(tuple(str(x) for x in label_values))
+        if child is None:
+            return None
+
+        if isinstance(child, Histogram):
+            return child.snapshot().count
+
+        return child.get()
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda x: x.name)
+
+        lines = []
+        for metric in metrics:
+            lines += [
+                '# HELP {} {}'.format(metric.name, metric.documentation.replace('\\', '\\\\').replace('\n', '\\n')),
+                '# TYPE {} {}'.format(metric.name, metric.type_name),
+            ]
+
+            for label_values, child in sorted(metric.get_children(), key=lambda x: x[0]):
+                if not isinstance(child, Histogram):
+                    lines += ['{}{} {}'.format(
+                        metric.name,
+                        _format_labels(metric.label_names, label_values),
+                        _format_value(child.get())
+                    )]
+                    continue
+
+                snapshot = child.snapshot()
+                names = metric.label_names + ('le',)
+
+                cumulative = 0
+                for bound, count in zip(snapshot.buckets + (float('inf'),), snapshot.counts):
+                    cumulative += count
+                    lines += ['{}_bucket{} {}'.format(
+                        metric.name,
+                        _format_labels(names, label_values + (_format_value(bound),)),
+                        cumulative
+                    )]
+
+                labels = _format_labels(metric.label_names, label_values)
+                lines += [
+                    '{}_sum{} {}'.format(metric.name, labels, _format_value(snapshot.sum)),
+                    '{}_count{} {}'.format(metric.name, labels, snapshot.count),
+                ]
+
+        return '\n'.join(lines) + '\n'
+
+
+_default_registry: Registry = Registry()
+
+
+def set_default_registry(registry: Registry):
+    global _default_registry
+
+    _default_registry = registry
+
+
+def get_default_registry() -> Registry:
+    return _default_registry
+
+
+class MetricsServer(Threader):
+    def __init__(self, port: int, host: str = _METRICS_HOST, registry: Optional[Registry] = None):
+        super().__init__()
+
+        self._port: int = port
+        self._host: str = host
+        self._registry: Optional[Registry] = registry  # the default registry (when it's served) if None
+
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def port(self) -> int:  # the one actually bound, if 0 was asked for
+        return self._server.server_address[1] if self._server is not None else self._port
+
+    def _get_handler(self) -> Type[BaseHTTPRequestHandler]:
+        metrics_server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in (_METRICS_PATH, '/'):
+                    self.send_error(404)
+                    return
+
+                registry = metrics_server._registry if metrics_server._registry is not None else get_default_registry()
+                body = registry.render().encode('utf-8')
+
+                self.send_response(200)
+                self.send_header('Content-Type', _CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # one line per scrape is just noise
+                pass
+
+        return _Handler
+
+    def _serve(self):
+        self._server.serve_forever(poll_interval=0.5)
+
+    def _create_threads(self):
+        self._threads = [
+            Thread(target=self._serve),
+        ]
+
+    def _before_start(self):
+        self._server = ThreadingHTTPServer((self._host, self._port), self._get_handler())
+        self._server.daemon_threads = True
+
+    def _wake(self):
+        if self._server is not None and self._started:
+            self._server.shutdown()
+
+    def _after_stop(self):
+        self._server.server_close()
+        self._server = None
@@ -0,0 +1,96 @@
+import unittest
+import urllib.error
+import urllib.request
+from queue import Full
+
+from .metrics import MetricsServer, Registry, get_default_registry
+from .udp import Sender
+
+
+class RegistryTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.subject = Registry()
+
+    def test_get_or_create(self):
+        counter = self.subject.counter('things_total', 'Things')
+
+        self.assertIs(counter, self.subject.counter('things_total', 'Things'))
+
+        with self.assertRaises(ValueError):
+            self.subject.gauge('things_total', 'Things')
+
+        with self.assertRaises(ValueError):
+            counter.labels('unexpected')
+
+    def test_get(self):
+        self.subject.counter('things_total', 'Things', ['kind']).labels('a').inc(2)
+        self.subject.gauge('level', 'Level').set(0.5)
+        self.subject.histogram('duration_seconds', 'Duration').observe(0.1)
+
+        self.assertEqual(2.0, self.subject.get('things_total', 'a'))
+        self.assertIsNone(self.subject.get('things_total', 'b'))
+        self.assertIsNone(self.subject.get('missing_total'))
+        self.assertEqual(0.5, self.subject.get('level'))
+        self.assertEqual(1, self.subject.get('duration_seconds'))
+
+    def test_render(self):
+        counter = self.subject.counter('things_total', 'Things', ['kind'])
+        counter.labels('b').inc()
+        counter.labels('a"1').inc(2)
+        gauge = self.subject.gauge('level', 'Level')
+        gauge.set(0.25)
+        gauge.labels().dec()
+        self.subject.histogram('duration_seconds', 'Duration', buckets=(0.1, 1.0)).observe(0.5)
+
+        self.assertEqual(
+            '\n'.join([
+                '# HELP carla_multiplayer_duration_seconds Duration',
+                '# TYPE carla_multiplayer_duration_seconds histogram',
+                'carla_multiplayer_duration_seconds_bucket{le="0.1"} 0',
+                'carla_multiplayer_duration_seconds_bucket{le="1"} 1',
+                'carla_multiplayer_duration_seconds_bucket{le="+Inf"} 1',
+                'carla_multiplayer_duration_seconds_sum 0.5',
+                'carla_multiplayer_duration_seconds_count 1',
+                '# HELP carla_multiplayer_level Level',
+                '# TYPE carla_multiplayer_level gauge',
+                'carla_multiplayer_level -0.75',
+                '# HELP carla_multiplayer_things_total Things',
+                '# TYPE carla_multiplayer_things_total counter',
+                'carla_multiplayer_things_total{kind="a\\"1"} 2',
+                'carla_multiplayer_things_total{kind="b"} 1',
+            ]) + '\n',
+            self.subject.render()
+        )
+
+
+class MetricsServerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.registry = Registry()
+        self.registry.counter('things_total', 'Things').inc()
+
+        self.subject = MetricsServer(0, registry=self.registry)
+
+    def tearDown(self) -> None:
+        self.subject.stop()
+
+    def test_serve(self):
+        self.subject.start()
+
+        with urllib.request.urlopen('http://127.0.0.1:{}/metrics'.format(self.subject.port), timeout=5) as response:
+            self.assertIn('text/plain', response.headers['Content-Type'])
+            self.assertIn('carla_multiplayer_things_total 1\n', response.read().decode('utf-8'))
+
+        with self.assertRaises(urllib.error.HTTPError):
+            urllib.request.urlopen('http://127.0.0.1:{}/nothing'.format(self.subject.port), timeout=5)
+
+
+class PipelineMetricsTest(unittest.TestCase):
+    def test_send_queue_full(self):
+        subject = Sender(port=13399, queue_size=1)  # not started, so nothing drains the queue
+        before = get_default_registry().get('udp_send_queue_full_total', 13399) or 0.0
+
+        subject.send_datagram(b'a', ('127.0.0.1', 13398))
+        with self.assertRaises(Full):
+            subject.send_datagram(b'b', ('127.0.0.1', 13398))
+
+        self.assertEqual(before + 1, get_default_registry().get('udp_send_queue_full_total', 13399))
@@ -0,0 +1,738 @@
+import time
+import traceback
+from threading import Lock, Thread
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from .admission import AdmissionController, AdmissionStats, HostCapacity, Quality, SessionSample, get_qualities, \
+    _UPLINK_BYTES_PER_SECOND, _RPCS_PER_SECOND
+from .metrics import MetricsServer
+from .npc import NPCManager
+from .pool import ActorPair, ActorPool
+from .rpc import RPCClient
+from .scheduler import Scheduler
+from .sensor import create_sensor, delete_sensor, EncoderPool, Sensor, _SENSOR_BLUEPRINT_NAME, _SENSOR_TRANSFORM, _FPS, _WIDTH, \
+    _HEIGHT, _ENCODER_WORKERS, set_image_format, _IMAGE_FORMAT, _IMAGE_FORMATS
+from .spawn import SpawnPointSelector
+from .telemetry import TelemetrySender, _TELEMETRY_RATE
+from .udp import Datagram, Receiver, Sender
+from .viewer import ViewerWatchdog, is_viewer_keepalive, _VIEWER_TIMEOUT, _REAP_TIMEOUT
+from .vehicle import delete_vehicle, Vehicle, VehicleManager, _CONTROL_RATE, _CONTROL_EXPIRE, _RESET_RATE
+
+try:  # cater for python3 -m (module) vs python3 (file)
+    from . import wrapped_carla as carla
+except ImportError:
+    import wrapped_carla as carla
+
+_CARLA_PORT = 2000
+_CARLA_TIMEOUT = 2.0
+_QUEUE_SIZE = 2  # per session
+_MAX_SESSIONS = 16
+_MAX_CONTROLLER_DATAGRAMS_PER_SECOND = 120.0  # twice the 60 Hz controller rate cap
+_MAX_FRAME_BYTES_PER_SECOND = 2000000.0  # ~16 Mbit/s; 640x360 WebP at 30 fps is typically well under half that
+_BURST_SECONDS = 0.5  # how much of a second's allowance can be used at once
+_REJECTION_BACKOFF = 1.0  # s before trying again to add a session for an address that was turned away; doubles each time
+_MAX_REJECTION_BACKOFF = 30.0
+_MAX_REJECTIONS = 1024  # addresses remembered as turned away
+
+
+class TokenBucket(object):
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self._rate: float = rate
+        self._burst: float = burst
+        self._clock: Callable[[], float] = clock
+
+        self._lock: Lock = Lock()
+        self._tokens: float = burst
+        self._last: float = self._clock()
+
+    def allow(self, amount: float = 1.0) -> bool:
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self._burst, self._tokens + ((now - self._last) * self._rate))
+            self._last = now
+
+            if self._tokens < amount:
+                return False
+
+            self._tokens -= amount
+
+            return True
+
+
+class SessionLimits(NamedTuple):
+    max_controller_datagrams_per_second: float = _MAX_CONTROLLER_DATAGRAMS_PER_SECOND
+    max_frame_bytes_per_second: float = _MAX_FRAME_BYTES_PER_SECOND
+
+
+class SessionStats(NamedTuple):
+    address: Tuple[str, int]
+    vehicle_actor_id: int
+    controller_datagrams: int
+    controller_datagrams_dropped: int  # over max_controller_datagrams_per_second
+    frames: int
+    frame_bytes: int
+    frames_dropped: int  # over max_frame_bytes_per_second
+
+
+class Session(object):
+    def __init__(self,
+            address: Tuple[str, int],
+            vehicle_actor: carla.Actor,
+            sensor_actor: carla.Actor,
+            vehicle: Vehicle,
+            sensor: Sensor,
+            telemetry_sender: Optional[TelemetrySender],
+            limits: SessionLimits,
+            actor_pair: Optional[ActorPair] = None,
+            quality: Optional[Quality] = None):
+        self.address: Tuple[str, int] = address
+        self.vehicle_actor: carla.Actor = vehicle_actor
+        self.sensor_actor: carla.Actor = sensor_actor
+        self.vehicle: Vehicle = vehicle
+        self.sensor: Sensor = sensor
+        self.telemetry_sender: Optional[TelemetrySender] = telemetry_sender
+        self.actor_pair: Optional[ActorPair] = actor_pair  # if the actors came from (and go back to) an ActorPool
+        self.quality: Optional[Quality] = quality  # what the sensor was created with
+
+        self._controller_datagrams: TokenBucket = TokenBucket(
+            rate=limits.max_controller_datagrams_per_second,
+            burst=max(1.0, limits.max_controller_datagrams_per_second * _BURST_SECONDS)
+        )
+        self._frame_bytes: TokenBucket = TokenBucket(
+            rate=limits.max_frame_bytes_per_second,
+            burst=limits.max_frame_bytes_per_second * _BURST_SECONDS
+        )
+
+        self._lock: Lock = Lock()
+        self._controller_datagram_count: int = 0
+        self._controller_datagrams_dropped: int = 0
+        self._frame_count: int = 0
+        self._frame_byte_count: int = 0
+        self._frames_dropped: int = 0
+
+    def allow_controller_datagram(self) -> bool:
+        allowed = self._controller_datagrams.allow()
+
+        with self._lock:
+            if allowed:
+                self._controller_datagram_count += 1
+            else:
+                self._controller_datagrams_dropped += 1
+
+        return allowed
+
+    def allow_frame(self, size: int) -> bool:
+        allowed = self._frame_bytes.allow(size)
+
+        with self._lock:
+            if allowed:
+                self._frame_count += 1
+                self._frame_byte_count += size
+            else:
+                self._frames_dropped += 1
+
+        return allowed
+
+    def get_stats(self) -> SessionStats:
+        with self._lock:
+            return SessionStats(
+                address=self.address,
+                vehicle_actor_id=self.vehicle_actor.id,
+                controller_datagrams=self._controller_datagram_count,
+                controller_datagrams_dropped=self._controller_datagrams_dropped,
+                frames=self._frame_count,
+                frame_bytes=self._frame_byte_count,
+                frames_dropped=self._frames_dropped,
+            )
+
+
+class MultiplayerServer(object):
+    def __init__(self,
+            port: int,
+            vehicle_blueprint_name: str,
+            carla_host: str,
+            vehicle_transforms: Optional[List[carla.Transform]] = None,
+            sensor_blueprint_name: str = _SENSOR_BLUEPRINT_NAME,
+            sensor_transform: carla.Transform = _SENSOR_TRANSFORM,
+            carla_port: int = _CARLA_PORT,
+            carla_timeout: float = _CARLA_TIMEOUT,
+            queue_size: int = _QUEUE_SIZE,
+            control_rate: float = _CONTROL_RATE,
+            control_expire: float = _CONTROL_EXPIRE,
+            reset_rate: float = _RESET_RATE,
+            fps: int = _FPS,
+            width: int = _WIDTH,
+            height: int = _HEIGHT,
+            telemetry_rate: Optional[float] = _TELEMETRY_RATE,
+            max_sessions: int = _MAX_SESSIONS,
+            limits: Optional[SessionLimits] = None,
+            encoder_workers: int = _ENCODER_WORKERS,
+            auto_add_sessions: bool = False,
+            actor_pool: Optional[ActorPool] = None,
+            pool_size: int = 0,
+            npc_budget: int = 0,
+            viewer_timeout: Optional[float] = _VIEWER_TIMEOUT,
+            reap_timeout: Optional[float] = _REAP_TIMEOUT,
+            admission_capacity: Optional[HostCapacity] = None):
+        self._port: int = port
+        self._vehicle_blueprint_name: str = vehicle_blueprint_name
+        self._vehicle_transforms: Optional[List[carla.Transform]] = vehicle_transforms
+        self._sensor_blueprint_name: str = sensor_blueprint_name
+        self._sensor_transform: carla.Transform = sensor_transform
+        self._queue_size: int = queue_size
+        self._control_rate: float = control_rate
+        self._control_expire: float = control_expire
+        self._reset_rate: float = reset_rate
+        self._fps: int = fps
+        self._width: int = width
+        self._height: int = height
+        self._telemetry_rate: Optional[float] = telemetry_rate
+        self._max_sessions: int = max_sessions
+        self._limits: SessionLimits = limits if limits is not None else SessionLimits()
+        self._auto_add_sessions: bool = auto_add_sessions  # start a session for any address we hear from
+        self._actor_pool: Optional[ActorPool] = actor_pool
+
+        # one Carla connection, one socket and one of everything else, shared by all sessions
+        self._client: RPCClient = RPCClient(carla.Client(carla_host, carla_port))
+        self._client.set_timeout(carla_timeout)
+
+        self._receiver: Receiver = Receiver(
+            port=self._port,
+            queue_size=self._queue_size * self._max_sessions,
+            callback=self._handle_datagram
+        )
+        self._sender: Sender = Sender(
+            port=self._port,
+            queue_size=self._queue_size * self._max_sessions,
+            use_socket_from=self._receiver
+        )
+        self._encoder_pool: EncoderPool = EncoderPool(
+            sender=self._sender,
+            workers=encoder_workers,
+            can_send=self._can_send
+        )
+        self._vehicle_manager: VehicleManager = VehicleManager(
+            client=self._client,
+            control_rate=self._control_rate
+        )
+        self._scheduler: Scheduler = Scheduler()  # for the per-session TimedLoopers (telemetry)
+
+        # free spawn points (the map's unless given) found locally against an index of actor positions
+        self._spawn_point_selector: SpawnPointSelector = SpawnPointSelector(self._client, self._vehicle_transforms)
+
+        # parked vehicle + sensor pairs so that joining is a teleport rather than a spawn
+        self._owns_actor_pool: bool = False
+        if self._actor_pool is None and pool_size > 0:
+            self._actor_pool = ActorPool(
+                client=self._client,
+                targets={self._vehicle_blueprint_name: pool_size},
+                sensor_blueprint_name=self._sensor_blueprint_name,
+                sensor_transform=self._sensor_transform,
+                fps=self._fps,
+                width=self._width,
+                height=self._height
+            )
+            self._owns_actor_pool = True
+
+        # background traffic, spawned and destroyed in batches around wherever the players are
+        self._npc_manager: Optional[NPCManager] = None
+        if npc_budget > 0:
+            self._npc_manager = NPCManager(
+                client=self._client,
+                budget=npc_budget
+            )
+
+        # sensors are paused while their viewer is away, and sessions removed if it doesn't come back
+        self._viewer_watchdog: Optional[ViewerWatchdog] = None
+        if viewer_timeout is not None:
+            self._viewer_watchdog = ViewerWatchdog(
+                timeout=viewer_timeout,
+                reap_timeout=reap_timeout,
+                on_pause=self._pause_session,
+                on_resume=self._resume_session,
+                on_reap=self._reap_session,
+                scheduler=self._scheduler
+            )
+
+        # new sessions are turned away (or given a cheaper sensor) if they'd push existing ones under their targets
+        self._admission_controller: Optional[AdmissionController] = None
+        if admission_capacity is not None:
+            self._admission_controller = AdmissionController(
+                get_samples=self._get_admission_samples,
+                get_rpcs=lambda: self._client.stats.calls,
+                capacity=admission_capacity,
+                qualities=get_qualities(Quality(fps=self._fps, width=self._width, height=self._height)),
+                scheduler=self._scheduler
+            )
+
+        self._lock: Lock = Lock()
+        self._sessions_by_address: Dict[Tuple[str, int], Session] = {}
+        self._adding: Set[Tuple[str, int]] = set()
+        self._spawning: int = 0
+        self._rejections: Dict[Tuple[str, int], Tuple[float, float]] = {}  # address -> (when to try again, backoff)
+
+        self._stopped = False
+
+    def start(self):
+        self._stopped = False
+
+        world = self._client.get_world()
+        if world is None:
+            raise ValueError('attempt to get world returned None; carla.Client possibly not working')
+
+        self._scheduler.start()
+        self._vehicle_manager.start()
+        if self._owns_actor_pool:
+            self._actor_pool.start()
+        if self._npc_manager is not None:
+            self._npc_manager.start()
+        self._receiver.start()  # first, as it owns the socket
+        self._sender.start()
+        self._encoder_pool.start()
+        if self._viewer_watchdog is not None:
+            self._viewer_watchdog.start()
+        if self._admission_controller is not None:
+            self._admission_controller.start()
+
+    def _create_vehicle(self) -> carla.Actor:
+        vehicle_actor = self._spawn_point_selector.spawn(self._vehicle_blueprint_name)
+        if vehicle_actor is None:
+            raise ValueError('failed to spawn {}; no free spawn point'.format(repr(self._vehicle_blueprint_name)))
+
+        return vehicle_actor
+
+    def _reserve_session(self, address: Tuple[str, int]) -> Quality:  # with self._lock held; for a session about to be created
+        if len(self._sessions_by_address) + self._spawning >= self._max_sessions:
+            raise ValueError('already at max_sessions of {}'.format(self._max_sessions))
+
+        quality = Quality(fps=self._fps, width=self._width, height=self._height)
+        if self._admission_controller is not None:
+            decision = self._admission_controller.admit(address)
+            if not decision.admit:
+                raise ValueError(decision.reason)
+
+            quality = decision.quality
+
+        self._spawning += 1
+
+        return quality
+
+    def _reject(self, address: Tuple[str, int], now: float) -> bool:  # with self._lock held; True the first time
+        rejection = self._rejections.get(address)
+        if rejection is None and len(self._rejections) >= _MAX_REJECTIONS:
+            self._rejections = {k: v for k, v in self._rejections.items() if v[0] > now}  # forget those we're not holding off
+            if len(self._rejections) >= _MAX_REJECTIONS:  # too many to be anything but a flood; not worth a line each
+                return False
+
+        backoff = min(rejection[1] * 2, _MAX_REJECTION_BACKOFF) if rejection is not None else _REJECTION_BACKOFF
+        self._rejections[address] = (now + backoff, backoff)
+
+        return rejection is None
+
+    def add_session(self, address: Tuple[str, int]) -> Session:
+        with self._lock:
+            session = self._sessions_by_address.get(address)
+            if session is not None:
+                return session
+
+            try:
+                quality = self._reserve_session(address)
+            except ValueError as e:
+                raise ValueError('cannot add session for {}; {}'.format(address, e))
+
+        return self._add_reserved_session(address, quality)
+
+    def _add_reserved_session(self, address: Tuple[str, int], quality: Quality) -> Session:
+        try:
+            session = self._create_session(address, quality)
+        except Exception:
+            if self._admission_controller is not None:
+                self._admission_controller.remove(address)
+
+            with self._lock:
+                self._spawning -= 1
+
+            raise
+
+        with self._lock:  # together, so the slot is never briefly free
+            self._spawning -= 1
+            self._sessions_by_address[address] = session
+            self._rejections.pop(address, None)
+
+        if self._viewer_watchdog is not None:
+            self._viewer_watchdog.add(address)
+
+        return session
+
+    def _get_next_transform(self) -> carla.Transform:
+        transform = self._spawn_point_selector.get_free_transform()
+        if transform is None:
+            raise ValueError('failed to place {}; no free spawn point'.format(repr(self._vehicle_blueprint_name)))
+
+        return transform
+
+    def _create_session(self, address: Tuple[str, int], quality: Quality) -> Session:
+        undo: List[Callable[[], None]] = []  # for whatever's been done so far, should a later step fail
+
+        try:
+            return self._create_session_undoably(address, quality, undo)
+        except Exception:
+            for step in reversed(undo):
+                try:
+                    step()
+                except Exception as e:  # carry on; the actors should go regardless, and the original error matters more
+                    print('undoing a partly created session for {} in {} raised {}; traceback follows'.format(
+                        address,
+                        repr(self),
+                        repr(e)
+                    ))
+                    traceback.print_exc()
+
+            raise
+
+    def _create_session_undoably(self, address: Tuple[str, int], quality: Quality, undo: List[Callable[[], None]]) -> Session:
+        actor_pair = None
+        if self._actor_pool is not None and quality == (self._fps, self._width, self._height):  # parked sensors are full quality
+            actor_pair = self._actor_pool.acquire(self._vehicle_blueprint_name, self._get_next_transform())
+            undo.append(lambda: self._actor_pool.release(actor_pair))
+            vehicle_actor, sensor_actor = actor_pair.vehicle, actor_pair.sensor
+        else:
+            vehicle_actor = self._create_vehicle()
+            undo.append(lambda: delete_vehicle(self._client, vehicle_actor.id))
+
+            sensor_actor = create_sensor(
+                client=self._client,
+                actor_id=vehicle_actor.id,
+                sensor_blueprint_name=self._sensor_blueprint_name,
+                fps=quality.fps,
+                width=quality.width,
+                height=quality.height,
+                transform=self._sensor_transform
+            )
+            undo.append(lambda: delete_sensor(self._client, sensor_actor.id))
+
+        vehicle = Vehicle(
+            receiver=self._receiver,
+            client=self._client,
+            actor_id=vehicle_actor.id,
+            control_rate=self._control_rate,
+            control_expire=self._control_expire,
+            reset_rate=self._reset_rate
+        )
+
+        sensor = Sensor(
+            client=self._client,
+            actor_id=sensor_actor.id,
+            queue_size=self._queue_size,
+            sender=self._sender,
+            host=address[0],
+            port=address[1],
+            encoder_pool=self._encoder_pool
+        )
+
+        telemetry_sender = None
+        if self._telemetry_rate is not None:
+            telemetry_sender = TelemetrySender(
+                client=self._client,
+                actor_id=vehicle_actor.id,
+                sender=self._sender,
+                host=address[0],
+                port=address[1],
+                rate=self._telemetry_rate,
+                scheduler=self._scheduler
+            )
+
+        session = Session(
+            address=address,
+            vehicle_actor=vehicle_actor,
+            sensor_actor=sensor_actor,
+            vehicle=vehicle,
+            sensor=sensor,
+            telemetry_sender=telemetry_sender,
+            limits=self._limits,
+            actor_pair=actor_pair,
+            quality=quality
+        )
+
+        self._vehicle_manager.add_vehicle(vehicle)
+        undo.append(lambda: self._vehicle_manager.remove_vehicle(vehicle))
+        if self._npc_manager is not None:
+            self._npc_manager.add_player(vehicle_actor.id)
+            undo.append(lambda: self._npc_manager.remove_player(vehicle_actor.id))
+        sensor.start()
+        undo.append(sensor.stop)
+        if telemetry_sender is not None:
+            telemetry_sender.start()
+
+        return session
+
+    def remove_session(self, address: Tuple[str, int]):
+        with self._lock:
+            session = self._sessions_by_address.pop(address, None)
+
+        if session is None:
+            raise ValueError('could not find session for {}'.format(address))
+
+        if self._viewer_watchdog is not None:
+            self._viewer_watchdog.remove(address)
+        if self._admission_controller is not None:
+            self._admission_controller.remove(address)
+        self._encoder_pool.forget(address)
+
+        if session.telemetry_sender is not None:
+            session.telemetry_sender.stop()
+        session.sensor.stop()
+        self._vehicle_manager.remove_vehicle(session.vehicle)
+        if self._npc_manager is not None:
+            self._npc_manager.remove_player(session.vehicle_actor.id)
+
+        if session.actor_pair is not None:
+            self._actor_pool.release(session.actor_pair)
+            return
+
+        delete_sensor(self._client, session.sensor_actor.id)
+        delete_vehicle(self._client, session.vehicle_actor.id)
+
+    def _get_admission_samples(self) -> Dict[Tuple[str, int], SessionSample]:
+        with self._lock:
+            sessions = list(self._sessions_by_address.values())
+
+        samples = {}
+        for session in sessions:
+            stats = session.get_stats()
+            samples[session.address] = SessionSample(
+                encode_seconds=self._encoder_pool.get_encode_seconds(session.address),
+                frames=stats.frames,
+                frame_bytes=stats.frame_bytes,
+                frames_dropped=stats.frames_dropped,
+            )
+
+        return samples
+
+    def _get_session(self, address: Tuple[str, int]) -> Optional[Session]:
+        with self._lock:
+            return self._sessions_by_address.get(address)
+
+    def _pause_session(self, address: Tuple[str, int]):
+        session = self._get_session(address)
+        if session is not None:
+            session.sensor.pause()
+
+    def _resume_session(self, address: Tuple[str, int]):
+        session = self._get_session(address)
+        if session is not None:
+            session.sensor.resume()
+
+    def _reap_session(self, address: Tuple[str, int]):
+        # the watchdog runs on the shared scheduler; removing a session takes blocking RPCs, so do that elsewhere
+        Thread(target=self._reap_session_in_background, args=(address,)).start()
+
+    def _reap_session_in_background(self, address: Tuple[str, int]):
+        try:
+            self.remove_session(address)
+        except ValueError:  # already removed
+            pass
+        except Exception as e:
+            print('attempt to reap session for {} in {} raised {}; traceback follows'.format(
+                address,
+                repr(self),
+                repr(e)
+            ))
+            traceback.print_exc()
+
+    def get_sessions(self) -> List[SessionStats]:
+        with self._lock:
+            sessions = list(self._sessions_by_address.values())
+
+        return [x.get_stats() for x in sessions]
+
+    def get_admission_stats(self) -> Optional[AdmissionStats]:
+        if self._admission_controller is None:
+            return None
+
+        return self._admission_controller.get_stats()
+
+    def _add_session_in_background(self, address: Tuple[str, int], quality: Quality):
+        try:
+            self._add_reserved_session(address, quality)
+        except Exception as e:
+            with self._lock:
+                first = self._reject(address, time.monotonic())  # it'd most likely fail the same way straight away
+
+            if first:
+                print('attempt to add session for {} in {} raised {}; traceback follows'.format(
+                    address,
+                    repr(self),
+                    repr(e)
+                ))
+                traceback.print_exc()
+        finally:
+            with self._lock:
+                self._adding.discard(address)
+
+    def _handle_datagram(self, datagram: Datagram):
+        with self._lock:
+            session = self._sessions_by_address.get(datagram.address)
+
+            if session is None:
+                if not self._auto_add_sessions or datagram.address in self._adding or self._stopped:
+                    return
+
+                now = time.monotonic()
+                rejection = self._rejections.get(datagram.address)
+                if rejection is not None and now < rejection[0]:  # turned away recently; its controls and keepalives keep coming
+                    return
+
+                # before there's a thread, so sources we'd never have room for (or spoofed ones) can't make any
+                try:
+                    quality = self._reserve_session(datagram.address)
+                except ValueError as e:
+                    reason = e
+                    first = self._reject(datagram.address, now)
+                else:
+                    # spawning takes a few RPCs; don't hold up everyone else's controls while it happens
+                    self._adding.add(datagram.address)
+                    Thread(target=self._add_session_in_background, args=(datagram.address, quality)).start()
+
+                    return
+
+        if session is None:
+            if first:
+                print('turned away {}; {}'.format(datagram.address, reason))
+
+            return
+
+        if not session.allow_controller_datagram():
+            return
+
+        keepalive = is_viewer_keepalive(datagram.data)
+
+        if self._viewer_watchdog is not None:
+            self._viewer_watchdog.seen(datagram.address, keepalive=keepalive)
+
+        if keepalive:
+            return
+
+        session.vehicle.recv(datagram)
+
+    def _can_send(self, address: Tuple[str, int], size: int) -> bool:
+        with self._lock:
+            session = self._sessions_by_address.get(address)
+
+        if session is None:  # removed while its last frame was being encoded
+            return False
+
+        return session.allow_frame(size)
+
+    def run(self):
+        while not self._stopped:
+            try:
+                time.sleep(1)
+            except KeyboardInterrupt:
+                break
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+
+        if self._viewer_watchdog is not None:  # first, so it isn't reaping sessions as we remove them
+            self._viewer_watchdog.stop()
+        if self._admission_controller is not None:
+            self._admission_controller.stop()
+
+        for address in list(self._sessions_by_address.keys()):
+            self.remove_session(address)
+
+        self._encoder_pool.stop()
+        self._sender.stop()
+        self._receiver.stop()
+        self._vehicle_manager.stop()
+        self._scheduler.stop()
+        if self._npc_manager is not None:
+            self._npc_manager.stop()
+        if self._owns_actor_pool:
+            self._actor_pool.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--vehicle-blueprint-name', type=str, required=True)
+    parser.add_argument('--carla-host', type=str, required=True)
+    parser.add_argument('--sensor-blueprint_name', type=str, default=_SENSOR_BLUEPRINT_NAME)
+    parser.add_argument('--carla-port', type=int, default=_CARLA_PORT)
+    parser.add_argument('--carla-timeout', type=float, default=_CARLA_TIMEOUT)
+    parser.add_argument('--queue-size', type=int, default=_QUEUE_SIZE)
+    parser.add_argument('--control-rate', type=float, default=_CONTROL_RATE)
+    parser.add_argument('--control-expire', type=float, default=_CONTROL_EXPIRE)
+    parser.add_argument('--reset-rate', type=float, default=_RESET_RATE)
+    parser.add_argument('--fps', type=int, default=_FPS)
+    parser.add_argument('--width', type=int, default=_WIDTH)
+    parser.add_argument('--height', type=int, default=_HEIGHT)
+    parser.add_argument('--telemetry-rate', type=float, default=_TELEMETRY_RATE)
+    parser.add_argument('--no-telemetry', action='store_true', default=False)
+    parser.add_argument('--max-sessions', type=int, default=_MAX_SESSIONS)
+    parser.add_argument('--max-controller-datagrams-per-second', type=float, default=_MAX_CONTROLLER_DATAGRAMS_PER_SECOND)
+    parser.add_argument('--max-frame-bytes-per-second', type=float, default=_MAX_FRAME_BYTES_PER_SECOND)
+    parser.add_argument('--encoder-workers', type=int, default=_ENCODER_WORKERS)
+    parser.add_argument('--pool-size', type=int, default=0)
+    parser.add_argument('--npc-budget', type=int, default=0)
+    parser.add_argument('--viewer-timeout', type=float, default=_VIEWER_TIMEOUT)
+    parser.add_argument('--reap-timeout', type=float, default=_REAP_TIMEOUT)
+    parser.add_argument('--no-viewer-timeout', action='store_true', default=False)
+    parser.add_argument('--admission-control', action='store_true', default=False)
+    parser.add_argument('--uplink-bytes-per-second', type=float, default=_UPLINK_BYTES_PER_SECOND)
+    parser.add_argument('--max-rpcs-per-second', type=float, default=_RPCS_PER_SECOND)
+    parser.add_argument('--metrics-port', type=int, default=None)  # serve Prometheus metrics on localhost
+    parser.add_argument('--image-format', type=str, choices=_IMAGE_FORMATS, default=_IMAGE_FORMAT)
+
+    args = parser.parse_args()
+
+    set_image_format(args.image_format)
+
+    _server = MultiplayerServer(
+        port=args.port,
+        vehicle_blueprint_name=args.vehicle_blueprint_name,
+        carla_host=args.carla_host,
+        sensor_blueprint_name=args.sensor_blueprint_name,
+        carla_port=args.carla_port,
+        carla_timeout=args.carla_timeout,
+        queue_size=args.queue_size,
+        control_rate=args.control_rate,
+        control_expire=args.control_expire,
+        reset_rate=args.reset_rate,
+        fps=args.fps,
+        width=args.width,
+        height=args.height,
+        telemetry_rate=None if args.no_telemetry else args.telemetry_rate,
+        max_sessions=args.max_sessions,
+        limits=SessionLimits(
+            max_controller_datagrams_per_second=args.max_controller_datagrams_per_second,
+            max_frame_bytes_per_second=args.max_frame_bytes_per_second,
+        ),
+        encoder_workers=args.encoder_workers,
+        auto_add_sessions=True,
+        pool_size=args.pool_size,
+        npc_budget=args.npc_budget,
+        viewer_timeout=None if args.no_viewer_timeout else args.viewer_timeout,
+        reap_timeout=args.reap_timeout,
+        admission_capacity=HostCapacity(
+            encode_seconds_per_second=float(args.encoder_workers),
+            bytes_per_second=args.uplink_bytes_per_second,
+            rpcs_per_second=args.max_rpcs_per_second,
+        ) if args.admission_control else None
+    )
+
+    _metrics_server = None
+    if args.metrics_port is not None:
+        _metrics_server = MetricsServer(args.metrics_port)
+        _metrics_server.start()
+
+    _server.start()
+    _server.run()
+    _server.stop()
+
+    if _metrics_server is not None:
+        _metrics_server.stop()
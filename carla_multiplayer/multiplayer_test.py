@@ -0,0 +1,228 @@
+import time
+import unittest
+
+from mock import Mock, patch
+
+from .admission import AdmissionController, HostCapacity, Quality, get_qualities
+from .multiplayer import MultiplayerServer, SessionLimits, TokenBucket
+from .udp import Datagram
+from .viewer import serialize_viewer_keepalive
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_allow(self):
+        now = [0.0]
+        subject = TokenBucket(rate=10.0, burst=2.0, clock=lambda: now[0])
+
+        self.assertTrue(subject.allow())
+        self.assertTrue(subject.allow())
+        self.assertFalse(subject.allow())
+
+        now[0] = 0.1  # one more token
+
+        self.assertTrue(subject.allow())
+        self.assertFalse(subject.allow())
+
+        now[0] = 10.0  # capped at burst
+
+        self.assertTrue(subject.allow(2.0))
+        self.assertFalse(subject.allow())
+
+
+class MultiplayerServerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.subject = MultiplayerServer(
+            port=0,
+            vehicle_blueprint_name='vehicle.tesla.model3',
+            carla_host='localhost',
+            vehicle_transforms=[Mock(location=Mock(x=0.0, y=0.0)), Mock(location=Mock(x=100.0, y=0.0))],
+            telemetry_rate=None,
+            max_sessions=2,
+            limits=SessionLimits(
+                max_controller_datagrams_per_second=10.0,
+                max_frame_bytes_per_second=1000.0,
+            )
+        )
+        self.subject._client = Mock()
+        self.subject._vehicle_manager._client = self.subject._client
+        self.subject._spawn_point_selector._client = self.subject._client
+
+        actor_ids = iter(range(1, 100))
+        self.subject._client.get_world.return_value.spawn_actor.side_effect = lambda *args, **kwargs: Mock(id=next(actor_ids))
+        self.subject._client.get_world.return_value.get_actors.return_value.filter.return_value = []
+        self.subject._client.get_world.return_value.try_spawn_actor.side_effect = lambda *args, **kwargs: Mock(id=next(actor_ids))
+
+    def tearDown(self) -> None:
+        self.subject.stop()
+
+    def test_sessions(self):
+        self.subject.start()
+
+        session_1 = self.subject.add_session(('10.0.0.1', 13337))
+        session_2 = self.subject.add_session(('10.0.0.2', 13337))
+
+        self.assertIs(session_1, self.subject.add_session(('10.0.0.1', 13337)))
+        self.assertEqual(2, len(self.subject.get_sessions()))
+
+        with self.assertRaises(ValueError):
+            self.subject.add_session(('10.0.0.3', 13337))
+
+        with patch.object(session_1.vehicle, 'recv') as recv_1, patch.object(session_2.vehicle, 'recv') as recv_2:
+            datagram = Datagram(data=b'\x01', address=('10.0.0.2', 13337))
+            self.subject._handle_datagram(datagram)
+            self.subject._handle_datagram(Datagram(data=b'\x01', address=('10.0.0.9', 13337)))  # unknown; ignored
+
+        recv_1.assert_not_called()
+        recv_2.assert_called_once_with(datagram)
+
+        self.subject.remove_session(('10.0.0.1', 13337))
+
+        self.assertEqual([('10.0.0.2', 13337)], [x.address for x in self.subject.get_sessions()])
+
+    def test_add_session_undoes_a_partly_created_session(self):
+        self.subject.start()
+
+        with patch('carla_multiplayer.multiplayer.create_sensor', side_effect=ValueError('no sensor')), \
+                patch('carla_multiplayer.multiplayer.delete_vehicle') as delete_vehicle:
+            with self.assertRaises(ValueError):
+                self.subject.add_session(('10.0.0.1', 13337))
+
+        delete_vehicle.assert_called_once_with(self.subject._client, 1)  # the first actor spawned
+
+        with patch('carla_multiplayer.multiplayer.Sensor.start', side_effect=ValueError('no sensor')), \
+                patch('carla_multiplayer.multiplayer.delete_sensor') as delete_sensor, \
+                patch('carla_multiplayer.multiplayer.delete_vehicle') as delete_vehicle:
+            with self.assertRaises(ValueError):
+                self.subject.add_session(('10.0.0.1', 13337))
+
+        delete_sensor.assert_called_once()
+        delete_vehicle.assert_called_once()
+        self.assertEqual({}, self.subject._vehicle_manager._vehicles_by_actor_id)
+        self.assertEqual([], self.subject.get_sessions())
+        self.assertEqual(0, self.subject._spawning)
+
+    def test_limits(self):
+        self.subject.start()
+
+        session = self.subject.add_session(('10.0.0.1', 13337))
+
+        with patch.object(session.vehicle, 'recv') as recv:
+            for _ in range(0, 10):
+                self.subject._handle_datagram(Datagram(data=b'\x01', address=('10.0.0.1', 13337)))
+
+        self.assertEqual(5, recv.call_count)  # a burst of half a second's allowance
+
+        self.assertTrue(self.subject._can_send(('10.0.0.1', 13337), 400))
+        self.assertFalse(self.subject._can_send(('10.0.0.1', 13337), 400))
+        self.assertFalse(self.subject._can_send(('10.0.0.9', 13337), 1))
+
+        stats = self.subject.get_sessions()[0]
+        self.assertEqual((5, 5, 1, 400, 1), tuple(stats)[2:])
+
+    def test_viewer_keepalives(self):
+        self.subject.start()
+
+        session = self.subject.add_session(('10.0.0.1', 13337))
+        session.sensor = Mock()
+
+        with patch.object(session.vehicle, 'recv') as recv:
+            self.subject._handle_datagram(Datagram(data=serialize_viewer_keepalive(1), address=('10.0.0.1', 13337)))
+
+        recv.assert_not_called()  # not controls
+
+        self.subject._viewer_watchdog._viewers[('10.0.0.1', 13337)].last_seen -= 10.0
+        self.subject._viewer_watchdog.check()
+
+        session.sensor.pause.assert_called_once_with()
+
+        self.subject._handle_datagram(Datagram(data=serialize_viewer_keepalive(2), address=('10.0.0.1', 13337)))
+
+        session.sensor.resume.assert_called_once_with()
+
+        self.subject._viewer_watchdog._viewers[('10.0.0.1', 13337)].last_seen -= 100.0
+        with patch('carla_multiplayer.multiplayer.Thread') as thread:
+            self.subject._viewer_watchdog.check()
+
+        self.assertEqual(1, len(self.subject.get_sessions()))  # not removed on the scheduler's thread
+        thread.return_value.start.assert_called_once_with()
+
+        thread.call_args[1]['target'](*thread.call_args[1]['args'])
+
+        self.assertEqual([], self.subject.get_sessions())
+
+    def test_admission_control(self):
+        self.subject._max_sessions = 3
+        self.subject._spawn_point_selector._spawn_points += [Mock(location=Mock(x=200.0, y=0.0))]
+        self.subject._admission_controller = AdmissionController(
+            get_samples=self.subject._get_admission_samples,
+            capacity=HostCapacity(encode_seconds_per_second=0.34),
+            qualities=get_qualities(Quality(fps=30, width=640, height=360)),
+            headroom=0.0
+        )
+        self.subject.start()
+
+        session_1 = self.subject.add_session(('10.0.0.1', 13337))
+        session_2 = self.subject.add_session(('10.0.0.2', 13337))  # only room for a cheaper sensor
+
+        self.assertEqual(Quality(fps=30, width=640, height=360), session_1.quality)
+        self.assertEqual(Quality(fps=15, width=320, height=180), session_2.quality)
+
+        with self.assertRaises(ValueError):
+            self.subject.add_session(('10.0.0.3', 13337))
+
+        self.subject.remove_session(('10.0.0.1', 13337))
+
+        self.assertEqual(Quality(fps=30, width=640, height=360), self.subject.add_session(('10.0.0.3', 13337)).quality)
+
+        stats = self.subject.get_admission_stats()
+        self.assertEqual((2, 3, 1, 1), (stats.sessions, stats.admitted, stats.downgraded, stats.rejected))
+
+    def test_auto_add_sessions(self):
+        self.subject._auto_add_sessions = True
+        self.subject.start()
+
+        self.subject._handle_datagram(Datagram(data=b'\x01', address=('10.0.0.1', 13337)))
+
+        for _ in range(0, 100):
+            if len(self.subject.get_sessions()) > 0:
+                break
+
+            time.sleep(0.01)
+
+        self.assertEqual([('10.0.0.1', 13337)], [x.address for x in self.subject.get_sessions()])
+
+    def test_auto_add_sessions_only_starts_threads_with_room(self):
+        self.subject._auto_add_sessions = True
+        self.subject.start()
+
+        with patch('carla_multiplayer.multiplayer.Thread') as thread:
+            for i in range(0, 100):  # e.g. spoofed or scanning sources
+                self.subject._handle_datagram(Datagram(data=b'\x01', address=('10.0.1.{}'.format(i), 13337)))
+
+        self.assertEqual(2, thread.call_count)  # max_sessions
+        self.assertEqual(2, self.subject._spawning)
+
+    def test_auto_add_sessions_backs_off_from_rejected_addresses(self):
+        self.subject._auto_add_sessions = True
+        self.subject._admission_controller = AdmissionController(
+            get_samples=self.subject._get_admission_samples,
+            capacity=HostCapacity(encode_seconds_per_second=0.0),  # room for nobody
+            headroom=0.0
+        )
+        self.subject.start()
+
+        address = ('10.0.0.1', 13337)
+        with patch('carla_multiplayer.multiplayer.Thread') as thread, patch('builtins.print') as print_:
+            for _ in range(0, 10):  # e.g. controls and keepalives
+                self.subject._handle_datagram(Datagram(data=b'\x01', address=address))
+
+            self.assertEqual(1, self.subject.get_admission_stats().rejected)  # only asked once
+
+            self.subject._rejections[address] = (0.0, self.subject._rejections[address][1])  # backed off for long enough
+            self.subject._handle_datagram(Datagram(data=b'\x01', address=address))
+
+        thread.assert_not_called()
+        print_.assert_called_once()  # not every time
+        self.assertIn('not enough encode_seconds_per_second left', print_.call_args[0][0])
+        self.assertEqual(2, self.subject.get_admission_stats().rejected)
+        self.assertEqual(2.0, self.subject._rejections[address][1])  # doubled
@@ -0,0 +1,314 @@
+import random
+import time
+from threading import Lock
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from .looper import TimedLooper
+from .pool import _PARKED_BELOW_Z
+from .spawn import GridIndex, _CLEARANCE
+from .stats import Histogram, HistogramSnapshot
+
+try:  # cater for python3 -m (module) vs python3 (file)
+    from . import wrapped_carla as carla
+except ImportError:
+    import wrapped_carla as carla
+
+_CARLA_PORT = 2000
+_CARLA_TIMEOUT = 2.0
+_NPC_RATE = 1.0  # 1 Hz; density doesn't need to follow players any faster than this
+_BUDGET = 100  # most NPCs the simulator is allowed to carry, however many players there are
+_NPCS_PER_PLAYER = 20
+_SPAWN_RADIUS = 150.0  # m; NPCs are spawned (and counted as useful) within this of a player
+_MIN_SPAWN_DISTANCE = 30.0  # m; so they don't appear right in front of anyone
+_DESPAWN_RADIUS = 250.0  # m; NPCs further than this from every player are destroyed
+_BATCH_SIZE = 20  # most spawns or destroys per iteration, so a single batch doesn't stall the simulator
+_BLUEPRINT_FILTER = 'vehicle.*'
+_CELL_SIZE = 50.0  # m
+
+
+class NPCStats(NamedTuple):
+    npcs: int
+    players: int
+    target: int
+    spawned: int
+    destroyed: int
+    failed: int  # spawns refused by the simulator (usually an occupied spawn point)
+    batch_duration: HistogramSnapshot
+
+
+def _get_distance_squared(a: carla.Location, b: carla.Location) -> float:
+    return (a.x - b.x) ** 2 + (a.y - b.y) ** 2
+
+
+class NPCManager(TimedLooper):
+    def __init__(self,
+            client: carla.Client,
+            budget: int = _BUDGET,
+            npcs_per_player: int = _NPCS_PER_PLAYER,
+            spawn_radius: float = _SPAWN_RADIUS,
+            min_spawn_distance: float = _MIN_SPAWN_DISTANCE,
+            despawn_radius: float = _DESPAWN_RADIUS,
+            batch_size: int = _BATCH_SIZE,
+            blueprint_filter: str = _BLUEPRINT_FILTER,
+            rate: float = _NPC_RATE,
+            follow_all_vehicles: bool = False):
+        super().__init__(
+            period=rate
+        )
+
+        self._client: carla.Client = client
+        self._budget: int = budget
+        self._npcs_per_player: int = npcs_per_player
+        self._spawn_radius: float = spawn_radius
+        self._min_spawn_distance: float = min_spawn_distance
+        self._despawn_radius: float = despawn_radius
+        self._batch_size: int = batch_size
+        self._blueprint_filter: str = blueprint_filter
+        self._follow_all_vehicles: bool = follow_all_vehicles  # treat every vehicle we didn't spawn as a player
+
+        self._lock: Lock = Lock()
+        self._player_ids: Set[int] = set()
+        self._npc_ids: Set[int] = set()
+        self._spawn_points: Optional[List[carla.Transform]] = None
+        self._spawn_point_index: Optional[GridIndex] = None
+        self._blueprints: Optional[List[carla.ActorBlueprint]] = None
+        self._players: int = 0
+        self._target: int = 0
+        self._spawned: int = 0
+        self._destroyed: int = 0
+        self._failed: int = 0
+        self._batch_duration: Histogram = Histogram()
+
+    def add_player(self, actor_id: int):
+        with self._lock:
+            self._player_ids.add(actor_id)
+
+    def remove_player(self, actor_id: int):
+        with self._lock:
+            self._player_ids.discard(actor_id)
+
+    def set_budget(self, budget: int):
+        with self._lock:
+            self._budget = budget
+
+    def get_stats(self) -> NPCStats:
+        with self._lock:
+            return NPCStats(
+                npcs=len(self._npc_ids),
+                players=self._players,
+                target=self._target,
+                spawned=self._spawned,
+                destroyed=self._destroyed,
+                failed=self._failed,
+                batch_duration=self._batch_duration.snapshot(),
+            )
+
+    def _prepare(self, world: carla.World):
+        if self._spawn_points is None:
+            self._spawn_points = list(world.get_map().get_spawn_points())
+            self._spawn_point_index = GridIndex(cell_size=_CELL_SIZE)
+            for i, transform in enumerate(self._spawn_points):
+                self._spawn_point_index.insert(i, transform.location.x, transform.location.y)
+
+        if self._blueprints is None:
+            self._blueprints = [
+                x for x in world.get_blueprint_library().filter(self._blueprint_filter)
+                if not x.has_attribute('number_of_wheels') or int(x.get_attribute('number_of_wheels')) == 4
+            ]
+            for blueprint in self._blueprints:
+                if blueprint.has_attribute('role_name'):
+                    blueprint.set_attribute('role_name', 'autopilot')
+
+    def _apply_batch(self, commands: List) -> List:
+        started = time.perf_counter()
+
+        responses = self._client.apply_batch_sync(commands)  # one RPC for the whole batch
+
+        self._batch_duration.observe(time.perf_counter() - started)
+
+        return responses
+
+    def _get_players_and_npcs(self, actors: List[carla.Actor]) -> Tuple[List[carla.Location], Dict[int, carla.Location]]:
+        with self._lock:
+            player_ids = set(self._player_ids)
+            npc_ids = set(self._npc_ids)
+
+        players, npcs = [], {}
+        for actor in actors:
+            location = actor.get_location()  # served from the client-side episode state, not an RPC
+            if actor.id in npc_ids:
+                npcs[actor.id] = location
+            elif location.z < _PARKED_BELOW_Z:  # e.g. pooled vehicles; nobody's driving them
+                continue
+            elif actor.id in player_ids or (self._follow_all_vehicles and actor.type_id.startswith('vehicle.')):
+                players += [location]
+
+        return players, npcs
+
+    def _despawn(self, players: List[carla.Location], npcs: Dict[int, carla.Location], target: int) -> List[int]:
+        despawn_radius_squared = self._despawn_radius ** 2
+
+        def get_nearest(actor_id: int) -> float:
+            return min((_get_distance_squared(npcs[actor_id], x) for x in players), default=float('inf'))
+
+        # furthest first, both for those out of range of everyone and for any over the target
+        by_distance = sorted(npcs.keys(), key=get_nearest, reverse=True)
+        out_of_range = [x for x in by_distance if get_nearest(x) > despawn_radius_squared]
+        over_target = by_distance[:max(0, len(npcs) - target)]
+
+        actor_ids = list(dict.fromkeys(out_of_range + over_target))[:self._batch_size]
+        if len(actor_ids) == 0:
+            return []
+
+        self._apply_batch([carla.command.DestroyActor(x) for x in actor_ids])
+
+        return actor_ids
+
+    def _get_spawn_transforms(self, players: List[carla.Location], npcs: Dict[int, carla.Location], count: int) -> List[carla.Transform]:
+        occupied = GridIndex()
+        for actor_id, location in npcs.items():
+            occupied.insert(actor_id, location.x, location.y)
+        for i, location in enumerate(players):
+            occupied.insert(('player', i), location.x, location.y)
+
+        # fair; the players with the fewest NPCs around them are served first, one at a time
+        spawn_radius_squared = self._spawn_radius ** 2
+        nearby = [
+            len([x for x in npcs.values() if _get_distance_squared(x, player) < spawn_radius_squared]) for player in players
+        ]
+
+        candidates_by_player = []
+        for player in players:
+            candidates = [
+                x for x in self._spawn_point_index.get_within(player.x, player.y, self._spawn_radius)
+                if _get_distance_squared(self._spawn_points[x].location, player) >= self._min_spawn_distance ** 2
+            ]
+            random.shuffle(candidates)
+            candidates_by_player += [candidates]
+
+        used: Set[int] = set()
+        transforms = []
+        while len(transforms) < count:
+            order = sorted(range(0, len(players)), key=lambda x: nearby[x])
+            found = False
+
+            for i in order:
+                while len(candidates_by_player[i]) > 0:
+                    index = candidates_by_player[i].pop()
+                    location = self._spawn_points[index].location
+                    if index in used or occupied.any_within(location.x, location.y, _CLEARANCE):
+                        continue
+
+                    used.add(index)
+                    transforms += [self._spawn_points[index]]
+                    nearby[i] += 1
+                    found = True
+                    break
+
+                if found:
+                    break
+
+            if not found:  # nowhere left near anyone
+                break
+
+        return transforms
+
+    def _spawn(self, transforms: List[carla.Transform]) -> Tuple[List[int], int]:
+        if len(transforms) == 0 or len(self._blueprints) == 0:
+            return [], 0
+
+        commands = [
+            carla.command.SpawnActor(random.choice(self._blueprints), x).then(
+                carla.command.SetAutopilot(carla.command.FutureActor, True)
+            )
+            for x in transforms
+        ]
+
+        actor_ids, failed = [], 0
+        for response in self._apply_batch(commands):
+            if response.error:
+                failed += 1
+            else:
+                actor_ids += [response.actor_id]
+
+        return actor_ids, failed
+
+    def _work(self):
+        world = self._client.get_world()
+        self._prepare(world)
+
+        players, npcs = self._get_players_and_npcs(world.get_actors())  # one RPC for every position we need
+
+        with self._lock:
+            target = min(self._budget, self._npcs_per_player * len(players))
+
+            # forget any destroyed by someone else
+            self._npc_ids = set(npcs.keys())
+            self._players = len(players)
+            self._target = target
+
+        destroyed = self._despawn(players, npcs, target)
+        for actor_id in destroyed:
+            npcs.pop(actor_id)
+
+        spawned, failed = [], 0
+        if len(npcs) < target:
+            transforms = self._get_spawn_transforms(players, npcs, min(self._batch_size, target - len(npcs)))
+            spawned, failed = self._spawn(transforms)
+
+        with self._lock:
+            self._npc_ids.difference_update(destroyed)
+            self._npc_ids.update(spawned)
+            self._destroyed += len(destroyed)
+            self._spawned += len(spawned)
+            self._failed += failed
+
+    def _after_loop(self):
+        with self._lock:
+            actor_ids = list(self._npc_ids)
+            self._npc_ids = set()
+            self._destroyed += len(actor_ids)
+
+        if len(actor_ids) == 0:
+            return
+
+        self._apply_batch([carla.command.DestroyActor(x) for x in actor_ids])
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--carla-host', type=str, required=True)
+    parser.add_argument('--carla-port', type=int, default=_CARLA_PORT)
+    parser.add_argument('--carla-timeout', type=float, default=_CARLA_TIMEOUT)
+    parser.add_argument('--budget', type=int, default=_BUDGET)
+    parser.add_argument('--npcs-per-player', type=int, default=_NPCS_PER_PLAYER)
+    parser.add_argument('--spawn-radius', type=float, default=_SPAWN_RADIUS)
+    parser.add_argument('--despawn-radius', type=float, default=_DESPAWN_RADIUS)
+    parser.add_argument('--batch-size', type=int, default=_BATCH_SIZE)
+
+    args = parser.parse_args()
+
+    _client = carla.Client(args.carla_host, args.carla_port)
+    _client.set_timeout(args.carla_timeout)
+
+    _npc_manager = NPCManager(
+        client=_client,
+        budget=args.budget,
+        npcs_per_player=args.npcs_per_player,
+        spawn_radius=args.spawn_radius,
+        despawn_radius=args.despawn_radius,
+        batch_size=args.batch_size,
+        follow_all_vehicles=True
+    )
+    _npc_manager.start()
+
+    while 1:
+        try:
+            time.sleep(1)
+            print(_npc_manager.get_stats())
+        except KeyboardInterrupt:
+            break
+
+    _npc_manager.stop()
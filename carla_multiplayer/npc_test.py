@@ -0,0 +1,109 @@
+import unittest
+
+from mock import Mock
+
+from .npc import NPCManager, carla
+from .pool import _PARKING_Z
+
+
+def _get_actor(actor_id: int, x: float, type_id: str = 'vehicle.tesla.model3', z: float = 0.0) -> Mock:
+    actor = Mock(id=actor_id, type_id=type_id)
+    actor.get_location.return_value = Mock(x=x, y=0.0, z=z)
+
+    return actor
+
+
+class NPCManagerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        carla.command.reset_mock()
+
+        self.client = Mock()
+        self.world = self.client.get_world.return_value
+        self.world.get_map.return_value.get_spawn_points.return_value = [
+            Mock(location=Mock(x=x * 40.0, y=0.0)) for x in range(0, 20)  # 0 m - 760 m
+        ]
+        blueprint = Mock()
+        blueprint.has_attribute.return_value = False
+        self.world.get_blueprint_library.return_value.filter.return_value = [blueprint]
+
+        self.actors = {1: _get_actor(1, 0.0)}  # the player
+        self.world.get_actors.side_effect = lambda: list(self.actors.values())
+
+        actor_ids = iter(range(100, 200))
+
+        def apply_batch_sync(commands):
+            responses = []
+            for i, _ in enumerate(commands):
+                responses += [Mock(error='occupied' if i == 0 and self.refuse_first else '', actor_id=next(actor_ids))]
+
+            return responses
+
+        self.refuse_first = False
+        self.client.apply_batch_sync.side_effect = apply_batch_sync
+
+        self.subject = NPCManager(
+            self.client,
+            budget=10,
+            npcs_per_player=3,
+            spawn_radius=150.0,
+            min_spawn_distance=30.0,
+            despawn_radius=250.0,
+            batch_size=2
+        )
+
+    def _settle(self):  # as if the spawned NPCs had been placed where they were asked to be
+        for (args, _), actor_id in zip(carla.command.SpawnActor.call_args_list, sorted(self.subject._npc_ids)):
+            self.actors[actor_id] = _get_actor(actor_id, args[1].location.x)
+
+    def test_no_players(self):
+        self.actors = {}
+
+        self.subject._work()
+
+        self.client.apply_batch_sync.assert_not_called()
+        self.assertEqual(0, self.subject.get_stats().target)
+
+    def test_parked_vehicles_arent_players(self):
+        self.actors = {1: _get_actor(1, 0.0, z=_PARKING_Z)}  # e.g. pooled, right under the spawn points
+        self.subject._follow_all_vehicles = True
+
+        self.subject._work()
+
+        self.client.apply_batch_sync.assert_not_called()
+        self.assertEqual(0, self.subject.get_stats().target)
+
+    def test_spawn_near_players_in_batches(self):
+        self.subject.add_player(1)
+
+        self.subject._work()
+
+        self.assertEqual(1, self.client.apply_batch_sync.call_count)  # one RPC for the whole batch
+        self.assertEqual(2, len(self.client.apply_batch_sync.call_args[0][0]))
+        carla.command.SetAutopilot.assert_called_with(carla.command.FutureActor, True)
+        for args, _ in carla.command.SpawnActor.call_args_list:
+            self.assertTrue(30.0 <= args[1].location.x < 150.0)
+
+        self._settle()
+        self.refuse_first = True
+        self.subject._work()  # only one more needed
+
+        self.assertEqual(1, len(self.client.apply_batch_sync.call_args[0][0]))
+
+        stats = self.subject.get_stats()
+        self.assertEqual((2, 1, 3, 2, 0, 1), tuple(stats)[:6])
+
+    def test_despawn_and_stop(self):
+        self.subject.add_player(1)
+        self.subject._work()
+        self._settle()
+
+        self.actors[1] = _get_actor(1, 700.0)  # drove away from them
+        self.subject._work()
+
+        carla.command.DestroyActor.assert_any_call(100)
+        carla.command.DestroyActor.assert_any_call(101)
+        self.assertEqual(2, self.subject.get_stats().destroyed)
+
+        self.subject._after_loop()  # anything left is destroyed in one batch
+
+        self.assertEqual(0, self.subject.get_stats().npcs)
@@ -0,0 +1,121 @@
+import time
+import traceback
+from threading import Lock
+from typing import Callable, List, NamedTuple, Optional
+
+from .looper import TimedLooper
+from .stats import Histogram, HistogramSnapshot
+
+try:  # cater for python3 -m (module) vs python3 (file)
+    from . import wrapped_carla as carla
+except ImportError:
+    import wrapped_carla as carla
+
+_FIXED_DELTA_SECONDS = 1.0 / 30.0  # matches the default sensor fps
+
+
+class TickStats(NamedTuple):
+    ticks: int
+    frame: Optional[int]
+    tick_duration: HistogramSnapshot  # just world.tick()
+    work_duration: HistogramSnapshot  # before tick callbacks, world.tick() and after tick callbacks
+    headroom: Optional[float]  # mean fraction of fixed_delta_seconds left over after the work; negative means we can't keep up
+
+
+class TickOrchestrator(TimedLooper):
+    _schedulable = False  # world.tick() blocks until the simulator has stepped
+
+    def __init__(self, client: carla.Client, fixed_delta_seconds: float = _FIXED_DELTA_SECONDS):
+        super().__init__(
+            period=fixed_delta_seconds
+        )
+
+        self._client: carla.Client = client
+        self._fixed_delta_seconds: float = fixed_delta_seconds
+
+        self._lock: Lock = Lock()
+        self._before_tick_callbacks: List[Callable[[], None]] = []
+        self._after_tick_callbacks: List[Callable[[int], None]] = []
+
+        self._world: Optional[carla.World] = None
+        self._original_settings: Optional[carla.WorldSettings] = None
+        self._frame: Optional[int] = None
+        self._tick_duration: Histogram = Histogram()
+        self._work_duration: Histogram = Histogram()
+
+    def add_before_tick(self, callback: Callable[[], None]):
+        with self._lock:
+            self._before_tick_callbacks += [callback]
+
+    def remove_before_tick(self, callback: Callable[[], None]):
+        with self._lock:
+            self._before_tick_callbacks = [x for x in self._before_tick_callbacks if x != callback]
+
+    def add_after_tick(self, callback: Callable[[int], None]):
+        with self._lock:
+            self._after_tick_callbacks += [callback]
+
+    def remove_after_tick(self, callback: Callable[[int], None]):
+        with self._lock:
+            self._after_tick_callbacks = [x for x in self._after_tick_callbacks if x != callback]
+
+    def get_stats(self) -> TickStats:
+        work_duration = self._work_duration.snapshot()
+
+        headroom = None
+        if work_duration.count > 0:
+            headroom = 1.0 - (work_duration.mean / self._fixed_delta_seconds)
+
+        return TickStats(
+            ticks=work_duration.count,
+            frame=self._frame,
+            tick_duration=self._tick_duration.snapshot(),
+            work_duration=work_duration,
+            headroom=headroom,
+        )
+
+    def _call(self, callback: Callable, *args):
+        try:
+            callback(*args)
+        except Exception as e:
+            print('attempt to call {} in {} raised {}; traceback follows'.format(
+                repr(callback),
+                repr(self),
+                repr(e)
+            ))
+            traceback.print_exc()
+
+    def _before_loop(self):
+        self._world = self._client.get_world()
+        self._original_settings = self._world.get_settings()
+
+        settings = self._world.get_settings()
+        settings.synchronous_mode = True
+        settings.fixed_delta_seconds = self._fixed_delta_seconds
+        self._world.apply_settings(settings)
+
+    def _work(self):
+        with self._lock:
+            before_tick_callbacks = list(self._before_tick_callbacks)
+            after_tick_callbacks = list(self._after_tick_callbacks)
+
+        work_started = time.perf_counter()
+
+        for callback in before_tick_callbacks:  # e.g. apply all pending controls
+            self._call(callback)
+
+        tick_started = time.perf_counter()
+        self._frame = self._world.tick()
+        self._tick_duration.observe(time.perf_counter() - tick_started)
+
+        for callback in after_tick_callbacks:  # e.g. dispatch the frames captured during this tick
+            self._call(callback, self._frame)
+
+        self._work_duration.observe(time.perf_counter() - work_started)
+
+    def _after_loop(self):
+        if self._world is not None and self._original_settings is not None:
+            self._world.apply_settings(self._original_settings)
+
+        self._world = None
+        self._original_settings = None
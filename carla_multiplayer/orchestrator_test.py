@@ -0,0 +1,58 @@
+import time
+import unittest
+
+from mock import Mock, call
+
+from .orchestrator import TickOrchestrator
+
+
+class TickOrchestratorTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = Mock()
+        self.world = self.client.get_world.return_value
+        self.world.tick.side_effect = range(1, 1000)
+
+        self.subject = TickOrchestrator(self.client, fixed_delta_seconds=0.05)
+
+    def tearDown(self) -> None:
+        self.subject.stop()
+
+    def test_lifecycle(self):
+        calls = Mock()
+
+        self.subject.add_before_tick(calls.apply_controls)
+        self.subject.add_after_tick(calls.dispatch_frames)
+        self.subject.add_after_tick(Mock(side_effect=Exception('broken')))  # shouldn't stop the loop
+
+        self.subject.start()
+        time.sleep(0.22)
+        self.subject.stop()
+
+        settings = self.world.get_settings.return_value
+        self.assertTrue(settings.synchronous_mode)
+        self.assertEqual(0.05, settings.fixed_delta_seconds)
+        self.assertEqual(2, len(self.world.apply_settings.mock_calls))  # synchronous, then the original settings restored
+
+        stats = self.subject.get_stats()
+        self.assertGreaterEqual(stats.ticks, 4)
+        self.assertEqual(stats.ticks, stats.frame)
+        self.assertGreater(stats.headroom, 0.5)
+
+        self.assertEqual(
+            [call.apply_controls(), call.dispatch_frames(1), call.apply_controls(), call.dispatch_frames(2)],
+            calls.mock_calls[:4]
+        )
+
+    def test_remove_callbacks(self):
+        callback = Mock()
+
+        self.subject.add_before_tick(callback)
+        self.subject.remove_before_tick(callback)
+        self.subject.add_after_tick(callback)
+        self.subject.remove_after_tick(callback)
+
+        self.subject.start()
+        time.sleep(0.1)
+        self.subject.stop()
+
+        callback.assert_not_called()
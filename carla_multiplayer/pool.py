@@ -0,0 +1,214 @@
+import time
+from threading import Lock
+from typing import Dict, List, NamedTuple, Optional
+
+from .looper import TimedLooper
+from .sensor import create_sensor, _SENSOR_BLUEPRINT_NAME, _SENSOR_TRANSFORM, _FPS, _WIDTH, _HEIGHT
+from .stats import Histogram, HistogramSnapshot
+from .vehicle import create_vehicle, _SAFE_CONTROL
+
+try:  # cater for python3 -m (module) vs python3 (file)
+    from . import wrapped_carla as carla
+except ImportError:
+    import wrapped_carla as carla
+
+_REFILL_RATE = 1.0 / 2.0  # 2 Hz; at most one spawn per blueprint per iteration so as not to stall the simulator
+_PARKING_Z = -100.0  # under the map, out of sight, with physics off so they don't fall forever
+_PARKING_SPACING = 10.0
+_PARKED_BELOW_Z = _PARKING_Z / 2.0  # m; actors below this are parked, don't occupy anything and aren't anyone's player
+
+
+class ActorPair(NamedTuple):
+    blueprint_name: str
+    vehicle: carla.Actor
+    sensor: carla.Actor
+
+
+class PoolStats(NamedTuple):
+    parked: Dict[str, int]  # blueprint name -> pairs ready to hand out
+    hits: int  # acquires served from the pool
+    misses: int  # acquires that had to spawn
+    spawned: int
+    recycled: int  # released pairs parked for reuse
+    destroyed: int  # released pairs destroyed because the pool was already at its target
+    acquire_duration: HistogramSnapshot
+
+
+def _get_parking_transform(slot: int) -> carla.Transform:
+    return carla.Transform(carla.Location(x=slot * _PARKING_SPACING, y=0.0, z=_PARKING_Z))
+
+
+class ActorPool(TimedLooper):
+    def __init__(self,
+            client: carla.Client,
+            targets: Dict[str, int],
+            sensor_blueprint_name: str = _SENSOR_BLUEPRINT_NAME,
+            sensor_transform: carla.Transform = _SENSOR_TRANSFORM,
+            fps: int = _FPS,
+            width: int = _WIDTH,
+            height: int = _HEIGHT,
+            refill_rate: float = _REFILL_RATE):
+        super().__init__(
+            period=refill_rate
+        )
+
+        self._client: carla.Client = client
+        self._targets: Dict[str, int] = dict(targets)  # vehicle blueprint name -> pairs to keep parked
+        self._sensor_blueprint_name: str = sensor_blueprint_name
+        self._sensor_transform: carla.Transform = sensor_transform
+        self._fps: int = fps
+        self._width: int = width
+        self._height: int = height
+
+        self._lock: Lock = Lock()
+        self._parked: Dict[str, List[ActorPair]] = {x: [] for x in self._targets.keys()}
+        self._next_slot: int = 0
+        self._free_slots: List[int] = []
+        self._slots_by_vehicle_id: Dict[int, int] = {}
+        self._hits: int = 0
+        self._misses: int = 0
+        self._spawned: int = 0
+        self._recycled: int = 0
+        self._destroyed: int = 0
+        self._acquire_duration: Histogram = Histogram()
+
+    def set_target(self, blueprint_name: str, target: int):
+        with self._lock:
+            self._targets[blueprint_name] = target
+            self._parked.setdefault(blueprint_name, [])
+
+    def get_stats(self) -> PoolStats:
+        with self._lock:
+            return PoolStats(
+                parked={k: len(v) for k, v in self._parked.items()},
+                hits=self._hits,
+                misses=self._misses,
+                spawned=self._spawned,
+                recycled=self._recycled,
+                destroyed=self._destroyed,
+                acquire_duration=self._acquire_duration.snapshot(),
+            )
+
+    def _allocate_slot(self, vehicle_id: int) -> int:
+        with self._lock:
+            if len(self._free_slots) > 0:
+                slot = self._free_slots.pop()
+            else:
+                slot = self._next_slot
+                self._next_slot += 1
+
+            self._slots_by_vehicle_id[vehicle_id] = slot
+
+        return slot
+
+    def _free_slot(self, vehicle_id: int):
+        with self._lock:
+            slot = self._slots_by_vehicle_id.pop(vehicle_id, None)
+            if slot is not None:
+                self._free_slots.append(slot)
+
+    def _park(self, pair: ActorPair):
+        pair.sensor.stop()  # no-op unless someone was listening
+        pair.vehicle.set_simulate_physics(False)
+        pair.vehicle.apply_control(_SAFE_CONTROL)
+        pair.vehicle.set_transform(_get_parking_transform(self._allocate_slot(pair.vehicle.id)))
+
+    def _spawn(self, blueprint_name: str) -> ActorPair:
+        with self._lock:
+            slot = self._next_slot
+            self._next_slot += 1
+
+        vehicle = create_vehicle(self._client, blueprint_name, _get_parking_transform(slot))
+        vehicle.set_simulate_physics(False)
+
+        with self._lock:
+            self._slots_by_vehicle_id[vehicle.id] = slot
+
+        sensor = create_sensor(
+            client=self._client,
+            actor_id=vehicle.id,
+            sensor_blueprint_name=self._sensor_blueprint_name,
+            fps=self._fps,
+            width=self._width,
+            height=self._height,
+            transform=self._sensor_transform
+        )
+
+        with self._lock:
+            self._spawned += 1
+
+        return ActorPair(
+            blueprint_name=blueprint_name,
+            vehicle=vehicle,
+            sensor=sensor,
+        )
+
+    def acquire(self, blueprint_name: str, transform: carla.Transform) -> ActorPair:
+        started = time.perf_counter()
+
+        with self._lock:
+            parked = self._parked.get(blueprint_name)
+            pair = parked.pop() if parked else None
+
+            if pair is not None:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+        if pair is None:
+            pair = self._spawn(blueprint_name)
+
+        self._free_slot(pair.vehicle.id)
+
+        pair.vehicle.set_transform(transform)
+        pair.vehicle.set_simulate_physics(True)
+
+        self._acquire_duration.observe(time.perf_counter() - started)
+
+        return pair
+
+    def release(self, pair: ActorPair):
+        with self._lock:
+            recycle = len(self._parked.get(pair.blueprint_name, [])) < self._targets.get(pair.blueprint_name, 0)
+
+        if not recycle:
+            self._destroy(pair)
+
+            with self._lock:
+                self._destroyed += 1
+
+            return
+
+        self._park(pair)
+
+        with self._lock:
+            self._parked[pair.blueprint_name].append(pair)
+            self._recycled += 1
+
+    def _destroy(self, pair: ActorPair):
+        self._free_slot(pair.vehicle.id)
+
+        pair.sensor.stop()
+        pair.sensor.destroy()
+        pair.vehicle.destroy()
+
+    def _get_shortfall(self) -> List[str]:
+        with self._lock:
+            return [k for k, v in self._targets.items() if len(self._parked.get(k, [])) < v]
+
+    def _work(self):
+        for blueprint_name in self._get_shortfall():
+            pair = self._spawn(blueprint_name)
+
+            with self._lock:
+                self._parked[blueprint_name].append(pair)
+
+    def _after_loop(self):
+        with self._lock:
+            pairs = [x for parked in self._parked.values() for x in parked]
+            self._parked = {x: [] for x in self._targets.keys()}
+
+        for pair in pairs:
+            self._destroy(pair)
+
+        self._client.get_world().wait_for_tick()
@@ -0,0 +1,72 @@
+import unittest
+
+from mock import Mock
+
+from .pool import ActorPool, carla
+
+
+class ActorPoolTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = Mock()
+
+        actor_ids = iter(range(1, 100))
+        self.client.get_world.return_value.spawn_actor.side_effect = lambda *args, **kwargs: Mock(id=next(actor_ids))
+
+        self.subject = ActorPool(self.client, {'vehicle.tesla.model3': 2})
+
+    def test_refill_and_acquire(self):
+        self.subject._work()
+        self.subject._work()
+        self.subject._work()  # already at target
+
+        stats = self.subject.get_stats()
+        self.assertEqual({'vehicle.tesla.model3': 2}, stats.parked)
+        self.assertEqual(2, stats.spawned)
+
+        transform = carla.Transform()
+        pair = self.subject.acquire('vehicle.tesla.model3', transform)
+
+        pair.vehicle.set_transform.assert_called_with(transform)
+        pair.vehicle.set_simulate_physics.assert_called_with(True)
+
+        self.subject.acquire('vehicle.tesla.model3', transform)
+        self.subject.acquire('vehicle.tesla.model3', transform)  # empty; spawned on demand
+
+        stats = self.subject.get_stats()
+        self.assertEqual({'vehicle.tesla.model3': 0}, stats.parked)
+        self.assertEqual(2, stats.hits)
+        self.assertEqual(1, stats.misses)
+        self.assertEqual(3, stats.spawned)
+        self.assertEqual(3, stats.acquire_duration.count)
+
+    def test_release(self):
+        pairs = [self.subject.acquire('vehicle.tesla.model3', carla.Transform()) for _ in range(0, 3)]
+        other_pair = self.subject.acquire('vehicle.audi.tt', carla.Transform())
+
+        for pair in pairs + [other_pair]:
+            self.subject.release(pair)
+
+        for pair in pairs[0:2]:
+            pair.vehicle.set_simulate_physics.assert_called_with(False)
+            pair.vehicle.destroy.assert_not_called()
+
+        for pair in [pairs[2], other_pair]:  # over target, or no target at all
+            pair.vehicle.destroy.assert_called_once_with()
+            pair.sensor.destroy.assert_called_once_with()
+
+        stats = self.subject.get_stats()
+        self.assertEqual(2, stats.recycled)
+        self.assertEqual(2, stats.destroyed)
+
+        self.assertIs(pairs[1], self.subject.acquire('vehicle.tesla.model3', carla.Transform()))
+
+    def test_after_loop(self):
+        self.subject._work()
+        pairs = list(self.subject._parked['vehicle.tesla.model3'])
+
+        self.subject._after_loop()
+
+        for pair in pairs:
+            pair.vehicle.destroy.assert_called_once_with()
+
+        self.assertEqual({'vehicle.tesla.model3': 0}, self.subject.get_stats().parked)
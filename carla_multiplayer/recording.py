@@ -0,0 +1,102 @@
+import datetime
+import json
+from threading import Lock
+from typing import IO, List, NamedTuple, Optional
+
+from .controller import ControllerState, RawControllerState
+
+_CONTROLLER_STATE = 'controller_state'
+_RAW_CONTROLLER_STATE = 'raw_controller_state'
+
+
+class RecordedControllerState(NamedTuple):
+    timestamp: float  # seconds since the recording started
+    controller_state: ControllerState
+
+
+class RecordedRawControllerState(NamedTuple):
+    timestamp: float  # seconds since the recording started
+    raw_controller_state: RawControllerState
+
+
+class Recorder(object):
+    def __init__(self, path: str):
+        self._path: str = path
+
+        self._lock: Lock = Lock()
+        self._file: Optional[IO] = None
+        self._started: Optional[datetime.datetime] = None
+
+    def _write(self, kind: str, data: dict):
+        with self._lock:
+            if self._file is None:
+                return
+
+            self._file.write(json.dumps({
+                'timestamp': (datetime.datetime.now() - self._started).total_seconds(),
+                'type': kind,
+                'data': data,
+            }) + '\n')
+
+    def record_controller_state(self, controller_state: ControllerState):
+        self._write(_CONTROLLER_STATE, controller_state._asdict())
+
+    def record_raw_controller_state(self, raw_controller_state: RawControllerState):
+        # the event handler mutates these dicts in place, so they need to be serialized right away
+        self._write(_RAW_CONTROLLER_STATE, raw_controller_state._asdict())
+
+    def start(self):
+        with self._lock:
+            if self._file is not None:
+                return
+
+            self._file = open(self._path, 'w')
+            self._started = datetime.datetime.now()
+
+    def stop(self):
+        with self._lock:
+            if self._file is None:
+                return
+
+            self._file.close()
+            self._file = None
+
+
+def _read_recording(path: str, kind: str) -> List[dict]:
+    entries = []
+
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line == '':
+                continue
+
+            entry = json.loads(line)
+            if entry['type'] != kind:
+                continue
+
+            entries += [entry]
+
+    return entries
+
+
+def read_controller_states(path: str) -> List[RecordedControllerState]:
+    return [
+        RecordedControllerState(
+            timestamp=entry['timestamp'],
+            controller_state=ControllerState(**entry['data'])
+        ) for entry in _read_recording(path, _CONTROLLER_STATE)
+    ]
+
+
+def read_raw_controller_states(path: str) -> List[RecordedRawControllerState]:
+    return [
+        RecordedRawControllerState(
+            timestamp=entry['timestamp'],
+            raw_controller_state=RawControllerState(  # JSON object keys are always strings
+                axis_data={int(k): v for k, v in entry['data']['axis_data'].items()},
+                button_data={int(k): v for k, v in entry['data']['button_data'].items()},
+                hat_data={int(k): tuple(v) for k, v in entry['data']['hat_data'].items()},
+            )
+        ) for entry in _read_recording(path, _RAW_CONTROLLER_STATE)
+    ]
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+
+from .controller import ControllerState, RawControllerState
+from .recording import Recorder, read_controller_states, read_raw_controller_states
+
+_CONTROLLER_STATE = ControllerState(
+    throttle=0.75,
+    brake=0.0,
+    steer=-0.33,
+    hand_brake=False,
+    reverse=True,
+    reset=False,
+)
+
+
+class RecorderTest(unittest.TestCase):
+    def setUp(self) -> None:
+        handle, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+
+        self.subject = Recorder(self.path)
+
+    def tearDown(self) -> None:
+        self.subject.stop()
+        os.remove(self.path)
+
+    def test_round_trip(self):
+        axis_data = {0: 0.5, 1: None}
+        raw_controller_state = RawControllerState(
+            axis_data=axis_data,
+            button_data={0: True},
+            hat_data={0: (1, -1)}
+        )
+
+        self.subject.record_controller_state(_CONTROLLER_STATE)  # not started; ignored
+
+        self.subject.start()
+        self.subject.record_raw_controller_state(raw_controller_state)
+        axis_data[0] = 1.0  # mutated in place after recording, like the event handler does
+        self.subject.record_controller_state(_CONTROLLER_STATE)
+        self.subject.record_controller_state(_CONTROLLER_STATE._replace(throttle=0.0))
+        self.subject.stop()
+
+        recorded_controller_states = read_controller_states(self.path)
+        self.assertEqual(
+            [_CONTROLLER_STATE, _CONTROLLER_STATE._replace(throttle=0.0)],
+            [x.controller_state for x in recorded_controller_states]
+        )
+        self.assertLessEqual(recorded_controller_states[0].timestamp, recorded_controller_states[1].timestamp)
+
+        recorded_raw_controller_states = read_raw_controller_states(self.path)
+        self.assertEqual(
+            [RawControllerState(axis_data={0: 0.5, 1: None}, button_data={0: True}, hat_data={0: (1, -1)})],
+            [x.raw_controller_state for x in recorded_raw_controller_states]
+        )
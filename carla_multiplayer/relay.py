@@ -0,0 +1,265 @@
+import time
+from queue import Full
+from threading import Lock
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .controller import SequenceNumber, deserialize_controller_states, filter_unseen_controller_states, get_epoch, \
+    serialize_controller_states
+from .stats import Histogram, HistogramSnapshot
+from .telemetry import is_telemetry
+from .udp import Datagram, Receiver, Sender
+from .viewer import is_viewer_keepalive, _KEEPALIVE_RATE
+
+_QUEUE_SIZE = 2  # per client
+_MAX_CLIENTS = 64
+_CLIENT_TIMEOUT = 5.0  # s without hearing from a client before we stop sending to it
+_DRIVER_TIMEOUT = 2.0  # s without controls from the driver before another client can take over
+
+
+class HopStats(NamedTuple):
+    datagrams_in: int
+    bytes_in: int
+    datagrams_out: int
+    bytes_out: int
+    dropped: int  # full queues, or controls from a client that isn't driving (or that are invalid or stale)
+
+
+class RelayStats(NamedTuple):
+    upstream: HopStats  # between us and the server
+    downstream: HopStats  # between us and the clients
+    clients: int
+    driver: Optional[Tuple[str, int]]
+    cached_frame_age: Optional[float]  # s since the frame a joining client is sent straight away
+    relay_latency: HistogramSnapshot  # from receiving a frame to it being queued for every client
+
+
+class _Hop(object):
+    def __init__(self):
+        self.datagrams_in: int = 0
+        self.bytes_in: int = 0
+        self.datagrams_out: int = 0
+        self.bytes_out: int = 0
+        self.dropped: int = 0
+
+    def snapshot(self) -> HopStats:
+        return HopStats(self.datagrams_in, self.bytes_in, self.datagrams_out, self.bytes_out, self.dropped)
+
+
+class Relay(object):
+    def __init__(self,
+            port: int,
+            server_host: str,
+            server_port: int,
+            upstream_port: int = 0,
+            queue_size: int = _QUEUE_SIZE,
+            max_clients: int = _MAX_CLIENTS,
+            client_timeout: float = _CLIENT_TIMEOUT,
+            driver_timeout: float = _DRIVER_TIMEOUT,
+            clock: Callable[[], float] = time.monotonic):
+        self._port: int = port
+        self._server_address: Tuple[str, int] = (server_host, server_port)
+        self._max_clients: int = max_clients
+        self._client_timeout: float = client_timeout
+        self._driver_timeout: float = driver_timeout
+        self._clock: Callable[[], float] = clock
+
+        # one subscription to the server, however many clients there are
+        self._upstream_receiver: Receiver = Receiver(
+            port=upstream_port,
+            queue_size=queue_size,
+            callback=self._handle_upstream_datagram
+        )
+        self._upstream_sender: Sender = Sender(
+            port=upstream_port,
+            queue_size=queue_size,
+            use_socket_from=self._upstream_receiver
+        )
+
+        self._downstream_receiver: Receiver = Receiver(
+            port=self._port,
+            queue_size=queue_size * max_clients,
+            callback=self._handle_downstream_datagram
+        )
+        self._downstream_sender: Sender = Sender(
+            port=self._port,
+            queue_size=queue_size * max_clients,
+            use_socket_from=self._downstream_receiver
+        )
+
+        self._lock: Lock = Lock()
+        self._clients: Dict[Tuple[str, int], float] = {}  # address -> last heard from
+        self._driver: Optional[Tuple[str, int]] = None
+        self._driver_last_seen: float = 0.0
+        self._driver_sequence: Optional[SequenceNumber] = None  # the newest seen from the driver, in its own stream
+
+        # controls go upstream as one stream of ours, whoever is driving, so a handover doesn't look like reordering
+        self._epoch: int = get_epoch()
+        self._upstream_sequence: int = 0
+        self._cached_frame: Optional[bytes] = None
+        self._cached_frame_time: Optional[float] = None
+        self._last_keepalive_forwarded: Optional[float] = None
+        self._upstream: _Hop = _Hop()
+        self._downstream: _Hop = _Hop()
+        self._relay_latency: Histogram = Histogram()
+
+    def get_stats(self) -> RelayStats:
+        now = self._clock()
+
+        with self._lock:
+            return RelayStats(
+                upstream=self._upstream.snapshot(),
+                downstream=self._downstream.snapshot(),
+                clients=len(self._clients),
+                driver=self._driver,
+                cached_frame_age=now - self._cached_frame_time if self._cached_frame_time is not None else None,
+                relay_latency=self._relay_latency.snapshot(),
+            )
+
+    def _send(self, sender: Sender, hop: _Hop, data: bytes, address: Tuple[str, int]):
+        try:
+            sender.send_datagram(data, address)
+        except Full:
+            hop.dropped += 1
+            return
+
+        hop.datagrams_out += 1
+        hop.bytes_out += len(data)
+
+    def _get_clients(self, now: float) -> List[Tuple[str, int]]:
+        expired = [k for k, v in self._clients.items() if now - v > self._client_timeout]
+        for address in expired:
+            self._clients.pop(address)
+
+        return list(self._clients.keys())
+
+    def _get_upstream_controls(self, data: bytes, last_sequence: Optional[SequenceNumber]) -> Optional[bytes]:
+        try:
+            sequence, controller_states = deserialize_controller_states(data)
+        except ValueError:
+            return None
+
+        if sequence is None:  # unsequenced (older clients); nothing to renumber
+            return data
+
+        self._driver_sequence, unseen_controller_states, current = filter_unseen_controller_states(
+            last_sequence,
+            sequence,
+            controller_states
+        )
+        if not current:
+            return None
+
+        # advanced by as many states as were new to us, so the server picks out the same ones from the bundle
+        self._upstream_sequence += len(unseen_controller_states)
+
+        return serialize_controller_states(controller_states, self._upstream_sequence, self._epoch)
+
+    def _handle_upstream_datagram(self, datagram: Datagram):
+        started = time.perf_counter()
+        now = self._clock()
+
+        with self._lock:
+            self._upstream.datagrams_in += 1
+            self._upstream.bytes_in += len(datagram.data)
+
+            # every frame is a WebP keyframe, so the latest one is all a joining client needs
+            if not is_telemetry(datagram.data):
+                self._cached_frame = datagram.data
+                self._cached_frame_time = now
+
+            for address in self._get_clients(now):
+                self._send(self._downstream_sender, self._downstream, datagram.data, address)
+
+        self._relay_latency.observe(time.perf_counter() - started)
+
+    def _handle_downstream_datagram(self, datagram: Datagram):
+        now = self._clock()
+
+        with self._lock:
+            self._downstream.datagrams_in += 1
+            self._downstream.bytes_in += len(datagram.data)
+
+            joined = datagram.address not in self._clients
+            if joined and len(self._clients) >= self._max_clients:
+                self._downstream.dropped += 1
+                return
+
+            self._clients[datagram.address] = now
+
+            if joined and self._cached_frame is not None:  # something to look at now rather than at the next frame
+                self._send(self._downstream_sender, self._downstream, self._cached_frame, datagram.address)
+
+            if is_viewer_keepalive(datagram.data):
+                # the server only needs to know that somebody is watching, not how many
+                if self._last_keepalive_forwarded is not None and now - self._last_keepalive_forwarded < _KEEPALIVE_RATE:
+                    return
+
+                self._last_keepalive_forwarded = now
+                data = datagram.data
+            else:
+                driver_expired = self._driver is None or now - self._driver_last_seen > self._driver_timeout
+                if datagram.address != self._driver and not driver_expired:
+                    self._downstream.dropped += 1
+                    return
+
+                data = self._get_upstream_controls(
+                    datagram.data,
+                    self._driver_sequence if datagram.address == self._driver else None  # a new driver starts a new stream
+                )
+                if data is None:
+                    self._downstream.dropped += 1
+                    return
+
+                self._driver = datagram.address
+                self._driver_last_seen = now
+
+            self._send(self._upstream_sender, self._upstream, data, self._server_address)
+
+    def start(self):
+        self._upstream_receiver.start()  # first, as it owns the socket
+        self._upstream_sender.start()
+        self._downstream_receiver.start()
+        self._downstream_sender.start()
+
+    def stop(self):
+        self._downstream_sender.stop()
+        self._downstream_receiver.stop()
+        self._upstream_sender.stop()
+        self._upstream_receiver.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, required=True)  # for clients
+    parser.add_argument('--server-host', type=str, required=True)
+    parser.add_argument('--server-port', type=int, required=True)
+    parser.add_argument('--upstream-port', type=int, default=0)  # ours, facing the server; 0 for any
+    parser.add_argument('--queue-size', type=int, default=_QUEUE_SIZE)
+    parser.add_argument('--max-clients', type=int, default=_MAX_CLIENTS)
+    parser.add_argument('--client-timeout', type=float, default=_CLIENT_TIMEOUT)
+    parser.add_argument('--stats', action='store_true', default=False)
+
+    args = parser.parse_args()
+
+    _relay = Relay(
+        port=args.port,
+        server_host=args.server_host,
+        server_port=args.server_port,
+        upstream_port=args.upstream_port,
+        queue_size=args.queue_size,
+        max_clients=args.max_clients,
+        client_timeout=args.client_timeout
+    )
+    _relay.start()
+
+    while 1:
+        try:
+            time.sleep(1)
+            if args.stats:
+                print(_relay.get_stats())
+        except KeyboardInterrupt:
+            break
+
+    _relay.stop()
@@ -0,0 +1,159 @@
+import time
+import unittest
+from queue import Full
+
+from mock import Mock, call
+
+from .controller import ControllerState, deserialize_controller_states, serialize_controller_states
+from .relay import Relay
+from .telemetry import _HEADER_STRUCT, _TELEMETRY_MAGIC
+from .udp import Datagram
+from .viewer import serialize_viewer_keepalive
+
+_SERVER = ('10.0.0.1', 13337)
+_CLIENT_1 = ('192.168.0.1', 40001)
+_CLIENT_2 = ('192.168.0.2', 40002)
+_FRAME_1 = b'RIFF1'
+_FRAME_2 = b'RIFF2'
+_TELEMETRY = bytes([_TELEMETRY_MAGIC]) + bytes(_HEADER_STRUCT.size - 1)
+_CONTROLLER_STATE = ControllerState(throttle=1.0, brake=0.0, steer=0.0, hand_brake=False, reverse=False, reset=False)
+_CONTROLS = serialize_controller_states([_CONTROLLER_STATE], 1, 101)
+
+
+class RelayTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.subject = Relay(13337, _SERVER[0], _SERVER[1], client_timeout=5.0, driver_timeout=2.0, clock=lambda: self.now)
+
+        self.upstream_sender = self.subject._upstream_sender = Mock()
+        self.downstream_sender = self.subject._downstream_sender = Mock()
+
+    def test_fan_out_and_instant_join(self):
+        self.subject._handle_upstream_datagram(Datagram(_FRAME_1, _SERVER))  # nobody to send it to yet, but cached
+
+        self.downstream_sender.send_datagram.assert_not_called()
+
+        self.subject._handle_downstream_datagram(Datagram(serialize_viewer_keepalive(1), _CLIENT_1))
+
+        self.assertEqual([call(_FRAME_1, _CLIENT_1)], self.downstream_sender.send_datagram.call_args_list)
+
+        self.subject._handle_downstream_datagram(Datagram(serialize_viewer_keepalive(1), _CLIENT_2))
+        self.downstream_sender.reset_mock()
+
+        self.subject._handle_upstream_datagram(Datagram(_FRAME_2, _SERVER))
+        self.subject._handle_upstream_datagram(Datagram(_TELEMETRY, _SERVER))
+
+        self.assertEqual(
+            [call(_FRAME_2, _CLIENT_1), call(_FRAME_2, _CLIENT_2), call(_TELEMETRY, _CLIENT_1), call(_TELEMETRY, _CLIENT_2)],
+            self.downstream_sender.send_datagram.call_args_list
+        )
+        self.assertEqual(_FRAME_2, self.subject._cached_frame)  # not the telemetry
+
+        self.now = 6.0  # both gone quiet
+        self.downstream_sender.reset_mock()
+        self.subject._handle_upstream_datagram(Datagram(_FRAME_1, _SERVER))
+
+        self.downstream_sender.send_datagram.assert_not_called()
+        self.assertEqual(0, self.subject.get_stats().clients)
+
+    def test_controls_and_keepalives_upstream(self):
+        self.subject._handle_downstream_datagram(Datagram(_CONTROLS, _CLIENT_1))
+        self.subject._handle_downstream_datagram(Datagram(_CONTROLS, _CLIENT_2))  # not driving; dropped
+
+        self.subject._handle_downstream_datagram(Datagram(serialize_viewer_keepalive(1), _CLIENT_1))
+        self.subject._handle_downstream_datagram(Datagram(serialize_viewer_keepalive(1), _CLIENT_2))  # already forwarded one
+
+        self.assertEqual(
+            [call(serialize_viewer_keepalive(1), _SERVER)],
+            self.upstream_sender.send_datagram.call_args_list[1:]
+        )
+        self.assertEqual(
+            [_CONTROLLER_STATE],
+            deserialize_controller_states(self.upstream_sender.send_datagram.call_args_list[0][0][0])[1]
+        )
+
+        self.now = 3.0  # the driver has gone quiet; someone else can take over
+        self.subject._handle_downstream_datagram(Datagram(_CONTROLS, _CLIENT_2))
+
+        stats = self.subject.get_stats()
+        self.assertEqual(_CLIENT_2, stats.driver)
+        self.assertEqual((5, 3, 1), (stats.downstream.datagrams_in, stats.upstream.datagrams_out, stats.downstream.dropped))
+
+    def test_driver_handover_on_a_real_vehicle(self):
+        from .vehicle import Vehicle
+
+        vehicle = Vehicle(receiver=Mock(), client=Mock(), actor_id=2)
+        self.upstream_sender.send_datagram.side_effect = lambda data, address: vehicle.recv(Datagram(data, ('10.0.0.2', 13339)))
+
+        for sequence in range(1, 501):  # well ahead of where the next driver's own sequence starts
+            data = serialize_controller_states([_CONTROLLER_STATE], sequence, 101)
+            self.subject._handle_downstream_datagram(Datagram(data, _CLIENT_1))
+
+        self.assertEqual(1.0, vehicle._controller_state.throttle)
+
+        self.now = 3.0
+        braking = _CONTROLLER_STATE._replace(throttle=0.0, brake=1.0)
+        self.subject._handle_downstream_datagram(Datagram(serialize_controller_states([braking], 1, 202), _CLIENT_2))
+
+        self.assertEqual(_CLIENT_2, self.subject.get_stats().driver)
+        self.assertEqual((0.0, 1.0), (vehicle._controller_state.throttle, vehicle._controller_state.brake))
+
+        self.subject._handle_downstream_datagram(Datagram(serialize_controller_states([braking], 1, 202), _CLIENT_2))  # duplicate
+        self.subject._handle_downstream_datagram(Datagram(serialize_controller_states([_CONTROLLER_STATE], 2, 202), _CLIENT_2))
+
+        self.assertEqual(1.0, vehicle._controller_state.throttle)
+        self.assertEqual(  # one stream, whoever is driving
+            {self.subject._epoch},
+            {deserialize_controller_states(x[0][0])[0].epoch for x in self.upstream_sender.send_datagram.call_args_list}
+        )
+
+    def test_stale_and_invalid_controls_dropped(self):
+        self.subject._handle_downstream_datagram(Datagram(serialize_controller_states([_CONTROLLER_STATE], 5, 101), _CLIENT_1))
+        self.subject._handle_downstream_datagram(Datagram(serialize_controller_states([_CONTROLLER_STATE], 4, 101), _CLIENT_1))
+        self.subject._handle_downstream_datagram(Datagram(b'\x02\x01\x00\x01', _CLIENT_1))
+
+        self.assertEqual(1, len(self.upstream_sender.send_datagram.call_args_list))
+        self.assertEqual(2, self.subject.get_stats().downstream.dropped)
+
+    def test_full_queue_and_max_clients(self):
+        self.subject._max_clients = 1
+        self.downstream_sender.send_datagram.side_effect = Full
+
+        self.subject._handle_downstream_datagram(Datagram(serialize_viewer_keepalive(1), _CLIENT_1))
+        self.subject._handle_downstream_datagram(Datagram(serialize_viewer_keepalive(1), _CLIENT_2))
+        self.subject._handle_upstream_datagram(Datagram(_FRAME_1, _SERVER))
+
+        stats = self.subject.get_stats()
+        self.assertEqual(1, stats.clients)
+        self.assertEqual(2, stats.downstream.dropped)
+        self.assertEqual(0.0, stats.cached_frame_age)
+
+
+class RelayLifecycleTest(unittest.TestCase):
+    def test_end_to_end(self):
+        from .udp import Receiver, Sender
+
+        received = []
+        server = Receiver(20051, 16, lambda datagram: received.append(datagram.data))
+        server_sender = Sender(20051, 16, use_socket_from=server)
+        client = Receiver(20053, 16, lambda datagram: received.append(datagram.data))
+        client_sender = Sender(20053, 16, use_socket_from=client)
+        relay = Relay(20052, '127.0.0.1', 20051, upstream_port=20054)
+
+        for x in [server, server_sender, client, client_sender]:
+            x.start()
+        relay.start()
+
+        try:
+            client_sender.send_datagram(_CONTROLS, ('127.0.0.1', 20052))
+            time.sleep(0.1)
+            server_sender.send_datagram(_FRAME_1, ('127.0.0.1', 20054))
+            time.sleep(0.1)
+        finally:
+            relay.stop()
+            for x in [client_sender, client, server_sender, server]:
+                x.stop()
+
+        self.assertEqual(2, len(received))
+        self.assertEqual([_CONTROLLER_STATE], deserialize_controller_states(received[0])[1])
+        self.assertEqual(_FRAME_1, received[1])
@@ -0,0 +1,305 @@
+import time
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from .stats import Histogram, HistogramSnapshot
+
+try:  # cater for python3 -m (module) vs python3 (file)
+    from . import wrapped_carla as carla
+except ImportError:
+    import wrapped_carla as carla
+
+
+class RPCStat(NamedTuple):
+    calls: int  # calls that went through to Carla
+    suppressed: int  # calls that were answered from a cache or skipped as redundant
+    duration: HistogramSnapshot
+
+
+class RPCStats(object):
+    def __init__(self):
+        self._lock: Lock = Lock()
+        self._durations_by_method: Dict[str, Histogram] = {}
+        self._suppressed_by_method: Dict[str, int] = {}
+
+    def _get_histogram(self, method: str) -> Histogram:
+        histogram = self._durations_by_method.get(method)
+        if histogram is None:
+            with self._lock:
+                histogram = self._durations_by_method.setdefault(method, Histogram())
+
+        return histogram
+
+    def call(self, method: str, function: Callable, *args, **kwargs) -> Any:
+        histogram = self._get_histogram(method)
+
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+
+    def suppress(self, method: str):
+        self._get_histogram(method)
+
+        with self._lock:
+            self._suppressed_by_method[method] = self._suppressed_by_method.get(method, 0) + 1
+
+    def snapshot(self) -> Dict[str, RPCStat]:
+        with self._lock:
+            items = list(self._durations_by_method.items())
+            suppressed_by_method = dict(self._suppressed_by_method)
+
+        stats = {}
+        for method, histogram in items:
+            duration = histogram.snapshot()
+            stats[method] = RPCStat(
+                calls=duration.count,
+                suppressed=suppressed_by_method.get(method, 0),
+                duration=duration,
+            )
+
+        return stats
+
+    @property
+    def calls(self) -> int:
+        return sum(x.calls for x in self.snapshot().values())
+
+
+def _unwrap(value: Any) -> Any:
+    if isinstance(value, _RPCWrapper):
+        return value.wrapped
+
+    return value
+
+
+class _RPCWrapper(object):
+    _name: str
+
+    def __init__(self, wrapped: Any, stats: RPCStats):
+        self._wrapped: Any = wrapped
+        self._stats: RPCStats = stats
+
+    @property
+    def wrapped(self) -> Any:
+        return self._wrapped
+
+    @property
+    def stats(self) -> RPCStats:
+        return self._stats
+
+    def _call(self, method: str, *args, **kwargs) -> Any:
+        return self._stats.call(
+            '{}.{}'.format(self._name, method),
+            getattr(self._wrapped, method),
+            *[_unwrap(x) for x in args],
+            **{k: _unwrap(v) for k, v in kwargs.items()}
+        )
+
+    def _suppress(self, method: str):
+        self._stats.suppress('{}.{}'.format(self._name, method))
+
+    def __getattr__(self, name: str) -> Any:  # anything not handled explicitly is passed through (and counted if callable)
+        attribute = getattr(self._wrapped, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            return self._call(name, *args, **kwargs)
+
+        return call
+
+
+class RPCActor(_RPCWrapper):
+    _name = 'Actor'
+
+    def __init__(self, wrapped: carla.Actor, stats: RPCStats, world: 'RPCWorld'):
+        super().__init__(wrapped, stats)
+
+        self._world: RPCWorld = world
+        self._last_control: Optional[carla.VehicleControl] = None
+
+    @property
+    def id(self) -> int:
+        return self._wrapped.id
+
+    @property
+    def type_id(self) -> str:
+        return self._wrapped.type_id
+
+    def apply_control(self, control: carla.VehicleControl):
+        if self._last_control is not None and control == self._last_control:  # Carla holds the last control
+            self._suppress('apply_control')
+            return
+
+        self._call('apply_control', control)
+        self._last_control = control
+
+    def forget_control(self):  # it was changed some other way (e.g. a batch command), so the next one must go through
+        self._last_control = None
+
+    def set_transform(self, transform: carla.Transform):
+        if transform == self._wrapped.get_transform():  # served from the client-side episode state, not an RPC
+            self._suppress('set_transform')
+            return
+
+        self._call('set_transform', transform)
+
+    def destroy(self) -> bool:
+        self._world.forget_actor(self._wrapped.id)
+
+        return self._call('destroy')
+
+
+class RPCWorld(_RPCWrapper):
+    _name = 'World'
+
+    def __init__(self, wrapped: carla.World, stats: RPCStats):
+        super().__init__(wrapped, stats)
+
+        self._lock: Lock = Lock()
+        self._blueprint_library: Optional[carla.BlueprintLibrary] = None
+        self._actors_by_id: Dict[int, RPCActor] = {}
+        self._world_snapshot: Optional[carla.WorldSnapshot] = None
+        self._changed: bool = True
+
+    def _wrap_actor(self, actor: Optional[carla.Actor]) -> Optional[RPCActor]:
+        if actor is None:
+            return None
+
+        with self._lock:
+            rpc_actor = self._actors_by_id.get(actor.id)
+            if rpc_actor is None:
+                rpc_actor = RPCActor(actor, self._stats, self)
+                self._actors_by_id[actor.id] = rpc_actor
+
+        return rpc_actor
+
+    def forget_actor(self, actor_id: int):
+        with self._lock:
+            self._actors_by_id.pop(actor_id, None)
+            self._changed = True
+
+    def forget_controls(self, actor_ids: Iterable[int]):
+        with self._lock:
+            rpc_actors = [self._actors_by_id.get(x) for x in actor_ids]
+
+        for rpc_actor in rpc_actors:
+            if rpc_actor is not None:
+                rpc_actor.forget_control()
+
+    def wait_for_tick(self, *args, **kwargs) -> carla.WorldSnapshot:
+        world_snapshot = self._call('wait_for_tick', *args, **kwargs)
+
+        with self._lock:
+            self._world_snapshot = world_snapshot
+            self._changed = False
+
+        return world_snapshot
+
+    def wait_for_tick_if_changed(self, *args, **kwargs) -> carla.WorldSnapshot:
+        # a tick only needs to be waited for if we've changed something since the last one (e.g. to see a new actor)
+        with self._lock:
+            changed = self._changed
+            world_snapshot = self._world_snapshot
+
+        if not changed and world_snapshot is not None:
+            self._suppress('wait_for_tick')
+            return world_snapshot
+
+        world_snapshot = self._call('wait_for_tick', *args, **kwargs)
+
+        with self._lock:
+            self._world_snapshot = world_snapshot
+            self._changed = False
+
+        return world_snapshot
+
+    def get_blueprint_library(self) -> carla.BlueprintLibrary:
+        if self._blueprint_library is not None:
+            self._suppress('get_blueprint_library')
+            return self._blueprint_library
+
+        self._blueprint_library = self._call('get_blueprint_library')
+
+        return self._blueprint_library
+
+    def get_actor(self, actor_id: int) -> Optional[RPCActor]:
+        with self._lock:
+            rpc_actor = self._actors_by_id.get(actor_id)
+
+        if rpc_actor is not None:
+            self._suppress('get_actor')
+            return rpc_actor
+
+        return self._wrap_actor(self._call('get_actor', actor_id))
+
+    def spawn_actor(self, *args, **kwargs) -> RPCActor:
+        actor = self._call('spawn_actor', *args, **kwargs)
+
+        with self._lock:
+            self._changed = True
+
+        return self._wrap_actor(actor)
+
+    def try_spawn_actor(self, *args, **kwargs) -> Optional[RPCActor]:
+        actor = self._call('try_spawn_actor', *args, **kwargs)
+
+        with self._lock:
+            self._changed = True
+
+        return self._wrap_actor(actor)
+
+
+def wait_for_tick_if_changed(world: carla.World) -> carla.WorldSnapshot:  # for functions given either kind of client
+    if isinstance(world, RPCWorld):
+        return world.wait_for_tick_if_changed()
+
+    return world.wait_for_tick()
+
+
+def _get_actor_ids(commands: List) -> List[int]:
+    return [x.actor_id for x in commands if isinstance(getattr(x, 'actor_id', None), int)]
+
+
+class RPCClient(_RPCWrapper):
+    _name = 'Client'
+
+    def __init__(self, wrapped: carla.Client, stats: Optional[RPCStats] = None):
+        super().__init__(wrapped, stats if stats is not None else RPCStats())
+
+        self._world: Optional[RPCWorld] = None
+
+    def get_world(self) -> Optional[RPCWorld]:
+        if self._world is not None:
+            self._suppress('get_world')
+            return self._world
+
+        world = self._call('get_world')
+        if world is None:
+            return None
+
+        self._world = RPCWorld(world, self._stats)
+
+        return self._world
+
+    def _forget_controls(self, commands: List):
+        if self._world is not None:
+            self._world.forget_controls(_get_actor_ids(commands))
+
+    # the actors' controls may be changed by these, so apply_control mustn't skip the next one as unchanged
+
+    def apply_batch(self, commands: List, *args, **kwargs):
+        self._forget_controls(commands)
+
+        return self._call('apply_batch', commands, *args, **kwargs)
+
+    def apply_batch_sync(self, commands: List, *args, **kwargs) -> List:
+        self._forget_controls(commands)
+
+        return self._call('apply_batch_sync', commands, *args, **kwargs)
+
+    def load_world(self, *args, **kwargs) -> RPCWorld:
+        self._world = RPCWorld(self._call('load_world', *args, **kwargs), self._stats)
+
+        return self._world
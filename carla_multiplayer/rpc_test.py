@@ -0,0 +1,101 @@
+import unittest
+
+from mock import Mock, call
+
+from .rpc import RPCClient
+from .vehicle import create_vehicle, get_vehicle, delete_vehicle
+
+
+class RPCClientTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = Mock()
+        self.world = self.client.get_world.return_value
+        self.actor = Mock()
+        self.actor.id = 2
+        self.world.spawn_actor.return_value = self.actor
+        self.world.get_actor.return_value = self.actor
+
+        self.subject = RPCClient(self.client)
+
+    def test_vehicle_lifecycle(self):
+        vehicle = create_vehicle(self.subject, 'vehicle.komatsu.830e', 'transform')
+        self.assertEqual(2, vehicle.id)
+
+        got_vehicle = get_vehicle(self.subject, 2)
+        self.assertIs(vehicle, got_vehicle)
+
+        delete_vehicle(self.subject, 2)
+
+        self.assertEqual(
+            [call.get_world(),
+                call.get_world().wait_for_tick(),
+                call.get_world().get_blueprint_library(),
+                call.get_world().get_blueprint_library().find('vehicle.komatsu.830e'),
+                call.get_world().spawn_actor(self.world.get_blueprint_library.return_value.find.return_value, 'transform'),
+                call.get_world().wait_for_tick(),
+                call.get_world().spawn_actor().destroy(),
+                call.get_world().wait_for_tick()],
+            self.client.mock_calls
+        )
+
+        stats = self.subject.stats.snapshot()
+        self.assertEqual(1, stats['Client.get_world'].calls)
+        self.assertEqual(3, stats['Client.get_world'].suppressed)
+        self.assertEqual(3, stats['World.wait_for_tick'].calls)
+        self.assertEqual(4, stats['World.wait_for_tick'].suppressed)
+        self.assertEqual(0, stats['World.get_actor'].calls)
+        self.assertEqual(2, stats['World.get_actor'].suppressed)
+
+    def test_apply_control_suppression(self):
+        vehicle = create_vehicle(self.subject, 'vehicle.komatsu.830e', Mock())
+
+        vehicle.apply_control('a')
+        vehicle.apply_control('a')
+        vehicle.apply_control('b')
+
+        self.assertEqual([call('a'), call('b')], self.actor.apply_control.call_args_list)
+        self.assertEqual(1, self.subject.stats.snapshot()['Actor.apply_control'].suppressed)
+
+    def test_apply_control_after_a_batch(self):
+        vehicle = create_vehicle(self.subject, 'vehicle.komatsu.830e', Mock())
+
+        vehicle.apply_control('safe')
+        self.subject.apply_batch([Mock(actor_id=2)])  # e.g. a player's controls from VehicleManager
+        vehicle.apply_control('safe')  # e.g. parking it again
+        self.subject.apply_batch_sync([Mock(actor_id=3)])  # some other actor
+        vehicle.apply_control('safe')
+
+        self.assertEqual([call('safe'), call('safe')], self.actor.apply_control.call_args_list)
+        stats = self.subject.stats.snapshot()
+        self.assertEqual((1, 1), (stats['Client.apply_batch'].calls, stats['Client.apply_batch_sync'].calls))
+
+    def test_wait_for_tick_always_waits(self):
+        world = self.subject.get_world()
+
+        world.wait_for_tick()
+        world.wait_for_tick()
+        world.wait_for_tick_if_changed()  # nothing changed since the last tick
+
+        self.assertEqual(2, self.world.wait_for_tick.call_count)
+
+    def test_set_transform_suppression(self):
+        vehicle = create_vehicle(self.subject, 'vehicle.komatsu.830e', Mock())
+        self.actor.get_transform.return_value = 'a'
+
+        vehicle.set_transform('a')
+        vehicle.set_transform('b')
+
+        self.assertEqual([call('b')], self.actor.set_transform.call_args_list)
+
+    def test_unwraps_arguments(self):
+        vehicle = create_vehicle(self.subject, 'vehicle.komatsu.830e', Mock())
+
+        self.subject.get_world().spawn_actor('blueprint', 'transform', attach_to=vehicle)
+
+        self.assertEqual(call('blueprint', 'transform', attach_to=self.actor), self.world.spawn_actor.call_args)
+
+    def test_passthrough(self):
+        self.subject.set_timeout(2.0)
+
+        self.client.set_timeout.assert_called_once_with(2.0)
+        self.assertEqual(1, self.subject.stats.calls)
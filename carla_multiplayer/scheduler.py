@@ -0,0 +1,153 @@
+import heapq
+import itertools
+import time
+import traceback
+from threading import Condition, Thread, get_ident
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .looper import TimedLooper, LooperStats
+from .threader import Threader
+
+_WORKERS = 1
+
+
+class TaskStats(NamedTuple):
+    name: str
+    period: float
+    looper_stats: LooperStats  # jitter is the per-task lateness (how long past its deadline it actually ran)
+
+
+class _Task(object):
+    def __init__(self, looper: TimedLooper):
+        self.looper: TimedLooper = looper
+        self.started: bool = False
+        self.running: bool = False
+        self.running_on: Optional[int] = None
+        self.removed: bool = False
+
+
+class Scheduler(Threader):
+    def __init__(self, workers: int = _WORKERS, clock: Callable[[], float] = time.monotonic):
+        super().__init__()
+
+        self._workers: int = workers
+        self._clock: Callable[[], float] = clock
+
+        self._condition: Condition = Condition()
+        self._heap: List[Tuple[float, int, _Task]] = []  # (when, tie-breaker, task)
+        self._tasks: Dict[int, _Task] = {}
+        self._counter = itertools.count()
+
+    def add(self, looper: TimedLooper):
+        with self._condition:
+            if id(looper) in self._tasks:
+                return
+
+            task = _Task(looper)
+            self._tasks[id(looper)] = task
+            heapq.heappush(self._heap, (self._clock(), next(self._counter), task))
+
+            self._condition.notify_all()
+
+    def remove(self, looper: TimedLooper):
+        with self._condition:
+            task = self._tasks.pop(id(looper), None)
+            if task is None:
+                return
+
+            task.removed = True  # lazily dropped from the heap when it comes up
+
+            while task.running and task.running_on != get_ident():  # a looper may stop itself from its own work
+                self._condition.wait()
+
+        if task.started:
+            task.looper._run_phase('after_loop', task.looper._after_loop)
+
+    def get_stats(self) -> List[TaskStats]:
+        with self._condition:
+            tasks = list(self._tasks.values())
+
+        return [
+            TaskStats(
+                name=repr(task.looper),
+                period=task.looper._period,
+                looper_stats=task.looper.get_looper_stats(),
+            ) for task in tasks
+        ]
+
+    def _get_next_task(self) -> Optional[_Task]:
+        with self._condition:
+            while not self._stop_event.is_set():
+                if len(self._heap) == 0:
+                    self._condition.wait()
+                    continue
+
+                when, _, task = self._heap[0]
+                if task.removed:
+                    heapq.heappop(self._heap)
+                    continue
+
+                wait = when - self._clock()
+                if wait > 0:
+                    self._condition.wait(wait)  # woken early if an earlier task is added
+                    continue
+
+                heapq.heappop(self._heap)
+                task.running = True
+                task.running_on = get_ident()
+
+                return task
+
+        return None
+
+    def _run_task(self, task: _Task):
+        first = not task.started
+        task.started = True
+
+        try:
+            wait = task.looper._run_scheduled(first)
+        except Exception as e:
+            print('attempt to run {} in {} raised {}; traceback follows'.format(
+                repr(task.looper),
+                repr(self),
+                repr(e)
+            ))
+            traceback.print_exc()
+            wait = task.looper._period
+
+        with self._condition:
+            task.running = False
+            task.running_on = None
+
+            if wait is None:  # _before_loop declined to run
+                task.started = False
+                task.removed = True
+                self._tasks.pop(id(task.looper), None)
+            elif not task.removed:
+                heapq.heappush(self._heap, (self._clock() + wait, next(self._counter), task))
+
+            self._condition.notify_all()
+
+    def _work(self):
+        while not self._stop_event.is_set():
+            task = self._get_next_task()
+            if task is None:
+                return
+
+            self._run_task(task)
+
+    def _create_threads(self):
+        self._threads = [Thread(target=self._work) for _ in range(0, self._workers)]
+
+    def _before_start(self):
+        pass
+
+    def stop(self):
+        with self._condition:
+            self._stop_event.set()
+            self._condition.notify_all()
+
+        super().stop()
+
+    def _after_stop(self):
+        pass
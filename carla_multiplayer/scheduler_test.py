@@ -0,0 +1,112 @@
+import threading
+import time
+import unittest
+from typing import Optional
+
+from mock import Mock
+
+from .looper import TimedLooper, set_default_scheduler
+from .scheduler import Scheduler
+
+
+class CountingTimedLooper(TimedLooper):
+    def __init__(self, period: float, scheduler: Optional[Scheduler] = None):
+        super().__init__(
+            period=period,
+            scheduler=scheduler
+        )
+
+        self.mock = Mock()
+
+    def _before_loop(self):
+        self.mock.before_loop()
+
+    def _work(self):
+        self.mock.work()
+
+    def _after_loop(self):
+        self.mock.after_loop()
+
+
+class UnschedulableTimedLooper(CountingTimedLooper):
+    _schedulable = False
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.subject = Scheduler()
+        self.subject.start()
+
+    def tearDown(self) -> None:
+        set_default_scheduler(None)
+        self.subject.stop()
+
+    def test_many_loopers_one_thread(self):
+        threads_before = threading.active_count()
+
+        loopers = [CountingTimedLooper(period=0.05, scheduler=self.subject) for _ in range(0, 50)]
+        for looper in loopers:
+            looper.start()
+
+        self.assertEqual(threads_before, threading.active_count())
+
+        time.sleep(0.5)
+
+        stats = self.subject.get_stats()
+        self.assertEqual(50, len(stats))
+        for task_stats in stats:
+            self.assertEqual(0.05, task_stats.period)
+            self.assertGreaterEqual(task_stats.looper_stats.iterations, 5)
+            self.assertGreaterEqual(task_stats.looper_stats.jitter.count, 5)
+
+        for looper in loopers:
+            looper.stop()
+
+        self.assertEqual(0, len(self.subject.get_stats()))
+
+        for looper in loopers:
+            self.assertEqual(1, looper.mock.before_loop.call_count)
+            self.assertEqual(1, looper.mock.after_loop.call_count)
+
+            work_calls = looper.mock.work.call_count
+            time.sleep(0.01)
+            self.assertEqual(work_calls, looper.mock.work.call_count)
+
+    def test_default_scheduler(self):
+        set_default_scheduler(self.subject)
+
+        looper = CountingTimedLooper(period=0.05)
+        unschedulable_looper = UnschedulableTimedLooper(period=0.05)
+        free_running_looper = CountingTimedLooper(period=0)
+
+        looper.start()
+        unschedulable_looper.start()
+        free_running_looper.start()
+
+        try:
+            self.assertIsNone(looper._thread)
+            self.assertIsNotNone(unschedulable_looper._thread)
+            self.assertIsNotNone(free_running_looper._thread)
+
+            time.sleep(0.2)
+
+            self.assertEqual(1, len(self.subject.get_stats()))
+            self.assertGreaterEqual(looper.mock.work.call_count, 2)
+        finally:
+            looper.stop()
+            unschedulable_looper.stop()
+            free_running_looper.stop()
+
+    def test_declined_before_loop(self):
+        looper = CountingTimedLooper(period=0.05, scheduler=self.subject)
+        looper._before_loop = lambda: False
+
+        looper.start()
+        time.sleep(0.1)
+
+        self.assertEqual(0, looper.mock.work.call_count)
+        self.assertEqual(0, len(self.subject.get_stats()))
+
+        looper.stop()
+
+        self.assertEqual(0, looper.mock.after_loop.call_count)
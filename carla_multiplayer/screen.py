@@ -1,9 +1,11 @@
+import time
 from io import BytesIO
 from typing import Tuple, Optional
 
 import pygame
 from PIL import Image
 
+from .metrics import get_default_registry, MetricsServer
 from .udp import Receiver, Datagram
 
 _FPS = 30
@@ -38,17 +40,51 @@ class Screen(object):
         )
 
         self._image: Optional[Image.Image] = None
+        self._font: Optional[pygame.font.Font] = None
+        self._hud_text: Optional[str] = None
+        self._image_is_new: bool = False
+
+        registry = get_default_registry()
+        self._decode_seconds_metric = registry.histogram(
+            'screen_decode_seconds', 'Time taken to decode (and scale) a received frame'
+        ).labels()
+        self._decode_errors_metric = registry.counter('screen_decode_errors_total', 'Received frames that failed to decode').labels()
+        self._frames_shown_metric = registry.counter(
+            'screen_frames_shown_total', 'Frames drawn to the display (not counting redraws of the same frame)'
+        ).labels()
 
     def handle_webp_bytes(self, datagram: Datagram):
-        self._image = _convert_webp_bytes_to_pygame_image(datagram.data, self._dimensions)
+        started = time.perf_counter()
+        try:
+            self._image = _convert_webp_bytes_to_pygame_image(datagram.data, self._dimensions)
+            self._image_is_new = True
+        except Exception:
+            self._decode_errors_metric.inc()
+            raise
+
+        self._decode_seconds_metric.observe(time.perf_counter() - started)
+
+    def set_hud_text(self, hud_text: Optional[str]):
+        self._hud_text = hud_text
 
     def update(self):
         if self._image is None:
             return
 
         self._screen.blit(self._image, (0, 0))
+
+        if self._hud_text is not None:
+            if self._font is None:
+                self._font = pygame.font.Font(None, 32)
+
+            self._screen.blit(self._font.render(self._hud_text, True, (255, 255, 255)), (16, 16))
+
         pygame.display.flip()
 
+        if self._image_is_new:  # frames decoded but never shown were replaced before the display caught up
+            self._image_is_new = False
+            self._frames_shown_metric.inc()
+
 
 if __name__ == '__main__':
     import argparse
@@ -59,16 +95,25 @@ if __name__ == '__main__':
     parser.add_argument('--fps', type=int, default=_FPS)
     parser.add_argument('--width', type=int, default=_WIDTH)
     parser.add_argument('--height', type=int, default=_HEIGHT)
+    parser.add_argument('--multicast-group', type=str, action='append', default=None)  # e.g. to spectate on a LAN
+    parser.add_argument('--metrics-port', type=int, default=None)  # serve Prometheus metrics on localhost
 
     args = parser.parse_args()
 
+    from .telemetry import is_telemetry
+
     pygame.init()
 
-    _receiver = Receiver(args.port, args.queue_size)
+    _receiver = Receiver(args.port, args.queue_size, multicast_groups=args.multicast_group)
     _screen = Screen(args.width, args.height)
-    _receiver.set_callback(_screen.handle_webp_bytes)
+    _receiver.set_callback(lambda datagram: None if is_telemetry(datagram.data) else _screen.handle_webp_bytes(datagram))
     _receiver.start()
 
+    _metrics_server = None
+    if args.metrics_port is not None:
+        _metrics_server = MetricsServer(args.metrics_port)
+        _metrics_server.start()
+
     _clock = pygame.time.Clock()
     _stopped = False
     while not _stopped:
@@ -86,3 +131,8 @@ if __name__ == '__main__':
 
     pygame.quit()
     _receiver.stop()
+    if _metrics_server is not None:
+        _metrics_server.stop()
+
+    for _group, _stats in _receiver.get_multicast_stats().items():
+        print('{}: {}'.format(_group, _stats))
@@ -1,12 +1,16 @@
+import time
+from collections import OrderedDict
 from io import BytesIO
 from queue import Queue, Full, Empty
-from threading import Thread
-from typing import Optional
+from threading import Condition, Lock, Thread
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
 
 import numpy
 from PIL import Image
 
-from .threader import Threader
+from .metrics import get_default_registry
+from .rpc import wait_for_tick_if_changed
+from .threader import Threader, WAKEUP, wake_queue
 from .udp import Sender
 
 try:  # cater for python3 -m (module) vs python3 (file)
@@ -25,6 +29,12 @@ _SENSOR_TRANSFORM = carla.Transform(
 _CARLA_PORT = 2000
 _CARLA_TIMEOUT = 2.0
 _QUEUE_SIZE = 2
+_DISPATCH_TIMEOUT = 1.0 / _FPS
+_ENCODER_WORKERS = 2
+_IMAGE_FORMAT = 'webp'
+_IMAGE_FORMATS = ['webp', 'jpeg', 'png']  # anything PIL writes that the Screen (PIL again) can read back without being told
+
+_image_format: str = _IMAGE_FORMAT
 
 
 def create_sensor(
@@ -36,10 +46,10 @@ def create_sensor(
         height: int = _HEIGHT,
         transform: carla.Transform = _SENSOR_TRANSFORM) -> carla.ServerSideSensor:
     world = client.get_world()
-    world.wait_for_tick()
+    wait_for_tick_if_changed(world)
 
     actor = world.get_actor(actor_id)
-    world.wait_for_tick()
+    wait_for_tick_if_changed(world)
 
     blueprint_library = world.get_blueprint_library()
     sensor_blueprint = blueprint_library.find(sensor_blueprint_name)
@@ -52,17 +62,17 @@ def create_sensor(
         attach_to=actor,
         attachment_type=carla.AttachmentType.SpringArm
     )
-    world.wait_for_tick()
+    wait_for_tick_if_changed(world)
 
     return sensor
 
 
 def get_sensor(client: carla.Client, actor_id: int) -> carla.ServerSideSensor:
     world = client.get_world()
-    world.wait_for_tick()
+    wait_for_tick_if_changed(world)
 
     sensor = world.get_actor(actor_id)
-    world.wait_for_tick()
+    wait_for_tick_if_changed(world)
 
     if sensor is None:
         raise ValueError('failed to get sensor for actor_id {}; valid options right now are {}'.format(
@@ -75,7 +85,7 @@ def get_sensor(client: carla.Client, actor_id: int) -> carla.ServerSideSensor:
 
 def delete_sensor(client: carla.Client, actor_id: int):
     get_sensor(client, actor_id).destroy()
-    client.get_world().wait_for_tick()
+    wait_for_tick_if_changed(client.get_world())
 
 
 def _carla_image_to_bgra_array(image: carla.Image):
@@ -102,8 +112,154 @@ def _carla_image_to_webp_bytes(image: carla.Image):
     return buffer.getvalue()
 
 
+def set_image_format(image_format: str):  # for every sensor in the process; clients work out the format for themselves
+    global _image_format
+
+    if image_format not in _IMAGE_FORMATS:
+        raise ValueError('expected image_format to be one of {} but was {}'.format(_IMAGE_FORMATS, repr(image_format)))
+
+    _image_format = image_format
+
+
+def get_image_format() -> str:
+    return _image_format
+
+
+def _carla_image_to_bytes(image: carla.Image) -> bytes:
+    if _image_format == 'webp':
+        return _carla_image_to_webp_bytes(image)
+
+    pil_image = Image.fromarray(_carla_image_to_rgb_array(image))
+    buffer = BytesIO()
+    pil_image.save(buffer, format=_image_format)
+
+    return buffer.getvalue()
+
+
+def _get_encode_seconds_metric():
+    return get_default_registry().histogram('sensor_encode_seconds', 'Time taken to encode an image')
+
+
+def _get_superseded_metric():
+    return get_default_registry().counter(
+        'sensor_images_superseded_total', 'Images thrown away for a newer one before they were encoded or sent'
+    )
+
+
+class EncoderPoolStats(NamedTuple):
+    encoded: int
+    dropped: int  # images replaced by a newer one for the same destination before they were encoded
+    refused: int  # encoded images that can_send said not to send
+
+
+class EncoderPool(Threader):
+    def __init__(self,
+            sender: Sender,
+            workers: int = _ENCODER_WORKERS,
+            can_send: Optional[Callable[[Tuple[str, int], int], bool]] = None):
+        super().__init__()
+
+        self._sender: Sender = sender
+        self._workers: int = workers
+        self._can_send: Optional[Callable[[Tuple[str, int], int], bool]] = can_send  # (address, size) -> send it?
+
+        # only the latest image per destination is kept, so one slow client can't starve the rest
+        self._condition: Condition = Condition()
+        self._pending_images: 'OrderedDict[Tuple[str, int], carla.Image]' = OrderedDict()
+        self._encoded: int = 0
+        self._dropped: int = 0
+        self._refused: int = 0
+        self._encode_seconds_by_address: Dict[Tuple[str, int], float] = {}  # CPU spent on each destination
+
+        self._encode_seconds_metric = _get_encode_seconds_metric().labels()
+        self._superseded_metric = _get_superseded_metric().labels()
+        self._refused_metric = get_default_registry().counter(
+            'sensor_images_refused_total', 'Encoded images not sent as they were over the session\'s limits'
+        ).labels()
+
+    def submit(self, image: carla.Image, host: str, port: int):
+        address = (host, port)
+
+        with self._condition:
+            if self._pending_images.pop(address, None) is not None:
+                self._dropped += 1
+                self._superseded_metric.inc()
+
+            self._pending_images[address] = image
+            self._condition.notify()
+
+    def get_stats(self) -> EncoderPoolStats:
+        with self._condition:
+            return EncoderPoolStats(
+                encoded=self._encoded,
+                dropped=self._dropped,
+                refused=self._refused,
+            )
+
+    def get_encode_seconds(self, address: Tuple[str, int]) -> float:
+        with self._condition:
+            return self._encode_seconds_by_address.get(address, 0.0)
+
+    def forget(self, address: Tuple[str, int]):
+        with self._condition:
+            self._encode_seconds_by_address.pop(address, None)
+
+    def _encode_and_send(self):
+        while not self._stop_event.is_set():
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._pending_images) > 0 or self._stop_event.is_set())
+                if self._stop_event.is_set():
+                    return
+
+                address, image = self._pending_images.popitem(last=False)
+
+            started = time.perf_counter()
+            webp_bytes = _carla_image_to_bytes(image)
+            encode_seconds = time.perf_counter() - started
+            self._encode_seconds_metric.observe(encode_seconds)
+
+            refused = self._can_send is not None and not self._can_send(address, len(webp_bytes))
+
+            with self._condition:
+                self._encoded += 1
+                self._encode_seconds_by_address[address] = self._encode_seconds_by_address.get(address, 0.0) + encode_seconds
+                if refused:
+                    self._refused += 1
+
+            if refused:
+                self._refused_metric.inc()
+                continue
+
+            try:
+                self._sender.send_datagram(webp_bytes, address)
+            except Full:
+                pass
+
+    def _wake(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def _create_threads(self):
+        self._threads = [Thread(target=self._encode_and_send) for _ in range(0, self._workers)]
+
+    def _before_start(self):
+        pass
+
+    def _after_stop(self):
+        with self._condition:
+            self._pending_images.clear()
+
+
 class Sensor(Threader):
-    def __init__(self, client: carla.Client, actor_id: int, queue_size: int, sender: Sender, host: str, port: int):
+    def __init__(self,
+            client: carla.Client,
+            actor_id: int,
+            queue_size: int,
+            sender: Sender,
+            host: str,
+            port: int,
+            synchronous: bool = False,
+            encoder_pool: Optional[EncoderPool] = None):
         super().__init__()
 
         self._client: carla.Client = client
@@ -117,6 +273,27 @@ class Sensor(Threader):
         self._carla_images: Queue = Queue(maxsize=self._queue_size)
         self._webp_bytes: Queue = Queue(maxsize=self._queue_size)
 
+        # in synchronous mode images are held until the tick that produced them is dispatched
+        self._synchronous: bool = synchronous
+        self._frame_condition: Condition = Condition()
+        self._pending_images: Dict[int, carla.Image] = {}
+
+        # with an encoder pool (shared between sensors) there are no threads of our own
+        self._encoder_pool: Optional[EncoderPool] = encoder_pool
+
+        # paused while nobody is watching; no images are streamed from Carla or encoded
+        self._pause_lock: Lock = Lock()
+        self._paused: bool = False
+
+        self._encode_seconds_metric = _get_encode_seconds_metric().labels()
+        self._superseded_metric = _get_superseded_metric().labels()
+
+    def _handle_image(self, image: carla.Image):
+        if self._encoder_pool is not None:
+            self._encoder_pool.submit(image, self._host, self._port)
+        else:
+            self._add_image_to_carla_images_queue(image)
+
     def _add_image_to_carla_images_queue(self, image: carla.Image):
         while not self._stop_event.is_set():
             try:
@@ -125,9 +302,35 @@ class Sensor(Threader):
             except Full:
                 try:
                     self._carla_images.get_nowait()
+                    self._superseded_metric.inc()
                 except Empty:
                     pass
 
+    def _add_image_to_pending_images(self, image: carla.Image):
+        with self._frame_condition:
+            self._pending_images[image.frame] = image
+            self._frame_condition.notify_all()
+
+    def dispatch(self, frame: int, timeout: float = _DISPATCH_TIMEOUT):
+        if self._paused:  # no frame is coming; don't hold up the tick waiting for one
+            return
+
+        with self._frame_condition:
+            self._frame_condition.wait_for(
+                lambda: frame in self._pending_images or self._stop_event.is_set(),
+                timeout=timeout
+            )
+
+            image = self._pending_images.pop(frame, None)
+
+            for stale_frame in [x for x in self._pending_images.keys() if x < frame]:
+                self._pending_images.pop(stale_frame)
+
+        if image is None:
+            return
+
+        self._handle_image(image)
+
     def _fill_webp_bytes_queue_from_carla_images_queue(self):
         while not self._stop_event.is_set():
             try:
@@ -135,7 +338,12 @@ class Sensor(Threader):
             except Empty:
                 continue
 
-            webp_bytes = _carla_image_to_webp_bytes(carla_image)
+            if carla_image is WAKEUP:
+                continue
+
+            started = time.perf_counter()
+            webp_bytes = _carla_image_to_bytes(carla_image)
+            self._encode_seconds_metric.observe(time.perf_counter() - started)
 
             while not self._stop_event.is_set():
                 try:
@@ -144,6 +352,7 @@ class Sensor(Threader):
                 except Full:
                     try:
                         self._webp_bytes.get_nowait()
+                        self._superseded_metric.inc()
                     except Empty:
                         pass
 
@@ -154,20 +363,66 @@ class Sensor(Threader):
             except Empty:
                 continue
 
+            if webp_bytes is WAKEUP:
+                continue
+
             try:
                 self._sender.send_datagram(webp_bytes, (self._host, self._port))
             except Full:
                 pass
 
+    def _wake(self):
+        wake_queue(self._carla_images)
+        wake_queue(self._webp_bytes)
+
+        with self._frame_condition:  # and anyone in dispatch()
+            self._frame_condition.notify_all()
+
     def _create_threads(self):
+        if self._encoder_pool is not None:
+            self._threads = []
+            return
+
         self._threads = [
             Thread(target=self._fill_webp_bytes_queue_from_carla_images_queue),
             Thread(target=self._send_datagrams_from_webp_bytes_queue)
         ]
 
+    def _listen(self):
+        if self._synchronous:
+            self._sensor.listen(self._add_image_to_pending_images)
+        else:
+            self._sensor.listen(self._handle_image)
+
+    def is_paused(self) -> bool:
+        return self._paused
+
+    def pause(self):
+        with self._pause_lock:
+            if self._paused or self._sensor is None:
+                return
+
+            self._paused = True
+            self._sensor.stop()
+
+        with self._frame_condition:
+            self._pending_images.clear()
+
+    def resume(self):
+        with self._pause_lock:
+            if not self._paused:
+                return
+
+            self._paused = False
+            if not self._stop_event.is_set():
+                self._listen()
+
     def _before_start(self):
         self._sensor = get_sensor(self._client, self._actor_id)
-        self._sensor.listen(self._add_image_to_carla_images_queue)
+
+        with self._pause_lock:
+            if not self._paused:
+                self._listen()
 
     def _after_stop(self):
         self._sensor.stop()
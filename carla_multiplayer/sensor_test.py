@@ -1,8 +1,10 @@
+import time
 import unittest
 
-from mock import Mock, call
+from mock import Mock, call, patch
 
-from .sensor import create_sensor, _SENSOR_TRANSFORM, carla, get_sensor, delete_sensor
+from .sensor import create_sensor, _SENSOR_TRANSFORM, carla, get_sensor, delete_sensor, Sensor, EncoderPool, _carla_image_to_bytes, \
+    set_image_format, get_image_format
 
 
 class SensorFunctionTest(unittest.TestCase):
@@ -75,5 +77,137 @@ class SensorFunctionTest(unittest.TestCase):
         )
 
 
+class ImageFormatTest(unittest.TestCase):
+    def tearDown(self) -> None:
+        set_image_format('webp')
+
+    def test_image_formats(self):
+        image = Mock(raw_data=bytes([0, 0, 255, 255]) * 16, width=4, height=4)
+
+        self.assertEqual('webp', get_image_format())
+        self.assertEqual(b'RIFF', _carla_image_to_bytes(image)[:4])
+
+        set_image_format('jpeg')
+
+        self.assertEqual(b'\xff\xd8', _carla_image_to_bytes(image)[:2])
+
+        set_image_format('png')
+
+        self.assertEqual(b'\x89PNG', _carla_image_to_bytes(image)[:4])
+
+        with self.assertRaises(ValueError):
+            set_image_format('gif')
+
+        self.assertEqual('png', get_image_format())
+
+
 class SensorTest(unittest.TestCase):
     pass  # TODO: carla makes testing hard
+
+
+class SynchronousSensorTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = Mock()
+        self.sensor = self.client.get_world.return_value.get_actor.return_value
+
+        self.subject = Sensor(self.client, 2, 2, Mock(), '127.0.0.1', 13338, synchronous=True)
+        self.subject._before_start()
+
+        self.listen_callback = self.sensor.listen.call_args[0][0]
+
+    def test_dispatch(self):
+        images = [Mock(frame=frame) for frame in [1, 2, 3]]
+        for image in images:
+            self.listen_callback(image)
+
+        self.assertTrue(self.subject._carla_images.empty())  # held until dispatched
+
+        self.subject.dispatch(2)
+
+        self.assertEqual(images[1], self.subject._carla_images.get_nowait())
+        self.assertEqual([3], list(self.subject._pending_images.keys()))  # frame 1 was stale
+
+    def test_dispatch_missing_frame(self):
+        self.subject.dispatch(4, timeout=0.01)
+
+        self.assertTrue(self.subject._carla_images.empty())
+
+    def test_pause_and_resume(self):
+        self.listen_callback(Mock(frame=1))
+
+        self.subject.pause()
+        self.subject.pause()
+
+        self.sensor.stop.assert_called_once_with()
+        self.assertTrue(self.subject.is_paused())
+        self.assertEqual({}, self.subject._pending_images)
+
+        started = time.perf_counter()
+        self.subject.dispatch(2, timeout=1.0)
+
+        self.assertLess(time.perf_counter() - started, 0.5)  # not waiting on a frame that won't come
+
+        self.subject.resume()
+
+        self.assertFalse(self.subject.is_paused())
+        self.assertEqual(2, self.sensor.listen.call_count)
+        self.assertEqual(self.listen_callback, self.sensor.listen.call_args[0][0])
+
+
+@patch('carla_multiplayer.sensor._carla_image_to_webp_bytes', lambda image: image.webp_bytes)
+class EncoderPoolTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sender = Mock()
+
+    def tearDown(self) -> None:
+        self.subject.stop()
+
+    def test_latest_image_per_destination(self):
+        self.subject = EncoderPool(self.sender, workers=1)
+
+        self.subject.submit(Mock(webp_bytes=b'a1'), '127.0.0.1', 1)
+        self.subject.submit(Mock(webp_bytes=b'b1'), '127.0.0.1', 2)
+        self.subject.submit(Mock(webp_bytes=b'a2'), '127.0.0.1', 1)
+
+        self.subject.start()
+        time.sleep(0.1)
+
+        self.assertEqual(
+            [call(b'b1', ('127.0.0.1', 2)), call(b'a2', ('127.0.0.1', 1))],
+            self.sender.send_datagram.call_args_list
+        )
+        self.assertEqual((2, 1, 0), tuple(self.subject.get_stats()))
+        self.assertGreater(self.subject.get_encode_seconds(('127.0.0.1', 1)), 0.0)
+        self.assertEqual(0.0, self.subject.get_encode_seconds(('127.0.0.1', 3)))
+
+        self.subject.forget(('127.0.0.1', 1))
+
+        self.assertEqual(0.0, self.subject.get_encode_seconds(('127.0.0.1', 1)))
+
+    def test_can_send(self):
+        self.subject = EncoderPool(self.sender, workers=1, can_send=lambda address, size: address[1] == 1)
+
+        self.subject.start()
+        self.subject.submit(Mock(webp_bytes=b'a1'), '127.0.0.1', 1)
+        self.subject.submit(Mock(webp_bytes=b'b1'), '127.0.0.1', 2)
+        time.sleep(0.1)
+
+        self.assertEqual([call(b'a1', ('127.0.0.1', 1))], self.sender.send_datagram.call_args_list)
+        self.assertEqual(1, self.subject.get_stats().refused)
+
+    def test_sensor_uses_pool(self):
+        self.subject = Mock()
+        client = Mock()
+        sensor = client.get_world.return_value.get_actor.return_value
+
+        subject = Sensor(client, 2, 2, Mock(), '127.0.0.1', 13338, encoder_pool=self.subject)
+        subject.start()
+
+        image = Mock()
+        sensor.listen.call_args[0][0](image)
+
+        subject.stop()
+
+        self.assertEqual([], subject._threads)
+        self.subject.submit.assert_called_once_with(image, '127.0.0.1', 13338)
+        sensor.stop.assert_called_once_with()
@@ -1,9 +1,17 @@
-import time
-from typing import Optional, List
-
-from .sensor import create_sensor, _SENSOR_BLUEPRINT_NAME, _SENSOR_TRANSFORM, _FPS, _WIDTH, _HEIGHT, Sensor, delete_sensor
-from .udp import Receiver, Sender
-from .vehicle import create_vehicle, Vehicle, delete_vehicle, _CONTROL_RATE, _CONTROL_EXPIRE, _RESET_RATE
+from threading import Event
+from typing import Dict, Optional, List
+
+from .metrics import MetricsServer
+from .orchestrator import TickOrchestrator
+from .pool import ActorPair, ActorPool
+from .rpc import RPCClient, RPCStat
+from .sensor import create_sensor, _SENSOR_BLUEPRINT_NAME, _SENSOR_TRANSFORM, _FPS, _WIDTH, _HEIGHT, Sensor, delete_sensor, \
+    set_image_format, _IMAGE_FORMAT, _IMAGE_FORMATS
+from .spawn import SpawnPointSelector
+from .telemetry import TelemetrySender, _TELEMETRY_RATE
+from .udp import Datagram, Receiver, Sender
+from .viewer import ViewerWatchdog, is_viewer_keepalive, _VIEWER_TIMEOUT, _REAP_TIMEOUT
+from .vehicle import Vehicle, VehicleManager, DegradationCurve, delete_vehicle, _CONTROL_RATE, _CONTROL_EXPIRE, _RESET_RATE
 
 try:  # cater for python3 -m (module) vs python3 (file)
     from . import wrapped_carla as carla
@@ -33,7 +41,17 @@ class Server(object):
             reset_rate: float = _RESET_RATE,
             fps: int = _FPS,
             width: int = _WIDTH,
-            height: int = _HEIGHT):
+            height: int = _HEIGHT,
+            vehicle_manager: Optional[VehicleManager] = None,
+            apply_on_receive: bool = False,
+            degradation_curve: Optional[DegradationCurve] = None,
+            synchronous: bool = False,
+            orchestrator: Optional[TickOrchestrator] = None,
+            telemetry_rate: Optional[float] = _TELEMETRY_RATE,
+            actor_pool: Optional[ActorPool] = None,
+            viewer_timeout: Optional[float] = _VIEWER_TIMEOUT,
+            reap_timeout: Optional[float] = _REAP_TIMEOUT,
+            carla_client: Optional[carla.Client] = None):
         self._vehicle_blueprint_name: str = vehicle_blueprint_name
         self._vehicle_port: int = vehicle_port
         self._sensor_port: int = sensor_port
@@ -51,9 +69,16 @@ class Server(object):
         self._fps: int = fps
         self._width: int = width
         self._height: int = height
+        self._vehicle_manager: Optional[VehicleManager] = vehicle_manager
+        self._apply_on_receive: bool = apply_on_receive
+        self._degradation_curve: Optional[DegradationCurve] = degradation_curve
+        self._synchronous: bool = synchronous or orchestrator is not None
+        self._telemetry_rate: Optional[float] = telemetry_rate
+        self._actor_pool: Optional[ActorPool] = actor_pool
 
         self._vehicle_actor: carla.Actor = None
         self._sensor_actor: carla.Actor = None
+        self._actor_pair: Optional[ActorPair] = None
 
         self._receiver: Receiver = Receiver(
             port=self._vehicle_port,
@@ -67,45 +92,91 @@ class Server(object):
             use_socket_from=self._receiver
         )
         self._sensor: Optional[Sensor] = None
+        self._telemetry_sender: Optional[TelemetrySender] = None
 
-        self._client: carla.Client = carla.Client(self._carla_host, self._carla_port)
+        # caches the world, blueprint library and actors, skips redundant writes and counts / times every RPC
+        self._client: RPCClient = RPCClient(
+            carla_client if carla_client is not None else carla.Client(self._carla_host, self._carla_port)  # or e.g. a simulated one
+        )
         self._client.set_timeout(self._carla_timeout)
 
+        # in synchronous mode controls are applied just before each world tick and frames dispatched just after
+        self._orchestrator: Optional[TickOrchestrator] = orchestrator
+        self._owns_orchestrator: bool = False
+        if self._synchronous and self._orchestrator is None:
+            self._orchestrator = TickOrchestrator(
+                client=self._client,
+                fixed_delta_seconds=1.0 / self._fps
+            )
+            self._owns_orchestrator = True
+
+        # the sensor is paused while the viewer is away, and the server stops if it doesn't come back
+        self._viewer_watchdog: Optional[ViewerWatchdog] = None
+        if viewer_timeout is not None:
+            self._viewer_watchdog = ViewerWatchdog(
+                timeout=viewer_timeout,
+                reap_timeout=reap_timeout,
+                on_pause=lambda _: self._sensor.pause(),
+                on_resume=lambda _: self._sensor.resume(),
+                on_reap=lambda _: self._reaped.set()
+            )
+        self._reaped: Event = Event()
+
         self._stopped = False
 
+    def _handle_datagram(self, datagram: Datagram):
+        keepalive = is_viewer_keepalive(datagram.data)
+
+        if self._viewer_watchdog is not None:
+            self._viewer_watchdog.seen(self._client_host, keepalive=keepalive)
+
+        if keepalive:
+            return
+
+        self._vehicle.recv(datagram)
+
     def start(self):
         self._stopped = False
+        self._reaped.clear()
 
         world = self._client.get_world()
         if world is None:
             raise ValueError('attempt to get world returned None; carla.Client possibly not working')
 
-        if self._vehicle_transforms is None:
-            self._vehicle_transforms = [x.get_transform() for x in world.get_actors() if x.type_id == 'spectator']
+        # a free point is found locally from the map's spawn points (or the given transforms) and one spawn attempted
+        spawn_point_selector = SpawnPointSelector(self._client, self._vehicle_transforms)
 
-        while not self._stopped:
-            if self._vehicle_actor is not None:
-                break
+        if self._owns_orchestrator:  # the world needs to be ticking for spawning to complete
+            self._orchestrator.start()
+
+        if self._actor_pool is not None:  # a parked pair, teleported into place
+            transform = spawn_point_selector.get_free_transform()
+            if transform is not None:
+                self._actor_pair = self._actor_pool.acquire(self._vehicle_blueprint_name, transform)
+                self._vehicle_actor = self._actor_pair.vehicle
+                self._sensor_actor = self._actor_pair.sensor
+        else:
+            self._vehicle_actor = spawn_point_selector.spawn(self._vehicle_blueprint_name)
 
-            for transform in self._vehicle_transforms:
-                try:
-                    self._vehicle_actor = create_vehicle(self._client, self._vehicle_blueprint_name, transform)
-                    break
-                except RuntimeError:
-                    continue
+        if self._vehicle_actor is None:
+            if self._owns_orchestrator:
+                self._orchestrator.stop()
+
+            raise ValueError('failed to spawn {}; no free spawn point'.format(repr(self._vehicle_blueprint_name)))
 
         if self._stopped:
             return
 
-        self._sensor_actor = create_sensor(
-            client=self._client,
-            actor_id=self._vehicle_actor.id,
-            sensor_blueprint_name=self._sensor_blueprint_name,
-            fps=self._fps,
-            width=self._width,
-            height=self._height,
-            transform=self._sensor_transform
-        )
+        if self._sensor_actor is None:
+            self._sensor_actor = create_sensor(
+                client=self._client,
+                actor_id=self._vehicle_actor.id,
+                sensor_blueprint_name=self._sensor_blueprint_name,
+                fps=self._fps,
+                width=self._width,
+                height=self._height,
+                transform=self._sensor_transform
+            )
 
         if self._stopped:
             return
@@ -116,7 +187,9 @@ class Server(object):
             actor_id=self._vehicle_actor.id,
             control_rate=self._control_rate,
             control_expire=self._control_expire,
-            reset_rate=self._reset_rate
+            reset_rate=self._reset_rate,
+            apply_on_receive=self._apply_on_receive,
+            degradation_curve=self._degradation_curve
         )
 
         self._sensor = Sensor(
@@ -125,24 +198,51 @@ class Server(object):
             queue_size=self._queue_size,
             sender=self._sender,
             host=self._client_host,
-            port=self._sensor_port
+            port=self._sensor_port,
+            synchronous=self._synchronous
         )
 
-        self._receiver.set_callback(self._vehicle.recv)
+        if self._telemetry_rate is not None:
+            self._telemetry_sender = TelemetrySender(
+                client=self._client,
+                actor_id=self._vehicle_actor.id,
+                sender=self._sender,
+                host=self._client_host,
+                port=self._sensor_port,
+                rate=self._telemetry_rate
+            )
+
+        self._receiver.set_callback(self._handle_datagram)
 
         self._receiver.start()
-        self._vehicle.start()
+        if self._vehicle_manager is not None:  # controls for all vehicles are applied in one batch
+            self._vehicle_manager.add_vehicle(self._vehicle)
+        elif self._orchestrator is not None:
+            self._vehicle.prepare()
+            self._orchestrator.add_before_tick(self._vehicle.apply)
+        else:
+            self._vehicle.start()
 
         self._sender.start()
         self._sensor.start()
+        if self._telemetry_sender is not None:
+            self._telemetry_sender.start()
+        if self._orchestrator is not None:
+            self._orchestrator.add_after_tick(self._sensor.dispatch)
+        if self._viewer_watchdog is not None:
+            self._viewer_watchdog.add(self._client_host)
+            self._viewer_watchdog.start()
+
+    def get_rpc_stats(self) -> Dict[str, RPCStat]:
+        return self._client.stats.snapshot()
 
     def run(self):
         if self._stopped:
             return
 
-        while not self._stopped:
+        while not self._stopped and not self._reaped.is_set():
             try:
-                time.sleep(1)
+                self._reaped.wait(1)
             except KeyboardInterrupt:
                 break
 
@@ -150,13 +250,37 @@ class Server(object):
         if self._stopped:
             return
 
+        if self._viewer_watchdog is not None:
+            self._viewer_watchdog.stop()
+            self._viewer_watchdog.remove(self._client_host)
+
+        if self._orchestrator is not None:
+            self._orchestrator.remove_after_tick(self._sensor.dispatch)
+            self._orchestrator.remove_before_tick(self._vehicle.apply)
+
+        if self._telemetry_sender is not None:
+            self._telemetry_sender.stop()
         self._sensor.stop()
         self._sender.stop()
-        delete_sensor(self._client, self._sensor_actor.id)
+        if self._actor_pair is None:
+            delete_sensor(self._client, self._sensor_actor.id)
 
+        if self._vehicle_manager is not None:
+            self._vehicle_manager.remove_vehicle(self._vehicle)
         self._vehicle.stop()
         self._receiver.stop()
-        delete_vehicle(self._client, self._vehicle_actor.id)
+
+        if self._actor_pair is not None:  # parked for the next player rather than destroyed
+            self._actor_pool.release(self._actor_pair)
+        else:
+            delete_vehicle(self._client, self._vehicle_actor.id)
+
+        self._vehicle_actor = None
+        self._sensor_actor = None
+        self._actor_pair = None
+
+        if self._owns_orchestrator:
+            self._orchestrator.stop()
 
 
 def run_server(port: int,
@@ -174,7 +298,18 @@ def run_server(port: int,
         reset_rate: float = _RESET_RATE,
         fps: int = _FPS,
         width: int = _WIDTH,
-        height: int = _HEIGHT):
+        height: int = _HEIGHT,
+        apply_on_receive: bool = False,
+        synchronous: bool = False,
+        telemetry_rate: Optional[float] = _TELEMETRY_RATE,
+        viewer_timeout: Optional[float] = _VIEWER_TIMEOUT,
+        reap_timeout: Optional[float] = _REAP_TIMEOUT,
+        metrics_port: Optional[int] = None):
+    metrics_server = None
+    if metrics_port is not None:
+        metrics_server = MetricsServer(metrics_port)
+        metrics_server.start()
+
     server = Server(
         vehicle_port=port,
         sensor_port=port,
@@ -192,13 +327,21 @@ def run_server(port: int,
         reset_rate=reset_rate,
         fps=fps,
         width=width,
-        height=height
+        height=height,
+        apply_on_receive=apply_on_receive,
+        synchronous=synchronous,
+        telemetry_rate=telemetry_rate,
+        viewer_timeout=viewer_timeout,
+        reap_timeout=reap_timeout
     )
 
     server.start()
     server.run()
     server.stop()
 
+    if metrics_server is not None:
+        metrics_server.stop()
+
 
 if __name__ == '__main__':
     import argparse
@@ -218,9 +361,20 @@ if __name__ == '__main__':
     parser.add_argument('--fps', type=int, default=_FPS)
     parser.add_argument('--width', type=int, default=_WIDTH)
     parser.add_argument('--height', type=int, default=_HEIGHT)
+    parser.add_argument('--apply-on-receive', action='store_true', default=False)
+    parser.add_argument('--synchronous', action='store_true', default=False)
+    parser.add_argument('--telemetry-rate', type=float, default=_TELEMETRY_RATE)
+    parser.add_argument('--no-telemetry', action='store_true', default=False)
+    parser.add_argument('--viewer-timeout', type=float, default=_VIEWER_TIMEOUT)
+    parser.add_argument('--reap-timeout', type=float, default=_REAP_TIMEOUT)
+    parser.add_argument('--no-viewer-timeout', action='store_true', default=False)
+    parser.add_argument('--metrics-port', type=int, default=None)  # serve Prometheus metrics on localhost
+    parser.add_argument('--image-format', type=str, choices=_IMAGE_FORMATS, default=_IMAGE_FORMAT)
 
     args = parser.parse_args()
 
+    set_image_format(args.image_format)
+
     run_server(
         port=args.port,
         vehicle_blueprint_name=args.vehicle_blueprint_name,
@@ -235,5 +389,11 @@ if __name__ == '__main__':
         reset_rate=args.reset_rate,
         fps=args.fps,
         width=args.width,
-        height=args.height
+        height=args.height,
+        apply_on_receive=args.apply_on_receive,
+        synchronous=args.synchronous,
+        telemetry_rate=None if args.no_telemetry else args.telemetry_rate,
+        viewer_timeout=None if args.no_viewer_timeout else args.viewer_timeout,
+        reap_timeout=args.reap_timeout,
+        metrics_port=args.metrics_port
     )
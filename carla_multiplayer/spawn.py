@@ -0,0 +1,164 @@
+import datetime
+import math
+from threading import Lock
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from .pool import _PARKED_BELOW_Z
+
+try:  # cater for python3 -m (module) vs python3 (file)
+    from . import wrapped_carla as carla
+except ImportError:
+    import wrapped_carla as carla
+
+_CELL_SIZE = 10.0  # m
+_CLEARANCE = 5.0  # m; a spawn point closer than this to an actor is considered occupied
+_RESERVATION = datetime.timedelta(seconds=2)  # long enough for a new actor to show up in world.get_actors()
+_ACTOR_FILTERS = ['vehicle.*', 'walker.*']
+
+Cell = Tuple[int, int]
+
+
+class GridIndex(object):
+    def __init__(self, cell_size: float = _CELL_SIZE):
+        self._cell_size: float = cell_size
+
+        self._cells: Dict[Cell, Dict[Hashable, Tuple[float, float]]] = {}
+        self._cells_by_key: Dict[Hashable, Cell] = {}
+
+    def _get_cell(self, x: float, y: float) -> Cell:
+        return int(math.floor(x / self._cell_size)), int(math.floor(y / self._cell_size))
+
+    def __len__(self) -> int:
+        return len(self._cells_by_key)
+
+    def insert(self, key: Hashable, x: float, y: float):
+        self.remove(key)
+
+        cell = self._get_cell(x, y)
+        self._cells.setdefault(cell, {})[key] = (x, y)
+        self._cells_by_key[key] = cell
+
+    def remove(self, key: Hashable):
+        cell = self._cells_by_key.pop(key, None)
+        if cell is None:
+            return
+
+        points = self._cells[cell]
+        points.pop(key, None)
+        if len(points) == 0:
+            self._cells.pop(cell)
+
+    def clear(self):
+        self._cells = {}
+        self._cells_by_key = {}
+
+    def _get_within(self, x: float, y: float, radius: float) -> Iterable[Hashable]:
+        # only the cells overlapping the radius need looking at, so this doesn't grow with the number of points
+        min_cell_x, min_cell_y = self._get_cell(x - radius, y - radius)
+        max_cell_x, max_cell_y = self._get_cell(x + radius, y + radius)
+        radius_squared = radius ** 2
+
+        for cell_x in range(min_cell_x, max_cell_x + 1):
+            for cell_y in range(min_cell_y, max_cell_y + 1):
+                for key, (other_x, other_y) in self._cells.get((cell_x, cell_y), {}).items():
+                    if (other_x - x) ** 2 + (other_y - y) ** 2 < radius_squared:
+                        yield key
+
+    def get_within(self, x: float, y: float, radius: float) -> List[Hashable]:
+        return list(self._get_within(x, y, radius))
+
+    def any_within(self, x: float, y: float, radius: float) -> bool:
+        for _ in self._get_within(x, y, radius):
+            return True
+
+        return False
+
+
+class SpawnPointSelector(object):
+    def __init__(self,
+            client: carla.Client,
+            spawn_points: Optional[List[carla.Transform]] = None,
+            clearance: float = _CLEARANCE,
+            cell_size: float = _CELL_SIZE):
+        self._client: carla.Client = client
+        self._spawn_points: Optional[List[carla.Transform]] = spawn_points  # defaults to the map's
+        self._clearance: float = clearance
+
+        self._lock: Lock = Lock()
+        self._index: GridIndex = GridIndex(cell_size=cell_size)
+        self._next_index: int = 0  # round-robin start point, so consecutive players are spread around the map
+        self._reservations: Dict[int, datetime.datetime] = {}
+
+    def _get_spawn_points(self) -> List[carla.Transform]:
+        if self._spawn_points is None:
+            self._spawn_points = list(self._client.get_world().get_map().get_spawn_points())
+
+        return self._spawn_points
+
+    def _refresh_index(self, actors: Iterable[carla.Actor]):
+        self._index.clear()
+
+        for actor in actors:
+            location = actor.get_location()  # served from the client-side episode state, not an RPC
+            if location.z < _PARKED_BELOW_Z:  # e.g. by an ActorPool
+                continue
+
+            self._index.insert(actor.id, location.x, location.y)
+
+    def _get_actors(self) -> List[carla.Actor]:
+        actors = self._client.get_world().get_actors()  # the one RPC needed to know where everything is
+
+        seen: Set[int] = set()
+        filtered = []
+        for actor_filter in _ACTOR_FILTERS:
+            for actor in actors.filter(actor_filter):
+                if actor.id not in seen:
+                    seen.add(actor.id)
+                    filtered += [actor]
+
+        return filtered
+
+    def get_free_transform(self) -> Optional[carla.Transform]:
+        spawn_points = self._get_spawn_points()
+        if len(spawn_points) == 0:
+            return None
+
+        actors = self._get_actors()
+        now = datetime.datetime.now()
+
+        with self._lock:
+            self._refresh_index(actors)
+
+            self._reservations = {k: v for k, v in self._reservations.items() if now - v < _RESERVATION}
+
+            for i in range(0, len(spawn_points)):
+                index = (self._next_index + i) % len(spawn_points)
+                if index in self._reservations:
+                    continue
+
+                location = spawn_points[index].location
+                if self._index.any_within(location.x, location.y, self._clearance):
+                    continue
+
+                self._next_index = index + 1
+                self._reservations[index] = now
+
+                return spawn_points[index]
+
+        return None
+
+    def spawn(self, blueprint_name: str) -> Optional[carla.Actor]:
+        transform = self.get_free_transform()
+        if transform is None:
+            return None
+
+        world = self._client.get_world()
+
+        blueprint = world.get_blueprint_library().find(blueprint_name)
+        vehicle = world.try_spawn_actor(blueprint, transform)  # None rather than an exception if we were beaten to it
+        if vehicle is None:
+            return None
+
+        world.wait_for_tick()
+
+        return vehicle
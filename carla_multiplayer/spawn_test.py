@@ -0,0 +1,94 @@
+import unittest
+
+from mock import Mock
+
+from .spawn import GridIndex, SpawnPointSelector
+
+
+def _get_transform(x: float, y: float) -> Mock:
+    return Mock(location=Mock(x=x, y=y))
+
+
+def _get_actor(actor_id: int, x: float, y: float, z: float = 0.0) -> Mock:
+    actor = Mock(id=actor_id)
+    actor.get_location.return_value = Mock(x=x, y=y, z=z)
+
+    return actor
+
+
+class GridIndexTest(unittest.TestCase):
+    def test_any_within(self):
+        subject = GridIndex(cell_size=10.0)
+
+        subject.insert(1, 0.0, 0.0)
+        subject.insert(2, 95.0, -95.0)
+
+        self.assertEqual(2, len(subject))
+        self.assertTrue(subject.any_within(4.0, 0.0, 5.0))
+        self.assertTrue(subject.any_within(-9.0, 9.0, 13.0))  # across cells
+        self.assertFalse(subject.any_within(6.0, 0.0, 5.0))
+        self.assertTrue(subject.any_within(100.0, -100.0, 8.0))
+        self.assertEqual([1], subject.get_within(0.0, 0.0, 5.0))
+        self.assertEqual([1, 2], sorted(subject.get_within(0.0, 0.0, 200.0)))
+
+        subject.insert(1, 50.0, 50.0)  # moved
+
+        self.assertFalse(subject.any_within(0.0, 0.0, 5.0))
+
+        subject.remove(1)
+        subject.remove(1)
+
+        self.assertEqual(1, len(subject))
+        self.assertFalse(subject.any_within(50.0, 50.0, 5.0))
+
+
+class SpawnPointSelectorTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = Mock()
+        self.actors = []
+        self.client.get_world.return_value.get_actors.return_value.filter.side_effect = lambda x: self.actors if x == 'vehicle.*' else []
+
+        self.spawn_points = [_get_transform(0.0, 0.0), _get_transform(50.0, 0.0), _get_transform(100.0, 0.0)]
+        self.subject = SpawnPointSelector(self.client, self.spawn_points)
+
+    def test_get_free_transform(self):
+        self.actors = [_get_actor(1, 1.0, 1.0)]  # sat on the first
+
+        self.assertIs(self.spawn_points[1], self.subject.get_free_transform())
+        self.assertIs(self.spawn_points[2], self.subject.get_free_transform())  # round-robin, and the last is reserved
+        self.assertIsNone(self.subject.get_free_transform())
+
+    def test_parked_actors_ignored(self):
+        self.actors = [_get_actor(1, 0.0, 0.0, -100.0), _get_actor(2, 50.0, 0.0, -100.0)]  # an ActorPool's parking slots
+
+        self.assertIs(self.spawn_points[0], self.subject.get_free_transform())
+        self.assertIs(self.spawn_points[1], self.subject.get_free_transform())
+
+    def test_default_spawn_points(self):
+        self.client.get_world.return_value.get_map.return_value.get_spawn_points.return_value = [_get_transform(0.0, 0.0)]
+        subject = SpawnPointSelector(self.client)
+
+        self.assertIsNotNone(subject.get_free_transform())
+        self.assertIsNone(subject.get_free_transform())
+
+    def test_spawn(self):
+        world = self.client.get_world.return_value
+
+        vehicle = self.subject.spawn('vehicle.tesla.model3')
+
+        self.assertIs(world.try_spawn_actor.return_value, vehicle)
+        world.try_spawn_actor.assert_called_once_with(
+            world.get_blueprint_library.return_value.find.return_value,
+            self.spawn_points[0]
+        )
+        world.spawn_actor.assert_not_called()
+
+        world.try_spawn_actor.return_value = None
+
+        self.assertIsNone(self.subject.spawn('vehicle.tesla.model3'))
+        self.assertEqual(2, world.try_spawn_actor.call_count)  # still only one attempt per spawn
+
+        self.actors = [_get_actor(1, 100.0, 0.0)]
+
+        self.assertIsNone(self.subject.spawn('vehicle.tesla.model3'))  # the rest reserved or occupied; no RPC at all
+        self.assertEqual(2, world.try_spawn_actor.call_count)
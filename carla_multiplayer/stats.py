@@ -0,0 +1,91 @@
+import bisect
+from threading import Lock
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+# upper bounds (in seconds) suited to latencies and durations from 100 us to 10 s
+_LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0,
+    10.0,
+)
+
+
+class HistogramSnapshot(NamedTuple):
+    count: int
+    sum: float
+    min: Optional[float]
+    max: Optional[float]
+    buckets: Tuple[float, ...]  # upper bounds; the last count is for everything above the last bound
+    counts: Tuple[int, ...]
+
+    @property
+    def mean(self) -> Optional[float]:
+        if self.count == 0:
+            return None
+
+        return self.sum / self.count
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+
+        rank = percentile / 100.0 * self.count
+
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count > 0:
+                if i >= len(self.buckets):
+                    return self.max
+
+                return min(self.buckets[i], self.max)
+
+        return self.max
+
+
+class Histogram(object):
+    def __init__(self, buckets: Sequence[float] = _LATENCY_BUCKETS):
+        self._buckets: Tuple[float, ...] = tuple(sorted(buckets))
+
+        self._lock: Lock = Lock()
+        self._counts: List[int] = [0] * (len(self._buckets) + 1)
+        self._count: int = 0
+        self._sum: float = 0.0
+        self._min: Optional[float] = None
+        self._max: Optional[float] = None
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._buckets, value)
+
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+            if self._min is None or value < self._min:
+                self._min = value
+
+            if self._max is None or value > self._max:
+                self._max = value
+
+    def snapshot(self) -> HistogramSnapshot:
+        with self._lock:
+            return HistogramSnapshot(
+                count=self._count,
+                sum=self._sum,
+                min=self._min,
+                max=self._max,
+                buckets=self._buckets,
+                counts=tuple(self._counts),
+            )
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(self._buckets) + 1)
+            self._count = 0
+            self._sum = 0.0
+            self._min = None
+            self._max = None
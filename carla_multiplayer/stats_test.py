@@ -0,0 +1,38 @@
+import unittest
+
+from .stats import Histogram
+
+
+class HistogramTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.subject = Histogram(buckets=[1.0, 2.0, 5.0])
+
+    def test_empty(self):
+        snapshot = self.subject.snapshot()
+
+        self.assertEqual(0, snapshot.count)
+        self.assertIsNone(snapshot.mean)
+        self.assertIsNone(snapshot.percentile(50))
+
+    def test_observe(self):
+        for value in [0.5, 1.0, 1.5, 3.0, 10.0]:
+            self.subject.observe(value)
+
+        snapshot = self.subject.snapshot()
+
+        self.assertEqual(5, snapshot.count)
+        self.assertEqual(16.0, snapshot.sum)
+        self.assertEqual(0.5, snapshot.min)
+        self.assertEqual(10.0, snapshot.max)
+        self.assertEqual(3.2, snapshot.mean)
+        self.assertEqual((1.0, 2.0, 5.0), snapshot.buckets)
+        self.assertEqual((2, 1, 1, 1), snapshot.counts)
+        self.assertEqual(1.0, snapshot.percentile(40))
+        self.assertEqual(2.0, snapshot.percentile(50))
+        self.assertEqual(10.0, snapshot.percentile(99))
+
+    def test_reset(self):
+        self.subject.observe(1.0)
+        self.subject.reset()
+
+        self.assertEqual(0, self.subject.snapshot().count)
@@ -0,0 +1,335 @@
+import math
+import random
+import struct
+from queue import Full
+from threading import Lock
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from .looper import TimedLooper
+from .scheduler import Scheduler
+from .udp import Datagram, Sender
+
+try:  # cater for python3 -m (module) vs python3 (file)
+    from . import wrapped_carla as carla
+except ImportError:
+    import wrapped_carla as carla
+
+_TELEMETRY_RATE = 1.0 / 20.0  # 20 Hz
+_KEYFRAME_INTERVAL = 20  # a full update every 20 datagrams (1 s at 20 Hz); the rest only carry what changed
+_COLLISION_SENSOR_BLUEPRINT_NAME = 'sensor.other.collision'
+_LANE_INVASION_SENSOR_BLUEPRINT_NAME = 'sensor.other.lane_invasion'
+
+# header is magic, kind, epoch, sequence, keyframe sequence (that a delta is relative to), field mask
+_TELEMETRY_MAGIC = 0xC7  # not the first byte of a WebP, JPEG or PNG, so it can share the frame socket
+_KEYFRAME = 1
+_DELTA = 2
+_HEADER_STRUCT = struct.Struct('<BBHHHH')
+_SEQUENCE_MODULO = 1 << 16
+_EPOCH_BITS = 16  # picked at random by each encoder, so a restarted server (or recreated session) starts a new stream
+
+_FLAG_HAND_BRAKE = 1 << 0
+_FLAG_REVERSE = 1 << 1
+
+
+class Telemetry(NamedTuple):
+    speed: float  # m/s
+    x: float  # m
+    y: float
+    z: float
+    pitch: float  # degrees
+    yaw: float
+    roll: float
+    throttle: float
+    brake: float
+    steer: float
+    gear: int
+    hand_brake: bool
+    reverse: bool
+    collisions: int  # running count of collision events
+    lane_invasions: int  # running count of lane invasion events
+
+
+class _Field(NamedTuple):
+    name: str
+    format: str
+    scale: float  # quantization; wire value = round(value * scale)
+
+
+_FIELDS: List[_Field] = [
+    _Field('speed', 'H', 100.0),  # cm/s
+    _Field('x', 'i', 100.0),  # cm
+    _Field('y', 'i', 100.0),
+    _Field('z', 'i', 100.0),
+    _Field('pitch', 'h', 100.0),  # centidegrees
+    _Field('yaw', 'h', 100.0),
+    _Field('roll', 'h', 100.0),
+    _Field('throttle', 'h', 10000.0),
+    _Field('brake', 'h', 10000.0),
+    _Field('steer', 'h', 10000.0),
+    _Field('gear', 'b', 1.0),
+    _Field('flags', 'B', 1.0),  # hand_brake, reverse
+    _Field('collisions', 'H', 1.0),
+    _Field('lane_invasions', 'H', 1.0),
+]
+
+_FIELD_STRUCTS: List[struct.Struct] = [struct.Struct('<' + x.format) for x in _FIELDS]
+_ALL_FIELDS_MASK = (1 << len(_FIELDS)) - 1
+
+_LIMITS = {
+    'H': (0, (1 << 16) - 1),
+    'h': (-(1 << 15), (1 << 15) - 1),
+    'i': (-(1 << 31), (1 << 31) - 1),
+    'b': (-(1 << 7), (1 << 7) - 1),
+    'B': (0, (1 << 8) - 1),
+}
+
+
+def is_telemetry(data: bytes) -> bool:
+    return len(data) >= _HEADER_STRUCT.size and data[0] == _TELEMETRY_MAGIC
+
+
+def _quantize(telemetry: Telemetry) -> Tuple[int, ...]:
+    flags = 0
+    if telemetry.hand_brake:
+        flags |= _FLAG_HAND_BRAKE
+    if telemetry.reverse:
+        flags |= _FLAG_REVERSE
+
+    values = telemetry._asdict()
+    values['flags'] = flags
+
+    quantized = []
+    for field in _FIELDS:
+        minimum, maximum = _LIMITS[field.format]
+        quantized += [max(minimum, min(maximum, int(round(values[field.name] * field.scale))))]
+
+    return tuple(quantized)
+
+
+def _dequantize(quantized: Tuple[int, ...]) -> Telemetry:
+    values = {field.name: value / field.scale for field, value in zip(_FIELDS, quantized)}
+
+    flags = int(values.pop('flags'))
+    values['gear'] = int(values['gear'])
+    values['collisions'] = int(values['collisions'])
+    values['lane_invasions'] = int(values['lane_invasions'])
+
+    return Telemetry(
+        hand_brake=bool(flags & _FLAG_HAND_BRAKE),
+        reverse=bool(flags & _FLAG_REVERSE),
+        **values
+    )
+
+
+class TelemetryEncoder(object):
+    def __init__(self, keyframe_interval: int = _KEYFRAME_INTERVAL, epoch: Optional[int] = None):
+        self._keyframe_interval: int = keyframe_interval
+        self._epoch: int = epoch if epoch is not None else random.getrandbits(_EPOCH_BITS)
+
+        self._sequence: int = 0
+        self._keyframe_sequence: Optional[int] = None
+        self._keyframe: Optional[Tuple[int, ...]] = None
+
+    def encode(self, telemetry: Telemetry) -> bytes:
+        quantized = _quantize(telemetry)
+
+        self._sequence = (self._sequence + 1) % _SEQUENCE_MODULO
+
+        if self._keyframe is None or (self._sequence - self._keyframe_sequence) % _SEQUENCE_MODULO >= self._keyframe_interval:
+            self._keyframe = quantized
+            self._keyframe_sequence = self._sequence
+            kind = _KEYFRAME
+            mask = _ALL_FIELDS_MASK
+        else:  # deltas are against the last keyframe (not the last datagram), so losing one costs nothing
+            kind = _DELTA
+            mask = 0
+            for i, (value, keyframe_value) in enumerate(zip(quantized, self._keyframe)):
+                if value != keyframe_value:
+                    mask |= 1 << i
+
+        data = bytearray(_HEADER_STRUCT.pack(_TELEMETRY_MAGIC, kind, self._epoch, self._sequence, self._keyframe_sequence, mask))
+        for i, value in enumerate(quantized):
+            if mask & (1 << i):
+                data += _FIELD_STRUCTS[i].pack(value)
+
+        return bytes(data)
+
+
+class TelemetryDecoder(object):
+    def __init__(self):
+        self._epoch: Optional[int] = None
+        self._previous_epoch: Optional[int] = None
+        self._sequence: Optional[int] = None
+        self._keyframe_sequence: Optional[int] = None
+        self._keyframe: Optional[Tuple[int, ...]] = None
+
+    def decode(self, data: bytes) -> Optional[Telemetry]:
+        if not is_telemetry(data):
+            raise ValueError('not a telemetry datagram')
+
+        _, kind, epoch, sequence, keyframe_sequence, mask = _HEADER_STRUCT.unpack_from(data)
+
+        if kind not in (_KEYFRAME, _DELTA) or mask & ~_ALL_FIELDS_MASK:
+            raise ValueError('invalid telemetry datagram; kind={}, mask={}'.format(kind, bin(mask)))
+
+        # a restarted server (or recreated session) starts again from sequence 1, from its first keyframe
+        new_stream = epoch != self._epoch
+        if epoch == self._previous_epoch:  # still in flight from before the restart; don't go back to it
+            return None
+
+        if self._sequence is not None and not new_stream:
+            delta = (sequence - self._sequence) % _SEQUENCE_MODULO
+            if delta == 0 or delta >= _SEQUENCE_MODULO // 2:  # duplicate or reordered
+                return None
+
+        offset = _HEADER_STRUCT.size
+        values = {}
+        for i, field_struct in enumerate(_FIELD_STRUCTS):
+            if not mask & (1 << i):
+                continue
+
+            if offset + field_struct.size > len(data):
+                raise ValueError('truncated telemetry datagram')
+
+            values[i] = field_struct.unpack_from(data, offset)[0]
+            offset += field_struct.size
+
+        if offset != len(data):
+            raise ValueError('unexpected trailing bytes in telemetry datagram')
+
+        if kind == _KEYFRAME:
+            if mask != _ALL_FIELDS_MASK:
+                raise ValueError('telemetry keyframe is missing fields')
+
+            self._keyframe = tuple(values[i] for i in range(0, len(_FIELDS)))
+            self._keyframe_sequence = sequence
+            if new_stream and self._epoch is not None:
+                self._previous_epoch = self._epoch
+            self._epoch = epoch
+        elif new_stream or self._keyframe is None or keyframe_sequence != self._keyframe_sequence:  # we missed its keyframe
+            return None
+
+        self._sequence = sequence
+
+        return _dequantize(tuple(values.get(i, self._keyframe[i]) for i in range(0, len(_FIELDS))))
+
+
+class TelemetrySender(TimedLooper):
+    def __init__(self,
+            client: carla.Client,
+            actor_id: int,
+            sender: Sender,
+            host: str,
+            port: int,
+            rate: float = _TELEMETRY_RATE,
+            keyframe_interval: int = _KEYFRAME_INTERVAL,
+            events: bool = True,
+            scheduler: Optional[Scheduler] = None):
+        super().__init__(
+            period=rate,
+            scheduler=scheduler
+        )
+
+        self._client: carla.Client = client
+        self._actor_id: int = actor_id
+        self._sender: Sender = sender
+        self._host: str = host
+        self._port: int = port
+        self._events: bool = events
+
+        self._encoder: TelemetryEncoder = TelemetryEncoder(keyframe_interval=keyframe_interval)
+        self._vehicle: Optional[carla.Actor] = None
+        self._event_sensors: List[carla.Actor] = []
+        self._collisions: int = 0
+        self._lane_invasions: int = 0
+
+    def _handle_collision(self, event: carla.CollisionEvent):
+        self._collisions += 1
+
+    def _handle_lane_invasion(self, event: carla.LaneInvasionEvent):
+        self._lane_invasions += 1
+
+    def _before_loop(self):
+        world = self._client.get_world()
+        world.wait_for_tick()
+
+        self._vehicle = world.get_actor(self._actor_id)
+
+        if not self._events:
+            return
+
+        blueprint_library = world.get_blueprint_library()
+        for blueprint_name, callback in [
+            (_COLLISION_SENSOR_BLUEPRINT_NAME, self._handle_collision),
+            (_LANE_INVASION_SENSOR_BLUEPRINT_NAME, self._handle_lane_invasion),
+        ]:
+            event_sensor = world.spawn_actor(
+                blueprint_library.find(blueprint_name),
+                carla.Transform(),
+                attach_to=self._vehicle
+            )
+            event_sensor.listen(callback)
+            self._event_sensors += [event_sensor]
+
+    def _get_telemetry(self) -> Telemetry:
+        # these are all served from the client-side episode state rather than being RPCs
+        velocity = self._vehicle.get_velocity()
+        transform = self._vehicle.get_transform()
+        control = self._vehicle.get_control()
+
+        return Telemetry(
+            speed=math.sqrt(velocity.x ** 2 + velocity.y ** 2 + velocity.z ** 2),
+            x=transform.location.x,
+            y=transform.location.y,
+            z=transform.location.z,
+            pitch=transform.rotation.pitch,
+            yaw=transform.rotation.yaw,
+            roll=transform.rotation.roll,
+            throttle=control.throttle,
+            brake=control.brake,
+            steer=control.steer,
+            gear=control.gear,
+            hand_brake=control.hand_brake,
+            reverse=control.reverse,
+            collisions=self._collisions,
+            lane_invasions=self._lane_invasions,
+        )
+
+    def _work(self):
+        try:
+            self._sender.send_datagram(
+                data=self._encoder.encode(self._get_telemetry()),
+                address=(self._host, self._port)
+            )
+        except Full:
+            pass
+
+    def _after_loop(self):
+        for event_sensor in self._event_sensors:
+            event_sensor.stop()
+            event_sensor.destroy()
+
+        self._event_sensors = []
+
+
+class TelemetryReceiver(object):
+    def __init__(self, callback: Optional[Callable[[Telemetry], None]] = None):
+        self._callback: Optional[Callable[[Telemetry], None]] = callback
+
+        self._lock: Lock = Lock()
+        self._decoder: TelemetryDecoder = TelemetryDecoder()
+        self._telemetry: Optional[Telemetry] = None
+
+    def handle_datagram(self, datagram: Datagram):
+        with self._lock:
+            telemetry = self._decoder.decode(datagram.data)
+            if telemetry is None:
+                return
+
+            self._telemetry = telemetry
+
+        if self._callback is not None:
+            self._callback(telemetry)
+
+    def get_telemetry(self) -> Optional[Telemetry]:
+        return self._telemetry
@@ -0,0 +1,117 @@
+import time
+import unittest
+
+from mock import Mock
+
+from .controller import ControllerState, serialize_controller_states
+from .telemetry import Telemetry, TelemetryEncoder, TelemetryDecoder, TelemetrySender, is_telemetry
+from .udp import Datagram
+
+_TELEMETRY = Telemetry(
+    speed=13.37,
+    x=-120.5,
+    y=33.25,
+    z=0.5,
+    pitch=1.5,
+    yaw=-179.99,
+    roll=0.0,
+    throttle=0.75,
+    brake=0.0,
+    steer=-0.33,
+    gear=3,
+    hand_brake=False,
+    reverse=True,
+    collisions=2,
+    lane_invasions=0,
+)
+
+
+class TelemetryEncodingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.encoder = TelemetryEncoder(keyframe_interval=4, epoch=1)
+        self.decoder = TelemetryDecoder()
+
+    def test_round_trip(self):
+        keyframe = self.encoder.encode(_TELEMETRY)
+        delta = self.encoder.encode(_TELEMETRY._replace(speed=14.0, x=-121.0))
+        unchanged = self.encoder.encode(_TELEMETRY)
+
+        self.assertTrue(is_telemetry(keyframe))
+        self.assertEqual(10 + 2 + 4, len(delta))  # header, speed and x only
+        self.assertEqual(10, len(unchanged))  # just the header
+
+        self.assertEqual(_TELEMETRY, self.decoder.decode(keyframe))
+        self.assertEqual(_TELEMETRY._replace(speed=14.0, x=-121.0), self.decoder.decode(delta))
+        self.assertEqual(_TELEMETRY, self.decoder.decode(unchanged))
+
+    def test_lost_datagrams(self):
+        keyframe = self.encoder.encode(_TELEMETRY)
+        self.encoder.encode(_TELEMETRY._replace(speed=1.0))  # lost
+        delta = self.encoder.encode(_TELEMETRY._replace(speed=2.0))
+        self.encoder.encode(_TELEMETRY._replace(speed=3.0))
+        next_keyframe = self.encoder.encode(_TELEMETRY._replace(speed=4.0))
+        next_delta = self.encoder.encode(_TELEMETRY._replace(speed=5.0))
+
+        self.assertIsNone(self.decoder.decode(delta))  # its keyframe hasn't arrived
+        self.assertEqual(4.0, self.decoder.decode(next_keyframe).speed)
+        self.assertIsNone(self.decoder.decode(keyframe))  # older than what we've seen
+        self.assertEqual(5.0, self.decoder.decode(next_delta).speed)
+        self.assertIsNone(self.decoder.decode(next_delta))  # duplicate
+
+    def test_sender_restarted(self):
+        stragglers = [self.encoder.encode(_TELEMETRY) for _ in range(0, 1000)]  # the last two are a keyframe and a delta
+        for data in stragglers:
+            self.decoder.decode(data)
+
+        encoder = TelemetryEncoder(keyframe_interval=4, epoch=2)  # back to sequence 1, well within what looks like reordering
+        telemetries = [self.decoder.decode(encoder.encode(_TELEMETRY._replace(speed=float(i)))) for i in range(0, 45)]
+
+        self.assertEqual([float(i) for i in range(0, 45)], [x.speed for x in telemetries])
+
+        self.assertIsNone(self.decoder.decode(stragglers[-1]))  # from the old stream, arriving late
+        self.assertIsNone(self.decoder.decode(stragglers[-4]))  # not even a keyframe takes us back to it
+        self.assertEqual(45.0, self.decoder.decode(encoder.encode(_TELEMETRY._replace(speed=45.0))).speed)
+
+    def test_rejects_invalid_data(self):
+        data = self.encoder.encode(_TELEMETRY)
+
+        for invalid_data in [data[:-1], data + b'\x00', serialize_controller_states([ControllerState(0, 0, 0, False, False, False)], 1)]:
+            with self.assertRaises(ValueError):
+                TelemetryDecoder().decode(invalid_data)
+
+    def test_is_telemetry(self):
+        self.assertFalse(is_telemetry(b'RIFF\x00\x00\x00\x00WEBPVP8 '))
+        self.assertFalse(is_telemetry(b'\xff\xd8\xff\xe0\x00\x10JFIF'))
+
+
+class TelemetrySenderTest(unittest.TestCase):
+    def test_lifecycle(self):
+        client = Mock()
+        world = client.get_world.return_value
+        vehicle = world.get_actor.return_value
+        vehicle.get_velocity.return_value = Mock(x=3.0, y=4.0, z=0.0)
+        vehicle.get_transform.return_value = Mock(location=Mock(x=1.0, y=2.0, z=3.0), rotation=Mock(pitch=0.0, yaw=90.0, roll=0.0))
+        vehicle.get_control.return_value = Mock(throttle=1.0, brake=0.0, steer=0.0, gear=1, hand_brake=False, reverse=False)
+        sender = Mock()
+
+        subject = TelemetrySender(client, 2, sender, '127.0.0.1', 13338, rate=0.05)
+        subject.start()
+        time.sleep(0.22)
+
+        collision_callback = world.spawn_actor.return_value.listen.call_args_list[0][0][0]
+        collision_callback(Mock())
+        time.sleep(0.1)
+
+        subject.stop()
+
+        self.assertEqual(2, world.spawn_actor.call_count)  # collision and lane invasion sensors
+        self.assertEqual(2, world.spawn_actor.return_value.destroy.call_count)
+
+        decoder = TelemetryDecoder()
+        telemetries = [decoder.decode(x[1]['data']) for x in sender.send_datagram.call_args_list]
+
+        self.assertGreaterEqual(len(telemetries), 5)
+        self.assertEqual(5.0, telemetries[0].speed)
+        self.assertEqual(90.0, telemetries[0].yaw)
+        self.assertEqual(0, telemetries[0].collisions)
+        self.assertEqual(1, telemetries[-1].collisions)
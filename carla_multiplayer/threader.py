@@ -1,11 +1,25 @@
+from queue import Queue, Full
 from threading import Event, Thread
 from typing import List
 
+from .instrumentation import InstrumentedMixIn
 
-class Threader(object):
+
+WAKEUP = object()  # put on a queue to wake a thread blocked getting from it; consumers should throw it away
+
+
+def wake_queue(queue: Queue):
+    try:
+        queue.put_nowait(WAKEUP)
+    except Full:  # anything blocked on get() has plenty to be getting on with
+        pass
+
+
+class Threader(InstrumentedMixIn):
     def __init__(self):
         self._stop_event = Event()
         self._threads: List[Thread] = []
+        self._started: bool = False  # rather than len(self._threads) > 0, as a Threader may have no threads of its own
 
     def _create_threads(self):
         raise NotImplementedError('_create_threads needs to be implemented')
@@ -16,24 +30,46 @@ class Threader(object):
     def _after_stop(self):
         raise NotImplementedError('_before_start needs to be implemented')
 
+    def _instrument_thread(self, thread: Thread) -> Thread:
+        target = getattr(thread, '_target', None)  # name the thread after what it runs, e.g. Receiver._fill_datagram_queue_from_socket
+
+        return Thread(
+            target=self._get_thread_target(
+                '{}.{}'.format(type(self).__name__, getattr(target, '__name__', thread.name)),
+                thread.run
+            ),
+            daemon=thread.daemon
+        )
+
+    def _wake(self):  # unblock threads waiting on something other than _stop_event so stop() needn't wait out timeouts
+        pass
+
     def start(self):
         self._stop_event.clear()
 
-        if len(self._threads) == 0:
+        if not self._started:
             self._create_threads()
 
-            self._before_start()
+            if self._instrumentation is not None:
+                self._threads = [self._instrument_thread(x) for x in self._threads]
+
+            self._run_phase('before_start', self._before_start)
 
             for thread in self._threads:
                 thread.start()
 
+            self._started = True
+
     def stop(self):
         self._stop_event.set()
+        self._wake()
+
+        if self._started:
+            self._started = False
 
-        if len(self._threads) > 0:
             for thread in self._threads:
                 thread.join()
 
             self._threads.clear()
 
-            self._after_stop()
+            self._run_phase('after_stop', self._after_stop)
@@ -56,3 +56,24 @@ class ThreaderTest(unittest.TestCase):
             self.assertEqual(1, len(mock.before_start.mock_calls))
             self.assertGreaterEqual(len(mock.work.mock_calls), 1)
             self.assertEqual(1, len(mock.after_stop.mock_calls))
+
+
+class InstrumentedThreaderTest(unittest.TestCase):
+    def test_cpu_time(self):
+        subject = ThreaderImplementation()
+        subject.enable_instrumentation()
+
+        subject.start()
+        time.sleep(0.2)
+
+        self.assertEqual(
+            ['ThreaderImplementation._work_1', 'ThreaderImplementation._work_2'],
+            sorted(subject.get_instrumentation().cpu_time.keys())
+        )
+
+        subject.stop()
+
+        snapshot = subject.get_instrumentation()
+        self.assertEqual(2, len(snapshot.cpu_time))
+        self.assertEqual(1, snapshot.phases['before_start'].count)
+        self.assertEqual(1, snapshot.phases['after_stop'].count)
@@ -1,12 +1,22 @@
+import ipaddress
+import random
 import socket
+import struct
 import traceback
 from queue import Queue, Full, Empty
-from threading import Thread
-from typing import Optional, NamedTuple, Tuple, Callable
+from threading import Lock, Thread
+from typing import Optional, NamedTuple, Tuple, Callable, Dict, List
 
-from .threader import Threader
+from .metrics import get_default_registry
+from .threader import Threader, WAKEUP, wake_queue
 
 _MAX_UDP_DATAGRAM = 65507  # https://en.wikipedia.org/wiki/User_Datagram_Protocol#UDP_datagram_structure
+_WAKEUP_HOST = '127.0.0.1'
+_MULTICAST_TTL = 1  # stay on the LAN
+# group, epoch, sequence; a group's first byte is 224 - 239, unlike anything else we send
+_MULTICAST_HEADER_STRUCT = struct.Struct('!4sII')
+_SEQUENCE_MODULO = 1 << 32
+_EPOCH_BITS = 32  # picked at random by each Sender, so a restarted sender is recognised whatever its sequence
 
 
 class Datagram(NamedTuple):
@@ -14,6 +24,54 @@ class Datagram(NamedTuple):
     address: Tuple[str, int]
 
 
+class MulticastStats(NamedTuple):
+    received: int
+    lost: int  # gaps in the sequence
+    late: int  # arrived after a newer one; thrown away
+    restarts: int  # the sender's sequence started again
+
+
+def is_multicast(host: str) -> bool:
+    try:
+        return ipaddress.IPv4Address(host).is_multicast
+    except ValueError:  # a hostname or IPv6; we only do IPv4 groups
+        return False
+
+
+class _MulticastStream(object):
+    def __init__(self):
+        self.epoch: Optional[int] = None
+        self.previous_epoch: Optional[int] = None
+        self.sequence: Optional[int] = None
+        self.received: int = 0
+        self.lost: int = 0
+        self.late: int = 0
+        self.restarts: int = 0
+
+    def accept(self, epoch: int, sequence: int) -> bool:
+        self.received += 1
+
+        if self.epoch is None:
+            self.epoch = epoch
+        elif epoch == self.previous_epoch:  # still in flight from before the sender restarted
+            self.late += 1
+            return False
+        elif epoch != self.epoch:
+            self.restarts += 1
+            self.previous_epoch, self.epoch = self.epoch, epoch
+        else:
+            delta = (sequence - self.sequence) % _SEQUENCE_MODULO
+            if delta == 0 or delta >= _SEQUENCE_MODULO // 2:
+                self.late += 1
+                return False
+
+            self.lost += delta - 1
+
+        self.sequence = sequence
+
+        return True
+
+
 class _SocketMixIn(object):
     _socket: Optional[socket.socket]
     _port: int
@@ -37,7 +95,12 @@ class _SocketMixIn(object):
 
 
 class Receiver(_SocketMixIn, Threader):
-    def __init__(self, port: int, queue_size: int, callback: Optional[Callable] = None, use_socket_from: Optional[_SocketMixIn] = None):
+    def __init__(self,
+            port: int,
+            queue_size: int,
+            callback: Optional[Callable] = None,
+            use_socket_from: Optional[_SocketMixIn] = None,
+            multicast_groups: Optional[List[str]] = None):
         super().__init__()
 
         self._port: int = port
@@ -48,6 +111,26 @@ class Receiver(_SocketMixIn, Threader):
         self._socket: Optional[socket.socket] = None
         self._datagrams: Queue = Queue(maxsize=self._queue_size)
 
+        # groups to join; their datagrams carry a header (see Sender) that is checked for loss and stripped
+        self._multicast_groups: Dict[bytes, str] = {socket.inet_aton(x): x for x in multicast_groups or []}
+        self._multicast_lock: Lock = Lock()
+        self._multicast_streams: Dict[str, _MulticastStream] = {}
+
+        registry = get_default_registry()
+        self._received_datagrams = registry.counter(
+            'udp_received_datagrams_total', 'Datagrams received', ['port']
+        ).labels(self._port)
+        self._received_bytes = registry.counter('udp_received_bytes_total', 'Bytes received', ['port']).labels(self._port)
+        self._receive_queue_drops = registry.counter(
+            'udp_receive_queue_dropped_datagrams_total', 'Received datagrams thrown away (oldest first) from a full queue', ['port']
+        ).labels(self._port)
+        self._receive_errors = registry.counter(
+            'udp_receive_errors_total', 'Errors receiving from the socket', ['port']
+        ).labels(self._port)
+        self._callback_errors = registry.counter(
+            'udp_callback_errors_total', 'Exceptions raised by the callback handling a datagram', ['port']
+        ).labels(self._port)
+
         if callback is not None:
             self.set_callback(callback)
 
@@ -64,6 +147,33 @@ class Receiver(_SocketMixIn, Threader):
 
         self._callback = callback
 
+    def get_multicast_stats(self) -> Dict[str, MulticastStats]:
+        with self._multicast_lock:
+            return {
+                group: MulticastStats(x.received, x.lost, x.late, x.restarts) for group, x in self._multicast_streams.items()
+            }
+
+    def _unwrap_multicast(self, data: bytes) -> Optional[bytes]:
+        if len(data) < _MULTICAST_HEADER_STRUCT.size:
+            return data
+
+        group = self._multicast_groups.get(data[:4])
+        if group is None:  # an ordinary unicast datagram
+            return data
+
+        _, epoch, sequence = _MULTICAST_HEADER_STRUCT.unpack_from(data)
+
+        with self._multicast_lock:
+            stream = self._multicast_streams.get(group)
+            if stream is None:
+                stream = _MulticastStream()
+                self._multicast_streams[group] = stream
+
+            if not stream.accept(epoch, sequence):
+                return None
+
+        return data[_MULTICAST_HEADER_STRUCT.size:]
+
     def _fill_datagram_queue_from_socket(self):
         while not self._stop_event.is_set():
             try:
@@ -72,6 +182,7 @@ class Receiver(_SocketMixIn, Threader):
             except socket.timeout:
                 continue
             except Exception as e:
+                self._receive_errors.inc()
                 print('attempt to receive from {} in {} raised {}; traceback follows'.format(
                     repr(self._socket),
                     repr(self),
@@ -80,6 +191,17 @@ class Receiver(_SocketMixIn, Threader):
                 traceback.print_exc()
                 continue
 
+            if len(data) == 0:  # probably our own wakeup (see _wake); nothing to do with an empty datagram anyway
+                continue
+
+            self._received_datagrams.inc()
+            self._received_bytes.inc(len(data))
+
+            if len(self._multicast_groups) > 0:
+                data = self._unwrap_multicast(data)
+                if data is None:
+                    continue
+
             datagram = Datagram(
                 data=data,
                 address=address
@@ -92,6 +214,7 @@ class Receiver(_SocketMixIn, Threader):
                 except Full:  # attempt to remove the oldest datagram
                     try:
                         self._datagrams.get_nowait()
+                        self._receive_queue_drops.inc()
                     except Empty:
                         pass
 
@@ -102,13 +225,17 @@ class Receiver(_SocketMixIn, Threader):
             except Empty:
                 continue
 
+            if datagram is WAKEUP:
+                continue
+
             if self._callback is None:
                 print('warning: received datagram but callback is None; throwing away')
                 continue
 
             try:
-                self._callback(datagram)
+                self._run_phase('callback', lambda: self._callback(datagram))
             except Exception as e:
+                self._callback_errors.inc()
                 print('attempt to call {} in {} raised {}; traceback follows'.format(
                     repr(self._callback),
                     repr(self),
@@ -117,6 +244,36 @@ class Receiver(_SocketMixIn, Threader):
                 traceback.print_exc()
                 continue
 
+    def _wake(self):
+        wake_queue(self._datagrams)
+
+        if self._socket is None:
+            return
+
+        try:  # an empty datagram to ourselves gets recvfrom() to return now rather than at the socket timeout
+            self._socket.sendto(b'', (_WAKEUP_HOST, self._socket.getsockname()[1]))
+        except OSError:
+            pass
+
+    def _before_start(self):
+        super()._before_start()
+
+        for packed_group in self._multicast_groups.keys():
+            self._socket.setsockopt(
+                socket.IPPROTO_IP,
+                socket.IP_ADD_MEMBERSHIP,
+                packed_group + socket.inet_aton('0.0.0.0')  # on the default interface
+            )
+
+    def _after_stop(self):
+        for packed_group in self._multicast_groups.keys():
+            try:
+                self._socket.setsockopt(socket.IPPROTO_IP, socket.IP_DROP_MEMBERSHIP, packed_group + socket.inet_aton('0.0.0.0'))
+            except OSError:
+                pass
+
+        super()._after_stop()
+
     def _create_threads(self):
         self._threads = [
             Thread(target=self._drain_datagram_queue_to_callbacks),
@@ -135,10 +292,38 @@ class Sender(_SocketMixIn, Threader):
         self._socket: Optional[socket.socket] = None
         self._datagrams: Queue = Queue(maxsize=self._queue_size)
 
+        # datagrams to a multicast group get a per-group sequence so that receivers can tell what they missed
+        self._multicast_lock: Lock = Lock()
+        self._multicast_groups_by_host: Dict[str, Optional[bytes]] = {}
+        self._multicast_sequences: Dict[bytes, int] = {}
+        self._multicast_epoch: int = random.getrandbits(_EPOCH_BITS)
+
+        registry = get_default_registry()
+        self._sent_datagrams = registry.counter('udp_sent_datagrams_total', 'Datagrams sent', ['port']).labels(self._port)
+        self._sent_bytes = registry.counter('udp_sent_bytes_total', 'Bytes sent', ['port']).labels(self._port)
+        self._send_queue_full = registry.counter(
+            'udp_send_queue_full_total', 'Datagrams refused (and usually thrown away by the caller) by a full queue', ['port']
+        ).labels(self._port)
+        self._send_errors = registry.counter('udp_send_errors_total', 'Errors sending to the socket', ['port']).labels(self._port)
+
     @property
     def socket(self):
         return self._socket
 
+    def _get_multicast_group(self, host: str) -> Optional[bytes]:
+        packed_group = self._multicast_groups_by_host.get(host, False)
+        if packed_group is False:
+            packed_group = socket.inet_aton(host) if is_multicast(host) else None
+            self._multicast_groups_by_host[host] = packed_group
+
+        return packed_group
+
+    def _wrap_multicast(self, data: bytes, packed_group: bytes) -> bytes:
+        sequence = (self._multicast_sequences.get(packed_group, 0) + 1) % _SEQUENCE_MODULO
+        self._multicast_sequences[packed_group] = sequence
+
+        return _MULTICAST_HEADER_STRUCT.pack(packed_group, self._multicast_epoch, sequence) + data
+
     def _drain_datagram_queue_to_socket(self):
         while not self._stop_event.is_set():
             try:
@@ -146,11 +331,16 @@ class Sender(_SocketMixIn, Threader):
             except Empty:
                 continue
 
+            if datagram is WAKEUP:
+                continue
+
             try:
-                self._socket.sendto(datagram.data, datagram.address)
-            except socket.error:
+                self._run_phase('sendto', lambda: self._socket.sendto(datagram.data, datagram.address))
+            except socket.error:  # e.g. unreachable; nothing worth printing for every datagram
+                self._send_errors.inc()
                 continue
             except Exception as e:
+                self._send_errors.inc()
                 print('attempt to send {} bytes to {} in {} raised {}; traceback follows'.format(
                     len(datagram.data),
                     repr(datagram.address),
@@ -160,15 +350,36 @@ class Sender(_SocketMixIn, Threader):
                 traceback.print_exc()
                 continue
 
+            self._sent_datagrams.inc()
+            self._sent_bytes.inc(len(datagram.data))
+
+    def _wake(self):
+        wake_queue(self._datagrams)
+
+    def _before_start(self):
+        super()._before_start()
+
+        self._socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, _MULTICAST_TTL)
+        self._socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)  # so screens on this host see it too
+
     def _create_threads(self):
         self._threads = [
             Thread(target=self._drain_datagram_queue_to_socket),
         ]
 
     def send_datagram(self, data, address):
-        self._datagrams.put_nowait(
-            Datagram(
-                data=data,
-                address=address
+        with self._multicast_lock:
+            packed_group = self._get_multicast_group(address[0])
+            if packed_group is not None:
+                data = self._wrap_multicast(data, packed_group)
+
+        try:
+            self._datagrams.put_nowait(
+                Datagram(
+                    data=data,
+                    address=address
+                )
             )
-        )
+        except Full:
+            self._send_queue_full.inc()
+            raise
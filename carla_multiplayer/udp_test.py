@@ -1,8 +1,9 @@
+import socket
 import time
 import unittest
 from typing import List
 
-from .udp import Datagram, Receiver, Sender
+from .udp import Datagram, MulticastStats, Receiver, Sender, is_multicast
 
 
 class ReceiverAndSenderBase(unittest.TestCase):
@@ -94,3 +95,75 @@ class ReceiverAndSenderSharedSocketTest(ReceiverAndSenderBase):
             Datagram(data=b'Message 16 of 16', address=('127.0.0.1', 20000))],
             self._datagrams
         )
+
+
+class ReceiverAndSenderStopTest(ReceiverAndSenderBase):
+    def setUp(self):
+        self._datagrams: List[Datagram] = []
+
+        self.receiver = Receiver(20021, 8, self._receiver_callback)
+        self.sender = Sender(20020, 8, use_socket_from=self.receiver)
+
+    def test_stop_is_fast(self):
+        self.receiver.start()
+        self.sender.start()
+        time.sleep(0.1)
+
+        started = time.perf_counter()
+        self.sender.stop()
+        self.receiver.stop()
+
+        self.assertLess(time.perf_counter() - started, 0.5)  # rather than the 1 s socket / queue timeouts
+        self.assertEqual([], self._datagrams)  # the wakeup datagram isn't passed on
+
+
+class MulticastTest(unittest.TestCase):
+    def test_is_multicast(self):
+        self.assertTrue(is_multicast('239.255.0.1'))
+        self.assertFalse(is_multicast('127.0.0.1'))
+        self.assertFalse(is_multicast('localhost'))
+
+    def test_framing_and_loss(self):
+        sender = Sender(0, 16)
+        for i in range(0, 5):
+            sender.send_datagram('frame {}'.format(i).encode('utf-8'), ('239.255.0.1', 20040))
+        sender.send_datagram(b'unicast', ('127.0.0.1', 20040))
+
+        datagrams = [sender._datagrams.get_nowait() for _ in range(0, 6)]
+
+        self.assertEqual(b'unicast', datagrams[-1].data)  # untouched
+
+        receiver = Receiver(0, 16, multicast_groups=['239.255.0.1'])
+
+        received = [receiver._unwrap_multicast(datagrams[i].data) for i in [0, 2, 1, 4, 4]]  # lost, late, lost, duplicate
+        received += [receiver._unwrap_multicast(datagrams[-1].data)]
+
+        self.assertEqual([b'frame 0', b'frame 2', None, b'frame 4', None, b'unicast'], received)
+        self.assertEqual({'239.255.0.1': MulticastStats(received=5, lost=2, late=2, restarts=0)}, receiver.get_multicast_stats())
+
+        restarted = Sender(0, 16)
+        restarted.send_datagram(b'again', ('239.255.0.1', 20040))
+        sender._multicast_sequences[socket.inet_aton('239.255.0.1')] = 100000
+        sender.send_datagram(b'later', ('239.255.0.1', 20040))
+
+        self.assertEqual(b'later', receiver._unwrap_multicast(sender._datagrams.get_nowait().data))
+        self.assertEqual(b'again', receiver._unwrap_multicast(restarted._datagrams.get_nowait().data))
+        self.assertEqual(1, receiver.get_multicast_stats()['239.255.0.1'].restarts)
+
+    def test_restart_from_a_small_sequence(self):
+        receiver = Receiver(0, 16, multicast_groups=['239.255.0.1'])
+
+        sender = Sender(0, 16)
+        sender._multicast_sequences[socket.inet_aton('239.255.0.1')] = 39999
+        sender.send_datagram(b'before', ('239.255.0.1', 20040))
+        sender.send_datagram(b'straggler', ('239.255.0.1', 20040))
+
+        restarted = Sender(0, 16)
+        restarted._multicast_epoch = sender._multicast_epoch + 1
+        restarted.send_datagram(b'again', ('239.255.0.1', 20040))
+        restarted.send_datagram(b'and again', ('239.255.0.1', 20040))
+
+        received = [receiver._unwrap_multicast(x._datagrams.get_nowait().data) for x in [sender, restarted, sender, restarted]]
+
+        self.assertEqual([b'before', b'again', None, b'and again'], received)
+        self.assertEqual({'239.255.0.1': MulticastStats(received=4, lost=0, late=1, restarts=1)}, receiver.get_multicast_stats())
@@ -1,10 +1,12 @@
 import datetime
-from typing import Optional
+from threading import Condition, Event, Lock
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
-import Pyro4
-
-from .controller import ControllerState, deserialize_controller_state
+from .controller import ControllerState, SequenceNumber, deserialize_controller_states, filter_unseen_controller_states
 from .looper import TimedLooper
+from .metrics import get_default_registry
+from .rpc import wait_for_tick_if_changed
+from .stats import Histogram, HistogramSnapshot
 from .udp import Receiver, Datagram
 
 try:  # cater for python3 -m (module) vs python3 (file)
@@ -12,9 +14,6 @@ try:  # cater for python3 -m (module) vs python3 (file)
 except ImportError:
     import wrapped_carla as carla
 
-Pyro4.config.SERIALIZER = 'pickle'
-Pyro4.config.SERIALIZERS_ACCEPTED = ['pickle']
-
 _CONTROL_RATE = 1.0 / 10.0  # 10 Hz
 _CONTROL_EXPIRE = 1.0  # 1 s
 _RESET_RATE = 1.0 / 1.0  # 1 Hz
@@ -23,6 +22,38 @@ _CARLA_TIMEOUT = 2.0
 _QUEUE_SIZE = 2
 
 _SAFE_CONTROL = carla.VehicleControl(throttle=0.0, brake=1.0, hand_brake=True)
+_SAFE_CONTROL_KEY = (0.0, 1.0, 0.0, True, False)  # throttle, brake, steer, hand_brake, reverse
+
+# phases of control loss, in order
+_LIVE = 'live'
+_DECAYING = 'decaying'
+_BRAKING = 'braking'
+_STOPPED = 'stopped'
+
+
+class DegradationCurve(NamedTuple):
+    hold: float  # seconds the last control is held as-is after controller states stop arriving
+    decay: float  # seconds over which throttle and steer then decay to neutral
+    brake: float  # seconds over which the brake then ramps to full (after which _SAFE_CONTROL is applied)
+
+
+def get_degradation_curve(control_expire: float) -> DegradationCurve:
+    return DegradationCurve(
+        hold=control_expire * 0.5,
+        decay=control_expire * 0.25,
+        brake=control_expire * 0.25,
+    )
+
+
+class VehicleStats(NamedTuple):
+    receive_to_apply_latency: HistogramSnapshot
+    applied: int  # controller states applied
+    coalesced: int  # controller states replaced by a newer one before they were applied
+    suppressed: int  # controls not sent to Carla because they were the same as the last one
+    decaying: int  # times control loss went past the hold period
+    braking: int  # times control loss went past the decay period
+    stopped: int  # times control loss went past the brake period
+    recovered: int  # times controller states arrived again after control loss went past the hold period
 
 
 def create_vehicle(
@@ -30,7 +61,7 @@ def create_vehicle(
         vehicle_blueprint_name: str,
         transform: carla.Transform) -> carla.Actor:
     world = client.get_world()
-    world.wait_for_tick()
+    wait_for_tick_if_changed(world)
 
     blueprint_library = world.get_blueprint_library()
     vehicle_blueprint = blueprint_library.find(vehicle_blueprint_name)
@@ -38,17 +69,17 @@ def create_vehicle(
         vehicle_blueprint,
         transform,
     )
-    world.wait_for_tick()
+    wait_for_tick_if_changed(world)
 
     return vehicle
 
 
 def get_vehicle(client: carla.Client, actor_id: int) -> carla.Actor:
     world = client.get_world()
-    world.wait_for_tick()
+    wait_for_tick_if_changed(world)
 
     vehicle = world.get_actor(actor_id)
-    world.wait_for_tick()
+    wait_for_tick_if_changed(world)
 
     if vehicle is None:
         raise ValueError('failed to get vehicle for actor_id {}; valid options right now are {}'.format(
@@ -61,7 +92,7 @@ def get_vehicle(client: carla.Client, actor_id: int) -> carla.Actor:
 
 def delete_vehicle(client: carla.Client, actor_id: int):
     get_vehicle(client, actor_id).destroy()
-    client.get_world().wait_for_tick()
+    wait_for_tick_if_changed(client.get_world())
 
 
 class Vehicle(TimedLooper):
@@ -71,9 +102,11 @@ class Vehicle(TimedLooper):
             actor_id: int,
             control_rate: float = _CONTROL_RATE,
             control_expire: float = _CONTROL_EXPIRE,
-            reset_rate: float = _RESET_RATE):
-        super().__init__(
-            period=control_rate
+            reset_rate: float = _RESET_RATE,
+            apply_on_receive: bool = False,
+            degradation_curve: Optional[DegradationCurve] = None):
+        super().__init__(  # when applying on receive, _work blocks on arrivals itself
+            period=0.0 if apply_on_receive else control_rate
         )
 
         self._receiver: Receiver = receiver
@@ -82,59 +115,341 @@ class Vehicle(TimedLooper):
         self._control_rate: float = control_rate
         self._control_expire: float = control_expire
         self._reset_rate: float = reset_rate
+        self._apply_on_receive: bool = apply_on_receive
+        self._degradation_curve: DegradationCurve = degradation_curve if degradation_curve is not None else get_degradation_curve(
+            self._control_expire
+        )
 
-        self._control_expire_delta = datetime.timedelta(seconds=self._control_expire)
         self._last_controller_state_received: Optional[datetime.datetime] = None
         self._controller_state: Optional[ControllerState] = None
+        self._last_sequence: Optional[SequenceNumber] = None
+        self._reset_pending: bool = False
         self._reset_rate_delta = datetime.timedelta(seconds=self._reset_rate)
         self._last_reset: Optional[datetime.datetime] = None
 
         self._vehicle: Optional[carla.Actor] = None
 
-    def _before_loop(self):
+        self._controller_state_received: Event = Event()
+        self._last_new_controller_state_received: Optional[datetime.datetime] = None
+        self._controller_state_applied: bool = True
+        self._receive_to_apply_latency: Histogram = Histogram()
+        self._applied: int = 0
+        self._coalesced: int = 0
+
+        self._phase: str = _LIVE
+        self._last_control_key: Optional[Tuple[float, float, float, bool, bool]] = None
+        self._suppressed: int = 0
+        self._phase_counts: Dict[str, int] = {_DECAYING: 0, _BRAKING: 0, _STOPPED: 0}
+        self._recovered: int = 0
+
+        self._world: Optional[carla.World] = None
+        self._on_tick_id: Optional[int] = None
+        self._frame_condition: Condition = Condition()
+        self._frame: Optional[int] = None
+        self._last_applied_frame: Optional[int] = None
+
+        registry = get_default_registry()
+        self._received_metric = registry.counter(
+            'vehicle_controller_states_received_total', 'Controller states received that hadn\'t been seen before'
+        ).labels()
+        self._keepalives_metric = registry.counter(
+            'vehicle_controller_keepalives_total', 'Controller datagrams with nothing new in them (keepalives and duplicates)'
+        ).labels()
+        self._invalid_metric = registry.counter(
+            'vehicle_controller_datagrams_invalid_total', 'Controller datagrams that could not be deserialized'
+        ).labels()
+        self._stale_metric = registry.counter(
+            'vehicle_controller_datagrams_stale_total', 'Controller datagrams behind the newest one seen (reordered)'
+        ).labels()
+        self._coalesced_metric = registry.counter(
+            'vehicle_controller_states_coalesced_total', 'Controller states replaced by a newer one before they were applied'
+        ).labels()
+        self._applied_metric = registry.counter('vehicle_controller_states_applied_total', 'Controller states applied').labels()
+        self._suppressed_metric = registry.counter(
+            'vehicle_controls_suppressed_total', 'Controls not sent to Carla as they were the same as the last one'
+        ).labels()
+        self._receive_to_apply_metric = registry.histogram(
+            'vehicle_receive_to_apply_seconds', 'Time from a controller state arriving to it being applied'
+        ).labels()
+        control_loss_metric = registry.counter('vehicle_control_loss_total', 'Times control loss entered each phase', ['phase'])
+        self._control_loss_metrics = {x: control_loss_metric.labels(x) for x in self._phase_counts.keys()}
+
+    def prepare(self):
         self._vehicle = get_vehicle(self._client, self._actor_id)
 
-    def _work(self):
-        now = datetime.datetime.now()
+    def _get_phase_and_control_key(self, age: float) -> Tuple[str, Tuple[float, float, float, bool, bool]]:
+        curve = self._degradation_curve
+        controller_state = self._controller_state
+
+        if age <= curve.hold:
+            return _LIVE, (
+                controller_state.throttle,
+                controller_state.brake,
+                controller_state.steer,
+                controller_state.hand_brake,
+                controller_state.reverse
+            )
 
-        if self._last_controller_state_received is not None:
-            if now - self._last_controller_state_received > self._control_expire_delta:
-                self._vehicle.apply_control(_SAFE_CONTROL)
-                return
+        age -= curve.hold
+        if curve.decay > 0 and age <= curve.decay:  # throttle and steer decay linearly to neutral
+            remaining = 1.0 - (age / curve.decay)
+
+            return _DECAYING, (
+                round(controller_state.throttle * remaining, 2),
+                controller_state.brake,
+                round(controller_state.steer * remaining, 2),
+                controller_state.hand_brake,
+                controller_state.reverse
+            )
+
+        age -= curve.decay
+        if curve.brake > 0 and age <= curve.brake:  # brake ramps linearly to full
+            progress = age / curve.brake
+
+            return _BRAKING, (
+                0.0,
+                round(controller_state.brake + ((1.0 - controller_state.brake) * progress), 2),
+                0.0,
+                False,
+                controller_state.reverse
+            )
 
+        return _STOPPED, _SAFE_CONTROL_KEY
+
+    def _get_control_and_transform(self, now: datetime.datetime) -> Tuple[Optional[carla.VehicleControl], Optional[carla.Transform]]:
         if self._controller_state is None:
-            return
+            return None, None
+
+        phase, control_key = self._get_phase_and_control_key((now - self._last_controller_state_received).total_seconds())
 
-        if self._controller_state.reset:
+        if phase != self._phase:
+            if phase == _LIVE:
+                self._recovered += 1
+            else:
+                self._phase_counts[phase] += 1
+                self._control_loss_metrics[phase].inc()
+
+            self._phase = phase
+
+        transform = None
+        if phase == _LIVE and (self._controller_state.reset or self._reset_pending):
             if self._last_reset is None or now - self._last_reset > self._reset_rate_delta:
+                self._reset_pending = False
                 transform = self._vehicle.get_transform()
                 transform.location.z += 5
                 transform.rotation.roll = 0
                 transform.rotation.pitch = 0
-                self._vehicle.set_transform(transform)
                 self._last_reset = now
+                self._last_control_key = None  # always follow a reset with a control
+
+        if not self._controller_state_applied:
+            self._controller_state_applied = True
+            self._applied += 1
+            self._applied_metric.inc()
+            receive_to_apply = (now - self._last_new_controller_state_received).total_seconds()
+            self._receive_to_apply_latency.observe(receive_to_apply)
+            self._receive_to_apply_metric.observe(receive_to_apply)
+
+        if control_key == self._last_control_key:  # Carla holds the last control; no need to send it again
+            self._suppressed += 1
+            self._suppressed_metric.inc()
+            return None, transform
+
+        self._last_control_key = control_key
+
+        if phase == _STOPPED:
+            return _SAFE_CONTROL, transform
+
+        throttle, brake, steer, hand_brake, reverse = control_key
+
+        control = carla.VehicleControl(
+            throttle=throttle,
+            brake=brake,
+            steer=steer,
+            hand_brake=hand_brake,
+            reverse=reverse
+        )
 
-        self._vehicle.apply_control(
-            carla.VehicleControl(
-                throttle=self._controller_state.throttle,
-                brake=self._controller_state.brake,
-                steer=self._controller_state.steer,
-                hand_brake=self._controller_state.hand_brake,
-                reverse=self._controller_state.reverse
-            )
+        return control, transform
+
+    def get_commands(self, now: datetime.datetime) -> List:
+        control, transform = self._get_control_and_transform(now)
+
+        commands = []
+
+        if transform is not None:
+            commands += [carla.command.ApplyTransform(self._actor_id, transform)]
+
+        if control is not None:
+            commands += [carla.command.ApplyVehicleControl(self._actor_id, control)]
+
+        return commands
+
+    def get_stats(self) -> VehicleStats:
+        return VehicleStats(
+            receive_to_apply_latency=self._receive_to_apply_latency.snapshot(),
+            applied=self._applied,
+            coalesced=self._coalesced,
+            suppressed=self._suppressed,
+            decaying=self._phase_counts[_DECAYING],
+            braking=self._phase_counts[_BRAKING],
+            stopped=self._phase_counts[_STOPPED],
+            recovered=self._recovered,
         )
 
+    def _handle_world_snapshot(self, world_snapshot: carla.WorldSnapshot):
+        with self._frame_condition:
+            self._frame = world_snapshot.frame
+            self._frame_condition.notify_all()
+
+    def _wait_for_next_frame(self):
+        with self._frame_condition:
+            if self._frame is None or self._frame != self._last_applied_frame:
+                return
+
+            # we've already applied a control this simulator tick; anything else that arrives before the next tick
+            # replaces it rather than costing another RPC
+            self._frame_condition.wait_for(
+                lambda: self._frame != self._last_applied_frame or self._stop_event.is_set(),
+                timeout=self._control_rate
+            )
+
+    def _before_loop(self):
+        self.prepare()
+
+        if self._apply_on_receive:
+            self._world = self._client.get_world()
+            self._on_tick_id = self._world.on_tick(self._handle_world_snapshot)
+
+    def _before_work(self):
+        if not self._apply_on_receive:
+            return
+
+        # wake on a new controller state, or after control_rate to handle expiry like the periodic mode does
+        if self._controller_state_received.wait(timeout=self._control_rate):
+            self._controller_state_received.clear()
+            self._wait_for_next_frame()
+
+    def apply(self):
+        control, transform = self._get_control_and_transform(datetime.datetime.now())
+
+        if transform is not None:
+            self._vehicle.set_transform(transform)
+
+        if control is not None:
+            self._vehicle.apply_control(control)
+
+        with self._frame_condition:
+            self._last_applied_frame = self._frame
+
+    def _work(self):
+        self.apply()
+
+    def _after_loop(self):
+        if self._world is not None and self._on_tick_id is not None:
+            self._world.remove_on_tick(self._on_tick_id)
+
+        self._world = None
+        self._on_tick_id = None
+
+    def _wake(self):
+        # wake _before_work / _wait_for_next_frame rather than waiting out control_rate
+        self._controller_state_received.set()
+        with self._frame_condition:
+            self._frame_condition.notify_all()
+
     def _apply_control(self, controller_state: ControllerState):
         if controller_state is None:
             return
 
+        now = datetime.datetime.now()
+
+        if not self._controller_state_applied:
+            self._coalesced += 1
+            self._coalesced_metric.inc()
+
         self._controller_state = controller_state
-        self._last_controller_state_received = datetime.datetime.now()
+        self._controller_state_applied = False
+        self._last_controller_state_received = now
+        self._last_new_controller_state_received = now
+
+        if self._apply_on_receive:
+            self._controller_state_received.set()
+
+    @property
+    def actor_id(self) -> int:
+        return self._actor_id
 
     def recv(self, datagram: Datagram):
-        controller_state = deserialize_controller_state(datagram.data)
+        try:
+            sequence, controller_states = deserialize_controller_states(datagram.data)
+        except Exception:
+            self._invalid_metric.inc()
+            raise
+
+        self._last_sequence, controller_states, current = filter_unseen_controller_states(
+            self._last_sequence,
+            sequence,
+            controller_states
+        )
+        if not current:  # not evidence that the client is still there, so it mustn't hold off control loss either
+            self._stale_metric.inc()
+            return
+
+        if len(controller_states) == 0:  # keepalive (or duplicate); the newest state is still current
+            self._keepalives_metric.inc()
+            self._last_controller_state_received = datetime.datetime.now()
+            return
+
+        self._received_metric.inc(len(controller_states))
 
-        self._apply_control(controller_state)
+        # only the newest state is applied, but a reset press in a state we'd otherwise have missed shouldn't be lost
+        if not controller_states[-1].reset and any(x.reset for x in controller_states[:-1]):
+            self._reset_pending = True
+
+        self._apply_control(controller_states[-1])
+
+
+class VehicleManager(TimedLooper):
+    def __init__(self, client: carla.Client, control_rate: float = _CONTROL_RATE):
+        super().__init__(
+            period=control_rate
+        )
+
+        self._client: carla.Client = client
+        self._control_rate: float = control_rate
+
+        self._lock: Lock = Lock()
+        self._vehicles_by_actor_id: Dict[int, Vehicle] = {}
+
+    def add_vehicle(self, vehicle: Vehicle):
+        vehicle.prepare()
+
+        with self._lock:
+            self._vehicles_by_actor_id[vehicle.actor_id] = vehicle
+
+    def remove_vehicle(self, vehicle: Vehicle):
+        with self._lock:
+            self._vehicles_by_actor_id.pop(vehicle.actor_id, None)
+
+    def apply(self):
+        now = datetime.datetime.now()
+
+        with self._lock:
+            vehicles = list(self._vehicles_by_actor_id.values())
+
+        commands = []
+        for vehicle in vehicles:
+            commands += vehicle.get_commands(now)
+
+        if len(commands) == 0:
+            return
+
+        # one RPC for every vehicle instead of one per vehicle
+        self._client.apply_batch(commands)
+
+    def _work(self):
+        self.apply()
 
 
 if __name__ == '__main__':
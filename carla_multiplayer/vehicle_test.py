@@ -1,8 +1,12 @@
+import datetime
+import time
 import unittest
 
 from mock import Mock, call
 
-from .vehicle import create_vehicle, carla, get_vehicle, delete_vehicle
+from .controller import ControllerState, serialize_controller_states
+from .udp import Datagram
+from .vehicle import create_vehicle, carla, get_vehicle, delete_vehicle, Vehicle, VehicleManager, DegradationCurve, _SAFE_CONTROL
 
 _TRANSFORM = carla.Transform(
     carla.Location(-15, 0, 15),
@@ -75,5 +79,167 @@ class VehicleFunctionTest(unittest.TestCase):
         )
 
 
+_CONTROLLER_STATE = ControllerState(
+    throttle=0.75,
+    brake=0.0,
+    steer=-0.33,
+    hand_brake=False,
+    reverse=False,
+    reset=False,
+)
+
+
 class VehicleTest(unittest.TestCase):
     pass  # TODO: hard to implement without a running Carla instance
+
+
+class VehicleDegradationTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.subject = Vehicle(
+            receiver=Mock(),
+            client=Mock(),
+            actor_id=2,
+            degradation_curve=DegradationCurve(hold=0.5, decay=1.0, brake=1.0)
+        )
+        self.subject.prepare()
+        self.subject.recv(_datagram(_CONTROLLER_STATE._replace(steer=-0.5, brake=0.2), 1))
+
+        self.received = self.subject._last_controller_state_received
+
+    def _control_at(self, age: float):
+        carla.VehicleControl.reset_mock()
+
+        control, _ = self.subject._get_control_and_transform(self.received + datetime.timedelta(seconds=age))
+        if not carla.VehicleControl.called:  # either nothing or _SAFE_CONTROL
+            return control
+
+        return carla.VehicleControl.call_args[1]
+
+    def test_degradation(self):
+        self.assertEqual(dict(throttle=0.75, brake=0.2, steer=-0.5, hand_brake=False, reverse=False), self._control_at(0.0))
+        self.assertIsNone(self._control_at(0.5))  # held; not sent again
+        self.assertEqual(dict(throttle=0.38, brake=0.2, steer=-0.25, hand_brake=False, reverse=False), self._control_at(1.0))
+        self.assertEqual(dict(throttle=0.0, brake=0.6, steer=0.0, hand_brake=False, reverse=False), self._control_at(2.0))
+        self.assertIs(_SAFE_CONTROL, self._control_at(2.6))
+        self.assertIsNone(self._control_at(3.0))  # stopped; not sent again
+
+        self.subject.recv(_datagram(_CONTROLLER_STATE, 2))
+        self.received = self.subject._last_controller_state_received
+        self.assertEqual(dict(throttle=0.75, brake=0.0, steer=-0.33, hand_brake=False, reverse=False), self._control_at(0.0))
+
+        stats = self.subject.get_stats()
+        self.assertEqual(2, stats.suppressed)
+        self.assertEqual(1, stats.decaying)
+        self.assertEqual(1, stats.braking)
+        self.assertEqual(1, stats.stopped)
+        self.assertEqual(1, stats.recovered)
+
+
+def _datagram(controller_state: ControllerState, sequence: int, epoch: int = 1) -> Datagram:
+    return Datagram(data=serialize_controller_states([controller_state], sequence, epoch), address=('127.0.0.1', 13337))
+
+
+class VehicleSequenceTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.subject = Vehicle(receiver=Mock(), client=Mock(), actor_id=2)
+
+        self.subject.recv(_datagram(_CONTROLLER_STATE._replace(throttle=1.0), 500))
+        self.subject._last_controller_state_received = self.received = datetime.datetime.now() - datetime.timedelta(seconds=1)
+
+    def test_reordered_is_ignored_and_does_not_count_as_alive(self):
+        self.subject.recv(_datagram(_CONTROLLER_STATE._replace(brake=1.0), 499))
+        self.subject.recv(_datagram(_CONTROLLER_STATE._replace(brake=1.0), 1))
+
+        self.assertEqual(1.0, self.subject._controller_state.throttle)
+        self.assertEqual(self.received, self.subject._last_controller_state_received)
+
+        self.subject.recv(_datagram(_CONTROLLER_STATE._replace(throttle=1.0), 500))  # a keepalive of the current stream does
+
+        self.assertGreater(self.subject._last_controller_state_received, self.received)
+
+    def test_client_restarted_within_the_reorder_range(self):
+        self.subject.recv(_datagram(_CONTROLLER_STATE._replace(throttle=0.0, brake=1.0), 1, epoch=2))
+
+        self.assertEqual((0.0, 1.0), (self.subject._controller_state.throttle, self.subject._controller_state.brake))
+        self.assertGreater(self.subject._last_controller_state_received, self.received)
+
+        self.subject.recv(_datagram(_CONTROLLER_STATE._replace(throttle=0.0, brake=0.5), 2, epoch=2))
+
+        self.assertEqual(0.5, self.subject._controller_state.brake)
+
+
+class VehicleApplyOnReceiveTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = Mock()
+        self.actor = self.client.get_world.return_value.get_actor.return_value
+
+        self.subject = Vehicle(receiver=Mock(), client=self.client, actor_id=2, control_rate=1.0, apply_on_receive=True)
+        self.subject.start()
+        time.sleep(0.1)
+
+        self.on_tick = self.client.get_world.return_value.on_tick.call_args[0][0]
+        self.on_tick(Mock(frame=1))
+
+    def tearDown(self) -> None:
+        self.subject.stop()
+
+    def test_applies_immediately_and_coalesces_within_a_tick(self):
+        self.subject.recv(_datagram(_CONTROLLER_STATE, 1))
+        time.sleep(0.1)
+
+        self.assertEqual(1, len(self.actor.apply_control.mock_calls))  # well before control_rate
+
+        self.subject.recv(_datagram(_CONTROLLER_STATE._replace(throttle=0.5), 2))
+        self.subject.recv(_datagram(_CONTROLLER_STATE._replace(throttle=1.0), 3))
+        time.sleep(0.1)
+
+        self.assertEqual(1, len(self.actor.apply_control.mock_calls))  # same tick; waiting for the next one
+
+        self.on_tick(Mock(frame=2))
+        time.sleep(0.1)
+
+        self.assertEqual(2, len(self.actor.apply_control.mock_calls))
+        self.assertEqual(1.0, carla.VehicleControl.call_args[1]['throttle'])
+
+        stats = self.subject.get_stats()
+        self.assertEqual(2, stats.applied)
+        self.assertEqual(1, stats.coalesced)
+        self.assertEqual(2, stats.receive_to_apply_latency.count)
+        self.assertLess(stats.receive_to_apply_latency.min, 0.1)
+
+
+class VehicleManagerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        carla.command.reset_mock()
+
+        self.client = Mock()
+        self.subject = VehicleManager(self.client)
+
+        self.vehicles = [
+            Vehicle(receiver=Mock(), client=self.client, actor_id=actor_id, control_expire=-1.0 if actor_id == 3 else 1.0)
+            for actor_id in [1, 2, 3]
+        ]
+
+        for vehicle in self.vehicles:
+            self.subject.add_vehicle(vehicle)
+
+    def test_work(self):
+        self.subject._work()  # nothing received yet
+        self.client.apply_batch.assert_not_called()
+
+        for vehicle in self.vehicles[1:]:
+            vehicle.recv(_datagram(_CONTROLLER_STATE, 1))
+
+        self.subject._work()
+
+        self.assertEqual(1, len(self.client.apply_batch.mock_calls))
+        self.assertEqual(2, len(self.client.apply_batch.call_args[0][0]))
+        self.assertEqual(
+            [call(2, carla.VehicleControl.return_value), call(3, _SAFE_CONTROL)],  # the 3rd has already expired
+            carla.command.ApplyVehicleControl.call_args_list
+        )
+
+    def test_remove_vehicle(self):
+        self.subject.remove_vehicle(self.vehicles[0])
+
+        self.assertEqual([2, 3], sorted(self.subject._vehicles_by_actor_id.keys()))
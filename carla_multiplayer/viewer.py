@@ -0,0 +1,167 @@
+import struct
+import time
+from queue import Full
+from threading import Lock
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional
+
+from .looper import TimedLooper
+from .scheduler import Scheduler
+from .udp import Sender
+
+_KEEPALIVE_RATE = 1.0 / 2.0  # 2 Hz
+_VIEWER_TIMEOUT = 3.0  # s without hearing from a viewer before its sensor is paused
+_REAP_TIMEOUT = 60.0  # s without hearing from a viewer before its session is removed altogether
+_WATCHDOG_RATE = 1.0 / 2.0  # 2 Hz
+
+# magic, sequence; shares the controller socket, so the magic must not be a ControllerState version (or '{')
+_KEEPALIVE_MAGIC = 0xC9
+_KEEPALIVE_STRUCT = struct.Struct('<BI')
+_SEQUENCE_MODULO = 1 << 32
+
+
+def serialize_viewer_keepalive(sequence: int) -> bytes:
+    return _KEEPALIVE_STRUCT.pack(_KEEPALIVE_MAGIC, sequence % _SEQUENCE_MODULO)
+
+
+def is_viewer_keepalive(data: bytes) -> bool:
+    return len(data) == _KEEPALIVE_STRUCT.size and data[0] == _KEEPALIVE_MAGIC
+
+
+class ViewerKeepaliveSender(TimedLooper):
+    def __init__(self, sender: Sender, host: str, port: int, rate: float = _KEEPALIVE_RATE):
+        super().__init__(
+            period=rate
+        )
+
+        self._sender: Sender = sender
+        self._host: str = host
+        self._port: int = port
+
+        self._sequence: int = 0
+
+    def _work(self):
+        self._sequence += 1
+
+        try:
+            self._sender.send_datagram(serialize_viewer_keepalive(self._sequence), (self._host, self._port))
+        except Full:
+            pass
+
+
+class ViewerStats(NamedTuple):
+    viewers: int
+    paused: int  # viewers currently paused
+    pauses: int
+    resumes: int
+    reaped: int
+
+
+class _Viewer(object):
+    def __init__(self, now: float):
+        self.last_seen: float = now
+        self.uses_keepalives: bool = False  # older clients (and bots) never send them; anything they send counts
+        self.paused: bool = False
+
+
+class ViewerWatchdog(TimedLooper):
+    def __init__(self,
+            timeout: float = _VIEWER_TIMEOUT,
+            reap_timeout: Optional[float] = _REAP_TIMEOUT,
+            on_pause: Optional[Callable[[Hashable], None]] = None,
+            on_resume: Optional[Callable[[Hashable], None]] = None,
+            on_reap: Optional[Callable[[Hashable], None]] = None,
+            rate: float = _WATCHDOG_RATE,
+            clock: Callable[[], float] = time.monotonic,
+            scheduler: Optional[Scheduler] = None):
+        super().__init__(
+            period=rate,
+            scheduler=scheduler
+        )
+
+        self._timeout: float = timeout
+        self._reap_timeout: Optional[float] = reap_timeout  # None to never reap
+        self._on_pause: Optional[Callable[[Hashable], None]] = on_pause
+        self._on_resume: Optional[Callable[[Hashable], None]] = on_resume
+        self._on_reap: Optional[Callable[[Hashable], None]] = on_reap
+        self._clock: Callable[[], float] = clock
+
+        self._lock: Lock = Lock()
+        self._viewers: Dict[Hashable, _Viewer] = {}
+        self._pauses: int = 0
+        self._resumes: int = 0
+        self._reaped: int = 0
+
+    def add(self, key: Hashable):
+        with self._lock:
+            self._viewers[key] = _Viewer(self._clock())
+
+    def remove(self, key: Hashable):
+        with self._lock:
+            self._viewers.pop(key, None)
+
+    def is_paused(self, key: Hashable) -> bool:
+        with self._lock:
+            viewer = self._viewers.get(key)
+
+            return viewer is not None and viewer.paused
+
+    def seen(self, key: Hashable, keepalive: bool = False):
+        with self._lock:
+            viewer = self._viewers.get(key)
+            if viewer is None:
+                return
+
+            if keepalive:
+                viewer.uses_keepalives = True
+            elif viewer.uses_keepalives:  # controls alone don't mean anyone is watching
+                return
+
+            viewer.last_seen = self._clock()
+
+            resume = viewer.paused
+            if resume:
+                viewer.paused = False
+                self._resumes += 1
+
+        # straight away rather than on the next check, so a returning viewer isn't kept waiting
+        if resume and self._on_resume is not None:
+            self._on_resume(key)
+
+    def get_stats(self) -> ViewerStats:
+        with self._lock:
+            return ViewerStats(
+                viewers=len(self._viewers),
+                paused=len([x for x in self._viewers.values() if x.paused]),
+                pauses=self._pauses,
+                resumes=self._resumes,
+                reaped=self._reaped,
+            )
+
+    def check(self):
+        now = self._clock()
+
+        pause: List[Hashable] = []
+        reap: List[Hashable] = []
+        with self._lock:
+            for key, viewer in list(self._viewers.items()):
+                idle = now - viewer.last_seen
+
+                if self._reap_timeout is not None and idle > self._reap_timeout:
+                    self._viewers.pop(key)
+                    self._reaped += 1
+                    reap += [key]
+                elif not viewer.paused and idle > self._timeout:
+                    viewer.paused = True
+                    self._pauses += 1
+                    pause += [key]
+
+        if self._on_pause is not None:
+            for key in pause:
+                self._on_pause(key)
+
+        if self._on_reap is not None:
+            for key in reap:
+                self._on_reap(key)
+
+    def _work(self):
+        self.check()
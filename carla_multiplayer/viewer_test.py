@@ -0,0 +1,89 @@
+import unittest
+
+from mock import Mock, call
+
+from .controller import ControllerState, serialize_controller_state, serialize_controller_states
+from .viewer import ViewerKeepaliveSender, ViewerWatchdog, is_viewer_keepalive, serialize_viewer_keepalive
+
+_CONTROLLER_STATE = ControllerState(throttle=1.0, brake=0.0, steer=0.0, hand_brake=False, reverse=False, reset=False)
+
+
+class ViewerKeepaliveTest(unittest.TestCase):
+    def test_is_viewer_keepalive(self):
+        self.assertTrue(is_viewer_keepalive(serialize_viewer_keepalive(1)))
+        self.assertTrue(is_viewer_keepalive(serialize_viewer_keepalive(1 << 32)))  # wraps
+        self.assertFalse(is_viewer_keepalive(serialize_controller_state(_CONTROLLER_STATE)))
+        self.assertFalse(is_viewer_keepalive(serialize_controller_state(_CONTROLLER_STATE, use_json=True)))
+        self.assertFalse(is_viewer_keepalive(serialize_controller_states([_CONTROLLER_STATE], 1)))
+        self.assertFalse(is_viewer_keepalive(b''))
+
+    def test_sender(self):
+        sender = Mock()
+        subject = ViewerKeepaliveSender(sender, '127.0.0.1', 13337)
+
+        subject._work()
+        subject._work()
+
+        self.assertEqual(
+            [call(serialize_viewer_keepalive(1), ('127.0.0.1', 13337)), call(serialize_viewer_keepalive(2), ('127.0.0.1', 13337))],
+            sender.send_datagram.call_args_list
+        )
+
+
+class ViewerWatchdogTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.on_pause, self.on_resume, self.on_reap = Mock(), Mock(), Mock()
+
+        self.subject = ViewerWatchdog(
+            timeout=3.0,
+            reap_timeout=60.0,
+            on_pause=self.on_pause,
+            on_resume=self.on_resume,
+            on_reap=self.on_reap,
+            clock=lambda: self.now
+        )
+        self.subject.add('a')
+        self.subject.add('b')
+
+    def test_pause_resume_and_reap(self):
+        self.now = 2.0
+        self.subject.seen('a', keepalive=True)
+
+        self.now = 4.0
+        self.subject.check()
+
+        self.on_pause.assert_called_once_with('b')
+        self.assertTrue(self.subject.is_paused('b'))
+        self.assertFalse(self.subject.is_paused('a'))
+
+        self.subject.seen('b')  # straight back
+
+        self.on_resume.assert_called_once_with('b')
+        self.assertFalse(self.subject.is_paused('b'))
+
+        self.now = 10.0
+        self.subject.seen('a')  # controls only; 'a' has shown it sends keepalives, so this doesn't count
+        self.subject.check()
+
+        self.assertEqual([call('b'), call('a'), call('b')], self.on_pause.call_args_list)
+
+        self.now = 70.0
+        self.subject.check()
+
+        self.assertEqual([call('a'), call('b')], sorted(self.on_reap.call_args_list))
+        self.assertEqual((0, 0, 3, 1, 2), tuple(self.subject.get_stats()))
+
+        self.subject.seen('a', keepalive=True)  # too late; ignored
+
+        self.assertEqual(1, self.on_resume.call_count)
+
+    def test_never_reap(self):
+        self.subject._reap_timeout = None
+        self.subject.remove('b')
+
+        self.now = 1000.0
+        self.subject.check()
+
+        self.on_pause.assert_called_once_with('a')
+        self.on_reap.assert_not_called()